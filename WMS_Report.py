@@ -1,10 +1,31 @@
 import streamlit as st
-import streamlit.components.v1 as components
 import pandas as pd
 from datetime import timedelta
-import requests
+from html import escape
 import io
-import pyarrow.parquet as pq
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from wms_engine import (
+    read_store_dates, format_timedelta,
+    add_weight_columns, build_daily_rollups, query_rollups, slice_cube, summarize_property, summarize_properties, summarize_store_file,
+    build_property_metrics
+)
+import wms_api
+from wms_analytics import (
+    ACTIVITY_METRICS, CYCLE_QUANTILES, ITEM_METRICS, LEADERBOARD_METRICS, build_activity_cube, build_cycle_sketches,
+    build_item_aggregates, merge_worker_reports, query_activity, query_cycle_quantiles, query_top_items, rank_slice
+)
+import wms_duckdb
+import wms_sources
+from wms_live import LiveMonitor
+from wms_memory import MemoryBudget
+from wms_shifts import calendars_from_settings
+from wms_streaming import stream_daily_rollups, stream_property_summaries
+
+# DuckDB is optional; without it only the pandas and streaming engines are offered
+QUERY_ENGINES = ["pandas", "Streaming"] + (["DuckDB"] if wms_duckdb.is_available() else [])
 
 st.set_page_config(page_title="WMS Performance Report (Internal Transfers)", layout="wide")
 
@@ -32,50 +53,165 @@ st.title("📦 WMS Performance Report (Internal Transfers)")
 
 
 
+@st.cache_resource
+def get_store_source():
+    """Store files come from a local folder when `data_folder` is set, otherwise from GitHub"""
+    return wms_sources.source_from_settings(st.secrets)
+
 @st.cache_data(ttl=60)
 def get_files_list():
-    """Get list of Parquet files from GitHub"""
-    headers = {"Authorization": f"token {st.secrets['github_token']}"}
-    url = f"https://api.github.com/repos/{st.secrets['github_repo']}/contents/{st.secrets['github_folder']}"
-    
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-        raise Exception(f"Failed to list files: {response.json().get('message', 'Unknown error')}")
-    
-    files = [f for f in response.json() if f['name'].endswith('.parquet')]
-    if not files:
-        raise Exception("No Parquet files found in the folder")
-    return files
+    """Get list of Parquet files (normalized pairs listed once per store)"""
+    return get_store_source().list_files()
+
+def get_file_entry(file_id):
+    """Listing entry of a store file"""
+    return next(f for f in get_files_list() if f['download_url'] == file_id)
+
+def get_actions_url(file_id):
+    """Actions-table URL of a normalized store, None for single-file stores"""
+    return get_file_entry(file_id).get('actions_url')
+
+@st.cache_resource
+def get_shift_calendars():
+    """Per-store shift calendars from the `shifts` secrets table; other stores use calendar days"""
+    return calendars_from_settings(st.secrets)
+
+def get_store_calendar(file_id):
+    """Shift calendar of a store file, None when its days are calendar days"""
+    return get_shift_calendars().get(get_file_entry(file_id)['name'].replace('.parquet', ''))
+
+def get_day_cutoffs():
+    """Store name -> operational day cutoff, which bounds the finish times counted past midnight"""
+    return {store: calendar.day_cutoff for store, calendar in get_shift_calendars().items()}
+
+def get_day_cutoff(file_id):
+    """Operational day cutoff of a store file, None when its days are calendar days"""
+    return get_day_cutoffs().get(get_file_entry(file_id)['name'].replace('.parquet', ''))
 
 @st.cache_data(ttl=300)
 def download_file_bytes(download_url):
-    """Download file from GitHub and cache the raw bytes"""
-    headers = {"Authorization": f"token {st.secrets['github_token']}"}
-    response = requests.get(download_url, headers=headers)
-    if response.status_code != 200:
-        raise Exception(f"Failed to download file: {response.status_code}")
-    return response.content
+    """Download file from the store source and cache the raw bytes"""
+    return get_store_source().fetch(download_url)
 
 @st.cache_data(ttl=300)
 def get_dates_for_store(file_id):
     """Get unique dates from a file - only parses Date column (fast)"""
-    file_bytes = download_file_bytes(file_id)
-    df = pd.read_parquet(io.BytesIO(file_bytes), columns=['Date'])
-    df['Date'] = pd.to_datetime(df['Date']).dt.date
-    return sorted(df['Date'].unique())
+    # Normalized stores keep the dates in the much smaller actions table
+    file_bytes = download_file_bytes(get_actions_url(file_id) or file_id)
+    return read_store_dates(io.BytesIO(file_bytes), get_store_calendar(file_id))
+
+@st.cache_data(ttl=300)
+def store_digest(file_id):
+    """Content hash of a store's file(s), naming its on-disk copies"""
+    return wms_sources.store_digest(download_file_bytes, get_file_entry(file_id))
 
-def get_filtered_data(file_id, selected_dates):
-    """Load data filtered to selected dates only - uses cached file bytes"""
+def get_store_tables(file_id, selected_dates=None, quarantine=False):
+    """Line items (optionally filtered to the selected dates) and their unique actions,
+    through the per-date Arrow IPC cache shared with other processes"""
+    return wms_sources.load_store_tables(download_file_bytes, get_file_entry(file_id), selected_dates, store_digest(file_id),
+                                         quarantine, get_store_calendar(file_id))
+
+@st.cache_data(ttl=300)
+def get_validation_summary(file_id):
+    """Per-date data-quality counts of a store, computed when it was decoded"""
+    return wms_sources.load_validation_summary(download_file_bytes, get_file_entry(file_id), store_digest(file_id),
+                                               get_store_calendar(file_id))
+
+@st.cache_data(ttl=300)
+def get_store_rollups(file_id, engine="pandas", quarantine=False):
+    """Prefix-sum rollups of a whole store file, built once per file version"""
+    if engine == "DuckDB":
+        # SQL over the staged file; the store is never decoded into pandas
+        return wms_duckdb.query_daily_rollups(stage_store_file(file_id, quarantine), get_day_cutoff(file_id))
+    if engine == "Streaming":
+        # Record batches folded into partial aggregates; memory follows the batch size
+        return stream_daily_rollups(stage_store_file(file_id, quarantine), get_day_cutoff(file_id))
+    df, actions = get_store_tables(file_id, quarantine=quarantine)
+    add_weight_columns(df)
+    return build_daily_rollups(df, actions, get_day_cutoff(file_id))
+
+@st.cache_data(ttl=300)
+def get_store_activity(file_id, bucket_minutes, quarantine=False):
+    """Time-of-day activity cube of a whole store file, built once per file version and bucket size"""
+    df, actions = get_store_tables(file_id, quarantine=quarantine)
+    add_weight_columns(df)
+    return build_activity_cube(df, actions, bucket_minutes)
+
+@st.cache_data(ttl=300)
+def get_store_cycle_sketches(file_id, quarantine=False):
+    """Per-day order cycle-time sketches of a whole store file, built once per file version"""
+    return build_cycle_sketches(*get_store_tables(file_id, quarantine=quarantine))
+
+@st.cache_data(ttl=300)
+def get_store_items(file_id, quarantine=False):
+    """Per-day item aggregates of a whole store file, built once per file version"""
+    df, _ = get_store_tables(file_id, quarantine=quarantine)
+    add_weight_columns(df)
+    return build_item_aggregates(df)
+
+@st.cache_data(ttl=300)
+def stage_store_file(file_id, quarantine=False):
+    """Write cached file bytes to local disk so worker processes can memory-map them"""
     file_bytes = download_file_bytes(file_id)
-    df = pd.read_parquet(io.BytesIO(file_bytes))
-    df['Date'] = pd.to_datetime(df['Date']).dt.date
-    df['Action start'] = pd.to_datetime(df['Action start'])
-    df['Action completion'] = pd.to_datetime(df['Action completion'])
-    if isinstance(selected_dates, list):
-        df = df[df['Date'].isin(selected_dates)]
+    actions_url = get_actions_url(file_id)
+    calendar = get_store_calendar(file_id)
+    calendar_key = f"-{calendar.key}" if calendar is not None and calendar.key else ""
+    store_dir = wms_sources.store_cache_dir("staged", get_file_entry(file_id))
+    path = os.path.join(store_dir, store_digest(file_id) + calendar_key + (".valid" if quarantine else "") + ".parquet")
+    if os.path.exists(path):
+        # The file's time marks its last use, which decides what pruning keeps
+        os.utime(path)
     else:
-        df = df[df['Date'] == selected_dates]
-    return df
+        os.makedirs(store_dir, exist_ok=True)
+        tmp_path = path + ".tmp"
+        if quarantine or calendar_key:
+            # Only the lines passing every data-quality rule, and/or dated by operational day
+            get_store_tables(file_id, quarantine=quarantine)[0].to_parquet(tmp_path, index=False)
+        elif actions_url is not None:
+            # File-based engines read the single-file layout, so normalized stores are staged joined
+            wms_sources.decode_store_tables(download_file_bytes, get_file_entry(file_id))[0].to_parquet(tmp_path, index=False)
+        else:
+            with open(tmp_path, "wb") as f:
+                f.write(file_bytes)
+        os.replace(tmp_path, path)
+        # Older versions of the store's staged files go once a new one is written
+        wms_sources.prune_store_cache(store_dir)
+    return path
+
+@st.cache_resource
+def get_process_pool():
+    """One process pool per server, shared by all sessions"""
+    return ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context("spawn"))
+
+@st.cache_resource
+def get_loader_pool():
+    """Background threads for progressive loading, shared by all sessions"""
+    return ThreadPoolExecutor(max_workers=8)
+
+@st.cache_resource(max_entries=16)
+def get_live_monitor(file_id, day):
+    """Incremental state of today's report for one store, shared by every session watching it"""
+    return LiveMonitor(get_store_source(), get_file_entry(file_id), day, calendar=get_store_calendar(file_id))
+
+@st.cache_resource
+def get_memory_budget():
+    """Limits on the frames sessions keep between reruns (`session_memory_mb` / `process_memory_mb` secrets)"""
+    return MemoryBudget(int(st.secrets.get("session_memory_mb", 256)) * 2**20, int(st.secrets.get("process_memory_mb", 1024)) * 2**20)
+
+def hold_session_frames(name, values):
+    """Keep `values` for this session under the memory budget; cold frames may be spilled to disk"""
+    return get_memory_budget().hold(get_script_run_ctx().session_id, name, values)
+
+@st.cache_resource
+def start_api_server(host, port):
+    """Serve the JSON/Arrow report API from this process, sharing the page's caches"""
+    service = wms_api.ReportService(get_files_list, get_store_tables, get_store_rollups, get_day_cutoffs())
+    return wms_api.serve_in_background(service, host, port)
+
+def load_store_summary(file_id, selected_dates, quarantine=False):
+    """Background task: download (cached), decode and summarize one store"""
+    df, actions = get_store_tables(file_id, selected_dates, quarantine)
+    return summarize_property(df, len(selected_dates), actions, get_day_cutoff(file_id))
 
 @st.cache_data(ttl=60)
 def load_data(file_id):
@@ -84,42 +220,35 @@ def load_data(file_id):
     df = pd.read_parquet(io.BytesIO(file_bytes))
     return df
 
-# Helper functions
-def calc_kg(row):
-    if str(row['Unit']).upper() == 'KILOGRAM':
-        return row['Quantity']
-    elif pd.notna(row['Reporting Unit']) and str(row['Reporting Unit']).upper() == 'KILOGRAM':
-        return row['Quantity'] * row['Relationship']
-    return 0
-
-def calc_l(row):
-    if str(row['Unit']).upper() == 'LITER':
-        return row['Quantity']
-    elif pd.notna(row['Reporting Unit']) and str(row['Reporting Unit']).upper() == 'LITER':
-        return row['Quantity'] * row['Relationship']
-    return 0
-
-def format_timedelta(td):
-    total_seconds = int(td.total_seconds())
-    hours = total_seconds // 3600
-    minutes = (total_seconds % 3600) // 60
-    seconds = total_seconds % 60
-    return f"{hours}:{minutes:02d}:{seconds:02d}"
-
-def calculate_total_time_no_overlap(actions_df):
-    if actions_df.empty:
-        return timedelta(0)
-    sorted_actions = actions_df.sort_values('Action start').reset_index(drop=True)
-    total_time = timedelta(0)
-    cumulative_end = sorted_actions.iloc[0]['Action start']
-    for _, row in sorted_actions.iterrows():
-        start = row['Action start']
-        end = row['Action completion']
-        effective_start = max(start, cumulative_end)
-        if end > effective_start:
-            total_time += end - effective_start
-        cumulative_end = max(cumulative_end, end)
-    return total_time
+# Table styles for every report, sent once per page instead of inside each table's HTML.
+# Comparison tables use roomier progress cells, scoped under .comparison-table.
+REPORT_CSS = '''
+<style>
+    .wms-table { border-collapse: collapse; width: auto; font-family: Arial, sans-serif; font-size: 14px; }
+    .wms-table th { background-color: #4472C4; color: white; padding: 10px; text-align: center; border: 1px solid #2F5496; }
+    .wms-table td { padding: 8px; border: 1px solid #B4C6E7; text-align: center; color: black; }
+    .wms-table tr:nth-child(odd) { background-color: #D6DCE4; }
+    .wms-table tr:nth-child(even) { background-color: #EDEDED; }
+    .dept-name, .picker-name { font-weight: bold; text-align: left !important; color: black; }
+    .progress-cell { position: relative; padding: 0 !important; }
+    .progress-bar { height: 100%; position: absolute; left: 0; top: 0; }
+    .progress-text { position: relative; z-index: 1; padding: 8px; color: black; }
+    .stats-table { border-collapse: collapse; margin-top: 30px; font-family: Arial, sans-serif; }
+    .stats-table th { background-color: #4472C4; color: white; padding: 10px; border: 1px solid #2F5496; }
+    .stats-table td { padding: 10px; border: 1px solid #B4C6E7; background-color: #D6DCE4; text-align: center; color: black; }
+    .stats-title { font-size: 18px; text-decoration: underline; margin-bottom: 10px; color: black; }
+    .comparison-title { font-size: 18px; font-weight: bold; margin-bottom: 15px; color: #2F5496; }
+    .comparison-table { border-collapse: collapse; width: auto; font-family: Arial, sans-serif; font-size: 14px; }
+    .comparison-table th { background-color: #4472C4; color: white; padding: 12px 20px; text-align: center; border: 1px solid #2F5496; }
+    .comparison-table td { padding: 0; border: 1px solid #B4C6E7; text-align: center; color: black; height: 40px; }
+    .comparison-table tr:nth-child(odd) td { background-color: #EDEDED; }
+    .comparison-table tr:nth-child(even) td { background-color: #D6DCE4; }
+    .property-name { font-weight: bold; text-align: left !important; padding: 10px 15px !important; }
+    .comparison-table .progress-cell { width: 140px; }
+    .comparison-table .progress-text { padding: 10px; }
+    .heatmap-table td, .heatmap-table th { padding: 6px 8px; min-width: 44px; }
+</style>
+'''
 
 def get_avg_color(val):
     val = max(0, min(15, val))
@@ -135,14 +264,540 @@ def get_avg_color(val):
         b = int(100 + (144 - 100) * ratio)
     return f'#{r:02X}{g:02X}{b:02X}'
 
+@st.cache_data(max_entries=64)
+def render_comparison_table(comparison_type, date_display, headers, property_metrics, is_average_mode):
+    """HTML for the comparison table, rows in the given order"""
+    picking_time_header, picking_finish_header, orders_header, requests_header, weight_header = headers
+
+    # Calculate max values for bar percentages
+    max_time = max((m['picking_time'].total_seconds() for m in property_metrics), default=1) or 1
+    max_orders = max((m['orders'] for m in property_metrics), default=1) or 1
+    max_requests = max((m['requests'] for m in property_metrics), default=1) or 1
+    max_weight = max((m['weight'] for m in property_metrics), default=1) or 1
+
+    # Build rows
+    row_colors = ['#6B9AC4', '#97B8D6'] if comparison_type == "Property vs Property" else ['#6B9AC4']
+    rows = []
+    for i, m in enumerate(property_metrics):
+        color = row_colors[i % len(row_colors)]
+        pct_time = (m['picking_time'].total_seconds() / max_time) * 100
+        pct_orders = (m['orders'] / max_orders) * 100
+        pct_requests = (m['requests'] / max_requests) * 100
+        pct_weight = (m['weight'] / max_weight) * 100
+        time_str = format_timedelta(m['picking_time'])
+        finish_str = m['picking_finish'].strftime("%I:%M:%S %p") if pd.notna(m['picking_finish']) else "N/A"
+
+        # Format numbers based on mode
+        orders_str = f"{m['orders']:,.1f}" if is_average_mode else f"{int(m['orders']):,}"
+        requests_str = f"{m['requests']:,.1f}" if is_average_mode else f"{int(m['requests']):,}"
+
+        rows.append(f'''<tr>
+            <td class="property-name">{m['name']}</td>
+            <td class="progress-cell"><div class="progress-bar" style="width: {pct_time}%; background-color: {color};"></div><div class="progress-text">{time_str}</div></td>
+            <td style="padding: 10px;">{finish_str}</td>
+            <td class="progress-cell"><div class="progress-bar" style="width: {pct_orders}%; background-color: {color};"></div><div class="progress-text">{orders_str}</div></td>
+            <td class="progress-cell"><div class="progress-bar" style="width: {pct_requests}%; background-color: {color};"></div><div class="progress-text">{requests_str}</div></td>
+            <td class="progress-cell"><div class="progress-bar" style="width: {pct_weight}%; background-color: {color};"></div><div class="progress-text">{m['weight']:,.2f}</div></td>
+        </tr>''')
+
+    html = '''
+    <div class="comparison-title">''' + comparison_type + ''' Comparison - ''' + date_display + '''</div>
+    <table class="comparison-table">
+        <tr>
+            <th style="width: 140px;">Property</th>
+            <th style="width: 170px;">''' + picking_time_header + '''</th>
+            <th style="width: 140px;">''' + picking_finish_header + '''</th>
+            <th style="width: 140px;">''' + orders_header + '''</th>
+            <th style="width: 140px;">''' + requests_header + '''</th>
+            <th style="width: 140px;">''' + weight_header + '''</th>
+        </tr>''' + ''.join(rows) + '''
+    </table>
+    '''
+    return html
+
+@st.cache_data(max_entries=64)
+def render_department_report(dept_report, headers, is_average_mode, num_days, total_picking_time_no_overlap):
+    """HTML for the department table and totals, rows in the given order.
+
+    Cached on the sorted frame (so on sort column and direction) plus mode.
+    """
+    orders_header, requests_header, kg_header, liters_header, weight_header, time_header = headers
+    max_orders = dept_report['display_orders'].max()
+    max_requests = dept_report['display_requests'].max()
+    max_kg = dept_report['display_kg'].max()
+    max_l = dept_report['display_liters'].max()
+    max_weight = dept_report['display_weight'].max()
+    max_time = dept_report['display_picking_time'].max().total_seconds()
+
+    html = ''
+
+    headers = [
+        ('Cost Center', '280px'),
+        (orders_header, '110px'),
+        (requests_header, '180px'),
+        (kg_header, '120px'),
+        (liters_header, '120px'),
+        (weight_header, '120px'),
+        (time_header, '150px')
+    ]
+
+    html += '<table class="wms-table">'
+    html += '<tr>'
+    for h, w in headers:
+        html += f'<th style="width: {w};">{h}</th>'
+    html += '</tr>'
+
+    for _, row in dept_report.iterrows():
+        html += '<tr>'
+
+        html += f'<td class="dept-name">{row["Cost Center"]}</td>'
+
+        # Format values based on mode
+        orders_str = f"{row['display_orders']:.1f}" if is_average_mode else f"{int(row['display_orders'])}"
+        requests_str = f"{row['display_requests']:.1f}" if is_average_mode else f"{int(row['display_requests'])}"
+
+        pct = (row['display_orders'] / max_orders * 100) if max_orders > 0 else 0
+        html += f'''<td class="progress-cell">
+            <div class="progress-bar" style="width: {pct}%; background-color: #5B9BD5;"></div>
+            <div class="progress-text">{orders_str}</div>
+        </td>'''
+
+        pct = (row['display_requests'] / max_requests * 100) if max_requests > 0 else 0
+        html += f'''<td class="progress-cell">
+            <div class="progress-bar" style="width: {pct}%; background-color: #5B9BD5;"></div>
+            <div class="progress-text">{requests_str}</div>
+        </td>'''
+
+        pct = (row['display_kg'] / max_kg * 100) if max_kg > 0 else 0
+        kg_formatted = f"{row['display_kg']:,.2f}"
+        html += f'''<td class="progress-cell">
+            <div class="progress-bar" style="width: {pct}%; background-color: #FFC000;"></div>
+            <div class="progress-text">{kg_formatted}</div>
+        </td>'''
+
+        pct = (row['display_liters'] / max_l * 100) if max_l > 0 else 0
+        liters_formatted = f"{row['display_liters']:,.2f}"
+        html += f'''<td class="progress-cell">
+            <div class="progress-bar" style="width: {pct}%; background-color: #70AD47;"></div>
+            <div class="progress-text">{liters_formatted}</div>
+        </td>'''
+
+        pct = (row['display_weight'] / max_weight * 100) if max_weight > 0 else 0
+        weight_formatted = f"{row['display_weight']:,.2f}"
+        html += f'''<td class="progress-cell">
+            <div class="progress-bar" style="width: {pct}%; background-color: #9B59B6;"></div>
+            <div class="progress-text">{weight_formatted}</div>
+        </td>'''
+
+        pct = (row['display_picking_time'].total_seconds() / max_time * 100) if max_time > 0 else 0
+        html += f'''<td class="progress-cell">
+            <div class="progress-bar" style="width: {pct}%; background-color: #C65B5B;"></div>
+            <div class="progress-text">{row["Total Picking Time"]}</div>
+        </td>'''
+
+        html += '</tr>'
+
+    html += '</table>'
+
+    # Calculate summary totals
+    total_orders_sum = dept_report['# of Orders'].sum()
+    total_requests_sum = dept_report['Item Requests'].sum()
+    total_weight_sum = dept_report['Total Weight'].sum()
+    total_picking_time = dept_report['picking_time'].sum()
+
+    # Apply average mode if selected
+    if is_average_mode:
+        display_orders_total = total_orders_sum / num_days
+        display_requests_total = total_requests_sum / num_days
+        display_weight_total = total_weight_sum / num_days
+        display_picking_time_total = total_picking_time / num_days
+        display_real_picking_time_total = total_picking_time_no_overlap / num_days
+        total_picking_time_str = format_timedelta(display_picking_time_total)
+        real_picking_time_str = format_timedelta(display_real_picking_time_total)
+        orders_header_summary = 'Avg Orders'
+        requests_header_summary = 'Avg Requests'
+        weight_header_summary = 'Avg Weight'
+        time_header_summary = 'Avg Picking Time'
+        real_time_header_summary = 'Real Avg Picking Time'
+    else:
+        display_orders_total = total_orders_sum
+        display_requests_total = total_requests_sum
+        display_weight_total = total_weight_sum
+        total_picking_time_str = format_timedelta(total_picking_time)
+        real_picking_time_str = format_timedelta(total_picking_time_no_overlap)
+        orders_header_summary = 'Total Orders'
+        requests_header_summary = 'Total Requests'
+        weight_header_summary = 'Total Weight'
+        time_header_summary = 'Total Picking Time'
+        real_time_header_summary = 'Real Total Picking Time'
+
+    # Format display values
+    orders_total_str = f"{display_orders_total:,.1f}" if is_average_mode else f"{int(display_orders_total):,}"
+    requests_total_str = f"{display_requests_total:,.1f}" if is_average_mode else f"{int(display_requests_total):,}"
+
+    html += f'''
+    <table class="stats-table" style="margin-top: 15px;">
+        <tr>
+            <th>{orders_header_summary}</th>
+            <th>{requests_header_summary}</th>
+            <th>{weight_header_summary}</th>
+            <th>{time_header_summary}</th>
+            <th>{real_time_header_summary}</th>
+        </tr>
+        <tr>
+            <td>{orders_total_str}</td>
+            <td>{requests_total_str}</td>
+            <td>{display_weight_total:,.2f}</td>
+            <td>{total_picking_time_str}</td>
+            <td>{real_picking_time_str}</td>
+        </tr>
+    </table>
+    '''
+    return html
+
+@st.cache_data(max_entries=64)
+def render_worker_report(report, headers, is_average_mode, num_days, total_picking_time_no_overlap, finish_seconds):
+    """HTML for the picker table and totals, rows in the given order.
+
+    Cached on the sorted frame (so on sort column and direction) plus mode.
+    """
+    picking_time_header, requests_header, kg_header, liters_header, weight_header = headers
+    max_time = report['display_picking_time'].max().total_seconds()
+    max_requests = report['display_requests'].max()
+    max_kg = report['display_kg'].max()
+    max_l = report['display_liters'].max()
+    max_weight = report['display_weight'].max()
+
+    html = ''
+
+    headers = [
+        ('Picker', '180px'),
+        (picking_time_header, '130px'),
+        (requests_header, '120px'),
+        ('Requests per minute', '150px'),
+        (kg_header, '100px'),
+        (liters_header, '100px'),
+        (weight_header, '110px'),
+        ('Weight per min', '110px')
+    ]
+
+    html += '<table class="wms-table">'
+    html += '<tr>'
+    for h, w in headers:
+        html += f'<th style="width: {w};">{h}</th>'
+    html += '</tr>'
+
+    for _, row in report.iterrows():
+        html += '<tr>'
+        html += f'<td class="picker-name">{row["Name"]}</td>'
+
+        # Format values based on mode
+        requests_str = f"{row['display_requests']:.1f}" if is_average_mode else f"{int(row['display_requests'])}"
+
+        pct = (row['display_picking_time'].total_seconds() / max_time * 100) if max_time > 0 else 0
+        html += f'''<td class="progress-cell">
+            <div class="progress-bar" style="width: {pct}%; background-color: #C65B5B;"></div>
+            <div class="progress-text">{row["Picking Time Display"]}</div>
+        </td>'''
+
+        pct = (row['display_requests'] / max_requests * 100) if max_requests > 0 else 0
+        html += f'''<td class="progress-cell">
+            <div class="progress-bar" style="width: {pct}%; background-color: #5B9BD5;"></div>
+            <div class="progress-text">{requests_str}</div>
+        </td>'''
+
+        html += f'<td>{row["Requests per minute"]:.2f}</td>'
+
+        pct = (row['display_kg'] / max_kg * 100) if max_kg > 0 else 0
+        kg_formatted = f"{row['display_kg']:,.2f}"
+        html += f'''<td class="progress-cell">
+            <div class="progress-bar" style="width: {pct}%; background-color: #FFC000;"></div>
+            <div class="progress-text">{kg_formatted}</div>
+        </td>'''
+
+        pct = (row['display_liters'] / max_l * 100) if max_l > 0 else 0
+        liters_formatted = f"{row['display_liters']:,.2f}"
+        html += f'''<td class="progress-cell">
+            <div class="progress-bar" style="width: {pct}%; background-color: #70AD47;"></div>
+            <div class="progress-text">{liters_formatted}</div>
+        </td>'''
+
+        pct = (row['display_weight'] / max_weight * 100) if max_weight > 0 else 0
+        weight_formatted = f"{row['display_weight']:,.2f}"
+        html += f'''<td class="progress-cell">
+            <div class="progress-bar" style="width: {pct}%; background-color: #9B59B6;"></div>
+            <div class="progress-text">{weight_formatted}</div>
+        </td>'''
+
+        color = get_avg_color(row['Weight per min'])
+        html += f'<td style="background-color: {color}; font-weight: bold;">{row["Weight per min"]:,.2f}</td>'
+
+        html += '</tr>'
+
+    html += '</table>'
+
+    # Statistics section
+    total_picking_time = total_picking_time_no_overlap
+    total_requests_sum = report['Requests fulfilled'].sum()
+    total_minutes = total_picking_time.total_seconds() / 60
+    avg_requests_min = total_requests_sum / total_minutes if total_minutes > 0 else 0
+    total_kg = report['Kilograms'].sum()
+    total_l = report['Liters'].sum()
+    total_weight_sum = total_kg + total_l
+    weight_per_min = total_weight_sum / total_minutes if total_minutes > 0 else 0
+
+    # For date ranges with average mode, show average values
+    if is_average_mode:
+        display_picking_time_total = total_picking_time / num_days
+        total_picking_time_str = format_timedelta(display_picking_time_total)
+        display_requests_total = total_requests_sum / num_days
+        display_kg_total = total_kg / num_days
+        display_l_total = total_l / num_days
+        display_weight_total = total_weight_sum / num_days
+    else:
+        total_picking_time_str = format_timedelta(total_picking_time)
+        display_requests_total = total_requests_sum
+        display_kg_total = total_kg
+        display_l_total = total_l
+        display_weight_total = total_weight_sum
+
+    # Calculate picking finish time (always average for date ranges)
+    avg_seconds = finish_seconds
+    if avg_seconds is None:
+        picking_finish_str = ""
+        picking_finish_summary_header = 'Avg Picking Finish' if num_days > 1 else 'Picking Finish'
+    elif num_days > 1:
+        # Finishes past midnight count beyond 24 h; show them on the clock
+        avg_hours = int(avg_seconds // 3600) % 24
+        avg_minutes_finish = int((avg_seconds % 3600) // 60)
+        avg_secs = int(avg_seconds % 60)
+        if avg_hours < 12:
+            picking_finish_str = f"{avg_hours:02d}:{avg_minutes_finish:02d}:{avg_secs:02d} AM"
+        else:
+            h = avg_hours if avg_hours <= 12 else avg_hours - 12
+            picking_finish_str = f"{h:02d}:{avg_minutes_finish:02d}:{avg_secs:02d} PM"
+        picking_finish_summary_header = 'Avg Picking Finish'
+    else:
+        picking_finish = pd.Timestamp("2000-01-01") + pd.to_timedelta(avg_seconds, unit='s')
+        picking_finish_str = picking_finish.strftime("%I:%M:%S %p")
+        picking_finish_summary_header = 'Picking Finish'
+
+    # Dynamic summary headers
+    if is_average_mode:
+        picking_time_summary_header = 'Avg Picking Time'
+        requests_summary_header = 'Avg Requests'
+        kg_summary_header = 'Avg Kg'
+        l_summary_header = 'Avg L'
+        weight_summary_header = 'Avg Weight'
+    else:
+        picking_time_summary_header = 'Total Picking Time'
+        requests_summary_header = 'Total Requests'
+        kg_summary_header = 'Total Kg'
+        l_summary_header = 'Total L'
+        weight_summary_header = 'Total Weight'
+
+    # Format request display
+    requests_total_str = f"{display_requests_total:.1f}" if is_average_mode else f"{int(display_requests_total)}"
+
+    html += f'''
+    <table class="stats-table" style="margin-top: 15px;">
+        <tr>
+            <th>{picking_time_summary_header}</th>
+            <th>{picking_finish_summary_header}</th>
+            <th>{requests_summary_header}</th>
+            <th>Avg Requests/min</th>
+            <th>{kg_summary_header}</th>
+            <th>{l_summary_header}</th>
+            <th>{weight_summary_header}</th>
+            <th>Weight/min</th>
+        </tr>
+        <tr>
+            <td>{total_picking_time_str}</td>
+            <td>{picking_finish_str}</td>
+            <td>{requests_total_str}</td>
+            <td>{avg_requests_min:.2f}</td>
+            <td>{display_kg_total:,.2f}</td>
+            <td>{display_l_total:,.2f}</td>
+            <td>{display_weight_total:,.2f}</td>
+            <td>{weight_per_min:.2f}</td>
+        </tr>
+    </table>
+    '''
+    return html
+
+@st.cache_data(max_entries=64)
+def render_validation_table(summary, label_header):
+    """HTML for the data-quality panel: lines, invalid lines and failures per check"""
+    header_html = ''.join(f'<th>{h}</th>' for h in [label_header] + list(summary.columns))
+    rows_html = ''.join(
+        f'<tr><td class="dept-name">{label}</td>' + ''.join(f'<td>{int(v):,}</td>' for v in row) + '</tr>'
+        for label, row in summary.iterrows()
+    )
+    return f'<table class="wms-table"><tr>{header_html}</tr>{rows_html}</table>'
+
+@st.cache_data(max_entries=64)
+def render_activity_heatmap(title, heat, bucket_minutes, metric, row_header):
+    """HTML heatmap: one row per worker / cost center / store, one column per time-of-day slot"""
+    active = heat.columns[heat.sum(axis=0) > 0]
+    if len(active):
+        heat = heat.loc[:, active.min():active.max()]
+    max_value = heat.to_numpy().max() if heat.size else 0
+    value_format = "{:,.0f}" if metric != "Requests" else "{:,.1f}"
+
+    def cell(value):
+        if value <= 0:
+            return '<td></td>'
+        intensity = value / max_value
+        # White to the header blue (#4472C4); light text once the cell gets dark
+        r, g, b = (int(255 + (target - 255) * intensity) for target in (0x44, 0x72, 0xC4))
+        color = "white" if intensity > 0.6 else "black"
+        return f'<td style="background-color: #{r:02X}{g:02X}{b:02X}; color: {color};">{value_format.format(value)}</td>'
+
+    slot_labels = [f"{slot * bucket_minutes // 60:02d}:{slot * bucket_minutes % 60:02d}" for slot in heat.columns]
+    header_html = f'<th>{row_header}</th>' + ''.join(f'<th>{label}</th>' for label in slot_labels) + '<th>Total</th>'
+    rows_html = ''.join(
+        f'<tr><td class="picker-name">{name}</td>' + ''.join(cell(v) for v in row) + f'<td><b>{value_format.format(row.sum())}</b></td></tr>'
+        for name, row in heat.iterrows()
+    )
+    totals = heat.sum(axis=0)
+    rows_html += ('<tr><td class="picker-name">Total</td>' + ''.join(f'<td><b>{value_format.format(v)}</b></td>' for v in totals)
+                  + f'<td><b>{value_format.format(totals.sum())}</b></td></tr>')
+    return f'''<div class="comparison-title">{title}</div>
+    <div style="overflow-x: auto;"><table class="wms-table heatmap-table"><tr>{header_html}</tr>{rows_html}</table></div>'''
+
+@st.cache_data(max_entries=64)
+def render_cycle_time_table(title, quantiles, row_header):
+    """HTML table of order counts and cycle-time percentiles"""
+    header_html = ''.join(f'<th>{h}</th>' for h in [row_header, 'Orders'] + [f'{label} Cycle Time' for label in CYCLE_QUANTILES])
+    rows_html = ''.join(
+        f'<tr><td class="dept-name">{name}</td><td>{int(row["Orders"]):,}</td>'
+        + ''.join(f'<td>{format_timedelta(timedelta(seconds=round(row[label])))}</td>' for label in CYCLE_QUANTILES)
+        + '</tr>'
+        for name, row in quantiles.iterrows()
+    )
+    return f'''<div class="comparison-title">{title}</div>
+    <table class="wms-table"><tr>{header_html}</tr>{rows_html}</table>'''
+
+@st.cache_data(max_entries=64)
+def render_item_table(title, top_items, rank_by, divisor):
+    """HTML table of the top items, with a bar on the ranking column"""
+    rank_column = ITEM_METRICS[rank_by]
+    max_value = top_items[rank_column].max() or 1
+    value_columns = [('requests', 'Requests', "{:,.1f}" if divisor > 1 else "{:,.0f}"), ('Kg', 'Kg', "{:,.2f}"), ('Liters', 'Liters', "{:,.2f}")]
+    headers = ['#', 'Code', 'Description'] + [f"{'Avg ' if divisor > 1 else ''}{label}" for _, label, _ in value_columns] + ['Stores', 'Store Days']
+    rows = []
+    for rank, (code, item) in enumerate(top_items.iterrows(), start=1):
+        cells = [f'<td>{rank}</td>', f'<td>{code}</td>', f'<td class="dept-name">{escape(item["Description"])}</td>']
+        for column, _, value_format in value_columns:
+            text = value_format.format(item[column] / divisor)
+            if column == rank_column:
+                pct = item[column] / max_value * 100
+                cells.append(f'<td class="progress-cell"><div class="progress-bar" style="width: {pct}%; background-color: #6B9AC4;"></div><div class="progress-text">{text}</div></td>')
+            else:
+                cells.append(f'<td>{text}</td>')
+        cells += [f'<td>{int(item["stores"])}</td>', f'<td>{int(item["store_days"])}</td>']
+        rows.append('<tr>' + ''.join(cells) + '</tr>')
+    header_html = ''.join(f'<th>{h}</th>' for h in headers)
+    return f'''<div class="comparison-title">{title}</div>
+    <table class="wms-table"><tr>{header_html}</tr>{''.join(rows)}</table>'''
+
+@st.cache_data(max_entries=64)
+def render_worker_leaderboard(title, page, first_rank, rank_by, max_value, divisor):
+    """HTML table of one leaderboard page, with a bar on the ranking column"""
+    rank_column = LEADERBOARD_METRICS[rank_by]
+    value_columns = [
+        ('requests', 'Requests', "{:,.1f}" if divisor > 1 else "{:,.0f}", divisor),
+        ('weight', 'Weight', "{:,.2f}", divisor),
+        ('requests_per_minute', 'Requests/min', "{:,.2f}", 1),
+        ('weight_per_minute', 'Weight/min', "{:,.2f}", 1)
+    ]
+    headers = ['#', 'Worker', 'Stores', f"{'Avg ' if divisor > 1 else ''}Picking Time"] + [
+        f"{'Avg ' if scale > 1 else ''}{label}" for _, label, _, scale in value_columns
+    ]
+    rows = []
+    for rank, (_, worker) in enumerate(page.iterrows(), start=first_rank):
+        cells = [
+            f'<td>{rank}</td>', f'<td class="picker-name">{escape(worker["Name"])}</td>', f'<td>{escape(worker["stores"])}</td>',
+            f'<td>{format_timedelta(timedelta(seconds=round(worker["picking_minutes"] * 60 / divisor)))}</td>'
+        ]
+        for column, _, value_format, scale in value_columns:
+            text = value_format.format(worker[column] / scale)
+            if column == rank_column:
+                pct = worker[column] / (max_value or 1) * 100
+                cells.append(f'<td class="progress-cell"><div class="progress-bar" style="width: {pct}%; background-color: #6B9AC4;"></div><div class="progress-text">{text}</div></td>')
+            else:
+                cells.append(f'<td>{text}</td>')
+        rows.append('<tr>' + ''.join(cells) + '</tr>')
+    header_html = ''.join(f'<th>{h}</th>' for h in headers)
+    return f'''<div class="comparison-title">{title}</div>
+    <table class="wms-table"><tr>{header_html}</tr>{''.join(rows)}</table>'''
+
+def show_validation_panel(summary, label_header, excluded):
+    """Collapsed data-quality panel; `summary` rows are dates or stores"""
+    if len(summary) > 1:
+        summary = pd.concat([summary, summary.sum().to_frame('Total').T])
+    invalid, lines = int(summary['Invalid'].iloc[-1]), int(summary['Lines'].iloc[-1])
+    with st.expander(f"🩺 Data quality: {invalid:,} of {lines:,} lines fail a check"):
+        st.markdown(render_validation_table(summary, label_header), unsafe_allow_html=True)
+        if excluded:
+            st.caption("Invalid lines are excluded from the report above.")
+        else:
+            st.caption("Invalid lines are included in the report above; tick '🧹 Exclude invalid rows' to leave them out.")
+
+def show_memory_panel():
+    """Collapsed panel with what every session keeps in memory and on disk"""
+    budget = get_memory_budget()
+    footprint = budget.footprint()
+    session = get_script_run_ctx().session_id
+    mine = footprint.loc[session] if session in footprint.index else None
+    label = f"{mine['memory_bytes'] / 2**20:,.1f} MB in memory, {mine['spilled_bytes'] / 2**20:,.1f} MB on disk" if mine is not None else "nothing held"
+    with st.expander(f"💾 Session memory: {label}"):
+        rows_html = ''.join(
+            f'<tr><td class="dept-name">{escape(sid[:8])}{" (this session)" if sid == session else ""}</td>'
+            f'<td>{row["memory_bytes"] / 2**20:,.1f}</td><td>{row["spilled_bytes"] / 2**20:,.1f}</td>'
+            f'<td>{int(row["handles"])}</td><td>{format_timedelta(timedelta(seconds=round(row["idle_seconds"])))}</td></tr>'
+            for sid, row in footprint.iterrows()
+        )
+        header_html = ''.join(f'<th>{h}</th>' for h in ["Session", "In Memory (MB)", "On Disk (MB)", "Reports Held", "Idle"])
+        st.markdown(f'<table class="wms-table"><tr>{header_html}</tr>{rows_html}</table>', unsafe_allow_html=True)
+        st.caption(f"All sessions hold {footprint['memory_bytes'].sum() / 2**20:,.1f} of {budget.process_limit / 2**20:,.0f} MB; "
+                   f"past {budget.session_limit / 2**20:,.0f} MB per session, or the total, the least recently used "
+                   "reports move to disk and load back when viewed again.")
+
+@st.fragment(run_every=0.5)
+def show_progressive_comparison(comparison_type, date_display, headers, compared_properties, num_days, is_average_mode):
+    """Poll the background loads and redraw the table with every store finished so far"""
+    futures = st.session_state.comp_data_cache['futures']
+    finished = {name: future.result() for name, future in futures.items() if future.done()}
+    if len(finished) == len(futures):
+        # All stores are in: hand over to the full (sortable) report
+        st.session_state.comp_data_cache['summaries'] = {name: finished[name] for name in compared_properties}
+        st.rerun()
+
+    property_metrics = build_property_metrics(finished, num_days, is_average_mode)
+    property_metrics.sort(key=lambda m: m['weight'], reverse=True)
+    st.caption(f"⏳ Loaded {len(finished)} of {len(futures)} stores...")
+    st.markdown(render_comparison_table(comparison_type, date_display, headers, property_metrics, is_average_mode), unsafe_allow_html=True)
+
+# Shared table styles, emitted once per page run
+st.markdown(REPORT_CSS, unsafe_allow_html=True)
+
 try:
+    # Inside the try: a taken port or a bad api_port secret shows as a page error instead of a traceback
+    if st.secrets.get("api_port"):
+        start_api_server(st.secrets.get("api_host", "127.0.0.1"), int(st.secrets["api_port"]))
+
     files = get_files_list()
     file_names = [f['name'].replace('.parquet', '') for f in files]
     
     # Mode selector
-    col_mode, col_rest = st.columns([170, 1200])
+    col_mode, col_quality, col_rest = st.columns([170, 220, 980])
     with col_mode:
         mode = st.selectbox("🎯 Mode", ["", "Daily Monitor", "Analytics Mode", "Comparison Mode"], index=0)
+    with col_quality:
+        st.markdown("<div style='margin-top: 36px;'></div>", unsafe_allow_html=True)
+        exclude_invalid = st.checkbox("🧹 Exclude invalid rows", key="exclude_invalid",
+                                      help="Leave out lines failing a data-quality check (see the Data quality panel)")
 
     if not mode:
         st.info("👆 Please select a mode to continue")
@@ -154,13 +809,15 @@ try:
         col1, col2, col3, col4, col5, col6, col_load, col_empty = st.columns([220, 140, 140, 160, 140, 140, 120, 680])
 
         with col1:
-            comparison_type = st.selectbox("📊 Compare", ["", "All Properties", "Property vs Property"], index=0)
+            comparison_type = st.selectbox("📊 Compare", ["", "All Properties", "Property vs Property", "Selected Properties"], index=0)
+
+        # Store selection for Selected Properties goes on its own row below
+        selection_row = st.container()
 
         # Initialize variables
         common_dates = []
-        all_property_data = {}  # For All Properties mode
-        df1 = None
-        df2 = None
+        compared_properties = []  # Stores in the comparison, in display order
+        all_property_data = {}  # Staged file paths (Process pool, Streaming and DuckDB modes)
         property_1 = None
         property_2 = None
 
@@ -173,31 +830,37 @@ try:
                 property_2_options = [""] + [f for f in file_names if f != property_1]
                 property_2 = st.selectbox("🏪 Property 2", property_2_options, index=0)
 
-            # Get dates only (fast) when both properties selected
             if property_1 and property_2:
-                file_1 = next(f for f in files if f['name'].replace('.parquet', '') == property_1)
-                file_2 = next(f for f in files if f['name'].replace('.parquet', '') == property_2)
-
-                dates_1 = set(get_dates_for_store(file_1['download_url']))
-                dates_2 = set(get_dates_for_store(file_2['download_url']))
-                common_dates = sorted(dates_1 & dates_2)
+                compared_properties = [property_1, property_2]
 
         elif comparison_type == "All Properties":
             with col2:
                 st.empty()
             with col3:
                 st.empty()
-
-            # Get dates only for all properties (fast)
+            compared_properties = list(file_names)
+
+        elif comparison_type == "Selected Properties":
+            # A form batches the clicks: dates are looked up once on Apply, not after every pick.
+            # The other selectors stay live because their options depend on each other.
+            with selection_row:
+                with st.form("comp_selected_props_form", border=False):
+                    col_props, col_props_apply, col_props_empty = st.columns([800, 120, 360])
+                    with col_props:
+                        compared_properties = st.multiselect("🏪 Properties", file_names, key="comp_selected_props")
+                    with col_props_apply:
+                        st.markdown("<div style='margin-top: 28px;'></div>", unsafe_allow_html=True)
+                        st.form_submit_button("✔️ Apply")
+            # Keep the dropdown order regardless of click order
+            compared_properties = [f for f in file_names if f in compared_properties]
+
+        # Get dates only (fast) and keep those common to every compared property
+        if len(compared_properties) >= 2:
             all_dates_sets = []
-            for file_name in file_names:
+            for file_name in compared_properties:
                 file_obj = next(f for f in files if f['name'].replace('.parquet', '') == file_name)
-                dates = get_dates_for_store(file_obj['download_url'])
-                all_dates_sets.append(set(dates))
-
-            # Find dates common to ALL properties
-            if all_dates_sets:
-                common_dates = sorted(set.intersection(*all_dates_sets))
+                all_dates_sets.append(set(get_dates_for_store(file_obj['download_url'])))
+            common_dates = sorted(set.intersection(*all_dates_sets))
 
         # Initialize variables for date selection
         selected_comparison_date = None
@@ -224,22 +887,23 @@ try:
             else:
                 st.empty()
 
-        # Mode dropdown (only for Date Range)
-        if date_type == "Date Range":
-            col_agg, col_agg_empty = st.columns([220, 1060])
-            with col_agg:
-                aggregation_mode = st.selectbox("📈 Mode", ["Average", "Total"], index=0, key="comp_agg_mode")
-        else:
-            aggregation_mode = "Average"
+        # Mode dropdown (only for Date Range) and execution mode
+        aggregation_mode = "Average"
+        execution_mode = "Single process"
+        if comparison_type:
+            col_agg, col_exec, col_agg_empty = st.columns([220, 220, 840])
+            if date_type == "Date Range":
+                with col_agg:
+                    aggregation_mode = st.selectbox("📈 Mode", ["Average", "Total"], index=0, key="comp_agg_mode")
+            with col_exec:
+                execution_options = ["Single process", "Process pool", "Progressive", "Streaming"]
+                if "DuckDB" in QUERY_ENGINES:
+                    execution_options.append("DuckDB")
+                execution_mode = st.selectbox("⚙️ Execution", execution_options, index=0, key="comp_exec_mode")
 
         # Determine if Load button should be enabled
         load_enabled = False
-        if comparison_type == "Property vs Property" and property_1 and property_2:
-            if date_type == "Single Date" and selected_comparison_date:
-                load_enabled = True
-            elif date_type == "Date Range" and start_date and end_date:
-                load_enabled = True
-        elif comparison_type == "All Properties":
+        if len(compared_properties) >= 2:
             if date_type == "Single Date" and selected_comparison_date:
                 load_enabled = True
             elif date_type == "Date Range" and start_date and end_date:
@@ -258,6 +922,10 @@ try:
             st.info("👆 Please select both properties to compare")
             st.stop()
 
+        if comparison_type == "Selected Properties" and len(compared_properties) < 2:
+            st.info("👆 Please select at least two properties to compare")
+            st.stop()
+
         if not common_dates:
             st.warning("⚠️ No common dates found between the selected properties")
             st.stop()
@@ -288,15 +956,24 @@ try:
             st.session_state.comp_loaded = False
             st.session_state.comp_dates = None
             st.session_state.comp_type = None
+            st.session_state.comp_properties = None
+            st.session_state.comp_exec = None
+            st.session_state.comp_quarantine = None
 
         if load_data_clicked:
             st.session_state.comp_loaded = True
             st.session_state.comp_dates = comparison_dates
             st.session_state.comp_type = comparison_type
+            st.session_state.comp_properties = compared_properties
+            st.session_state.comp_exec = execution_mode
+            st.session_state.comp_quarantine = exclude_invalid
 
         # Reset if selection changed
         if (st.session_state.comp_dates != comparison_dates or
-            st.session_state.comp_type != comparison_type):
+            st.session_state.comp_type != comparison_type or
+            st.session_state.comp_properties != compared_properties or
+            st.session_state.comp_exec != execution_mode or
+            st.session_state.get('comp_quarantine') != exclude_invalid):
             st.session_state.comp_loaded = False
 
         if not st.session_state.comp_loaded:
@@ -306,67 +983,115 @@ try:
         # Only load data once, then cache it
         if 'comp_data_cache' not in st.session_state or load_data_clicked:
             with st.spinner("Loading data for selected dates..."):
-                if comparison_type == "Property vs Property":
-                    file_1 = next(f for f in files if f['name'].replace('.parquet', '') == property_1)
-                    file_2 = next(f for f in files if f['name'].replace('.parquet', '') == property_2)
-                    df1 = get_filtered_data(file_1['download_url'], comparison_dates)
-                    df2 = get_filtered_data(file_2['download_url'], comparison_dates)
-                    st.session_state.comp_data_cache = {'type': 'pvp', 'df1': df1, 'df2': df2}
-                elif comparison_type == "All Properties":
-                    all_property_data = {}
-                    for file_name in file_names:
+                if execution_mode == "Progressive":
+                    # Stores load and summarize on background threads; the table fills in as they finish
+                    loader_pool = get_loader_pool()
+                    futures = {}
+                    for file_name in compared_properties:
                         file_obj = next(f for f in files if f['name'].replace('.parquet', '') == file_name)
-                        all_property_data[file_name] = get_filtered_data(file_obj['download_url'], comparison_dates)
-                    st.session_state.comp_data_cache = {'type': 'all', 'data': all_property_data}
-        else:
-            if comparison_type == "Property vs Property":
-                df1 = st.session_state.comp_data_cache['df1']
-                df2 = st.session_state.comp_data_cache['df2']
-            elif comparison_type == "All Properties":
-                all_property_data = st.session_state.comp_data_cache['data']
+                        futures[file_name] = loader_pool.submit(load_store_summary, file_obj['download_url'], comparison_dates, exclude_invalid)
+                    st.session_state.comp_data_cache = hold_session_frames('comparison', {'type': 'progressive', 'futures': futures})
+                elif execution_mode in ("Process pool", "Streaming", "DuckDB"):
+                    # These modes read the files themselves; only stage them on disk here
+                    for file_name in compared_properties:
+                        file_obj = next(f for f in files if f['name'].replace('.parquet', '') == file_name)
+                        all_property_data[file_name] = stage_store_file(file_obj['download_url'], exclude_invalid)
+                    st.session_state.comp_data_cache = hold_session_frames('comparison', {'type': 'staged', 'data': all_property_data})
+                else:
+                    frames, action_frames = [], []
+                    for file_name in compared_properties:
+                        file_obj = next(f for f in files if f['name'].replace('.parquet', '') == file_name)
+                        df, actions = get_store_tables(file_obj['download_url'], comparison_dates, exclude_invalid)
+                        frames.append(df.assign(Property=file_name))
+                        action_frames.append(actions.assign(Property=file_name))
+                    # The frames are only read again to summarize, so they are the first to spill
+                    st.session_state.comp_data_cache = hold_session_frames('comparison', {
+                        'type': 'combined', 'data': pd.concat(frames, ignore_index=True),
+                        'actions': pd.concat(action_frames, ignore_index=True)
+                    })
+        elif st.session_state.comp_data_cache['type'] == 'staged':
+            all_property_data = st.session_state.comp_data_cache['data']
 
     elif mode == "Analytics Mode":
-        # Analytics Mode - show UI but with coming soon message
-        col2, col3, col4, col5, col6, col_empty = st.columns([140, 160, 140, 140, 140, 580])
+        # Analytics Mode dropdowns - first row
+        col2, col3, col4, col5, col6, col_load, col_empty = st.columns([170, 140, 130, 130, 130, 120, 440])
+        store_ids = {f['name'].replace('.parquet', ''): f['download_url'] for f in files}
 
         with col2:
-            selected_store = st.selectbox("🏪 Store", [""] + file_names, index=0)
+            analysis_type = st.selectbox("📊 Analysis", ["", "Hourly Heatmap", "Order Cycle Times", "Item Velocity",
+                                                             "Worker Leaderboard"], index=0,
+                                         key="analytics_type")
+        with col3:
+            selected_store = st.selectbox("🏪 Store", ["", "All Stores"] + file_names, index=0, key="analytics_store")
 
-        unique_dates = []
-        if selected_store:
-            selected_file = next(f for f in files if f['name'].replace('.parquet', '') == selected_store)
-            unique_dates = get_dates_for_store(selected_file['download_url'])
+        # Stores in the analysis; "All Stores" offers every date any store has
+        analytics_stores = file_names if selected_store == "All Stores" else [selected_store] if selected_store else []
+        unique_dates = sorted(set().union(*[get_dates_for_store(store_ids[name]) for name in analytics_stores]))
 
-        with col3:
+        with col4:
             if unique_dates:
-                date_type = st.selectbox("📅 Date Type", ["", "Single Date", "Date Range"], index=0)
+                date_type = st.selectbox("📅 Date Type", ["", "Single Date", "Date Range"], index=0, key="analytics_date_type")
             else:
-                date_type = st.selectbox("📅 Date Type", [""], index=0, disabled=True)
+                date_type = st.selectbox("📅 Date Type", [""], index=0, disabled=True, key="analytics_date_type")
 
         selected_date = None
         start_date = None
         end_date = None
 
-        with col4:
+        with col5:
             if unique_dates and date_type == "Single Date":
-                selected_date = st.selectbox("📅 Date", [""] + [d.strftime("%d/%m") for d in unique_dates], index=0)
+                selected_date = st.selectbox("📅 Date", [""] + [d.strftime("%d/%m") for d in unique_dates], index=0, key="analytics_date")
             elif unique_dates and date_type == "Date Range":
-                start_date = st.selectbox("📅 Start", [""] + [d.strftime("%d/%m") for d in unique_dates], index=0)
+                start_date = st.selectbox("📅 Start", [""] + [d.strftime("%d/%m") for d in unique_dates], index=0, key="analytics_start")
             else:
-                st.selectbox("📅 Date", [""], index=0, disabled=True)
+                st.selectbox("📅 Date", [""], index=0, disabled=True, key="analytics_date_disabled")
 
-        with col5:
+        with col6:
             if unique_dates and date_type == "Date Range":
-                end_date = st.selectbox("📅 End", [""] + [d.strftime("%d/%m") for d in unique_dates], index=0)
+                end_date = st.selectbox("📅 End", [""] + [d.strftime("%d/%m") for d in unique_dates], index=0, key="analytics_end")
             else:
                 st.empty()
 
-        with col6:
-            st.empty()
+        analytics_aggregation_mode = "Average"
+        if date_type == "Date Range":
+            col_agg_analytics, col_agg_analytics_empty = st.columns([170, 1110])
+            with col_agg_analytics:
+                analytics_aggregation_mode = st.selectbox("📈 Mode", ["Average", "Total"], index=0, key="analytics_agg_mode")
 
-        # Show coming soon message immediately
-        st.info("🚧 **Analytics Mode coming soon!**")
-        st.stop()
+        load_enabled = bool(analysis_type and analytics_stores) and (
+            (date_type == "Single Date" and bool(selected_date)) or (date_type == "Date Range" and bool(start_date and end_date))
+        )
+        with col_load:
+            st.markdown("<div style='margin-top: 28px;'></div>", unsafe_allow_html=True)
+            load_data_clicked = st.button("📥 Load Data", type="primary", key="analytics_load", disabled=not load_enabled)
+
+        if not analysis_type or not selected_store or not date_type:
+            st.info("👆 Please make all selections to continue")
+            st.stop()
+
+        if date_type == "Single Date":
+            if not selected_date:
+                st.info("👆 Please select a date")
+                st.stop()
+            analytics_dates = [next(d for d in unique_dates if d.strftime("%d/%m") == selected_date)]
+        else:  # Date Range
+            if not start_date or not end_date:
+                st.info("👆 Please select both start and end dates")
+                st.stop()
+            start_date_obj = next(d for d in unique_dates if d.strftime("%d/%m") == start_date)
+            end_date_obj = next(d for d in unique_dates if d.strftime("%d/%m") == end_date)
+            if start_date_obj > end_date_obj:
+                st.warning("⚠️ Start date must be before or equal to end date")
+                st.stop()
+            analytics_dates = [d for d in unique_dates if start_date_obj <= d <= end_date_obj]
+
+        # Track loaded state in session; any change to the selection asks for a new load
+        analytics_selection = (analysis_type, selected_store, analytics_dates, exclude_invalid)
+        if load_data_clicked:
+            st.session_state.analytics_loaded = analytics_selection
+        if st.session_state.get('analytics_loaded') != analytics_selection:
+            st.info("👆 Click 'Load Data' to generate the report")
+            st.stop()
 
     else:
         # Daily Monitor Mode - original dropdowns
@@ -395,17 +1120,21 @@ try:
 
         with col4:
             if unique_dates:
-                date_type = st.selectbox("📅 Date Type", ["", "Single Date", "Date Range"], index=0, key="daily_date_type")
+                date_type = st.selectbox("📅 Date Type", ["", "Single Date", "Date Range", "Live (Today)"], index=0, key="daily_date_type")
             else:
                 date_type = st.selectbox("📅 Date Type", [""], index=0, disabled=True, key="daily_date_type")
 
         selected_date = None
         start_date = None
         end_date = None
+        live_interval = None
 
         with col5:
             if unique_dates and date_type == "Single Date":
                 selected_date = st.selectbox("📅 Date", [""] + [d.strftime("%d/%m") for d in unique_dates], index=0, key="daily_single_date")
+            elif unique_dates and date_type == "Live (Today)":
+                live_interval = st.selectbox("🔄 Refresh", [30, 60, 300], index=0, key="daily_live_interval",
+                                             format_func=lambda s: f"every {s // 60} min" if s >= 60 else f"every {s} s")
             elif unique_dates and date_type == "Date Range":
                 start_date = st.selectbox("📅 Start", [""] + [d.strftime("%d/%m") for d in unique_dates], index=0, key="daily_start_date")
             else:
@@ -417,13 +1146,16 @@ try:
             else:
                 st.empty()
 
-        # Mode dropdown (only for Date Range)
+        # Mode dropdown (only for Date Range) and query engine
+        daily_aggregation_mode = "Average"
+        daily_engine = "pandas"
+        col_agg_daily, col_engine_daily, col_agg_daily_empty = st.columns([165, 165, 950])
         if date_type == "Date Range":
-            col_agg_daily, col_agg_daily_empty = st.columns([165, 1115])
             with col_agg_daily:
                 daily_aggregation_mode = st.selectbox("📈 Mode", ["Average", "Total"], index=0, key="daily_agg_mode")
-        else:
-            daily_aggregation_mode = "Average"
+        if date_type != "Live (Today)":
+            with col_engine_daily:
+                daily_engine = st.selectbox("⚙️ Engine", QUERY_ENGINES, index=0, key="daily_engine")
 
         # Determine if Load button should be enabled
         load_enabled = False
@@ -432,6 +1164,8 @@ try:
                 load_enabled = True
             elif date_type == "Date Range" and start_date and end_date:
                 load_enabled = True
+            elif date_type == "Live (Today)":
+                load_enabled = True
 
         # Load Data button
         with col_load:
@@ -449,21 +1183,30 @@ try:
                 st.warning("⚠️ Start date must be before or equal to end date")
                 st.stop()
             selected_dates = [d for d in unique_dates if start_date_obj <= d <= end_date_obj]
+        elif date_type == "Live (Today)":
+            # Before a store's day cutoff, today is still yesterday's operational day
+            calendar = get_store_calendar(next(f for f in files if f['name'].replace('.parquet', '') == selected_store)['download_url'])
+            selected_dates = [calendar.current_day() if calendar is not None else pd.Timestamp.now().normalize()]
 
         # Track loaded state in session
         if 'daily_loaded' not in st.session_state:
             st.session_state.daily_loaded = False
             st.session_state.daily_store = None
             st.session_state.daily_dates = None
+            st.session_state.daily_loaded_engine = None
 
         if load_data_clicked:
             st.session_state.daily_loaded = True
             st.session_state.daily_store = selected_store
             st.session_state.daily_dates = selected_dates
+            st.session_state.daily_loaded_engine = daily_engine
+            st.session_state.daily_loaded_quarantine = exclude_invalid
 
-        # Reset if store or dates changed
+        # Reset if store, dates, engine or row filter changed
         if (st.session_state.daily_store != selected_store or 
-            st.session_state.get('daily_dates') != selected_dates):
+            st.session_state.get('daily_dates') != selected_dates or
+            st.session_state.get('daily_loaded_engine') != daily_engine or
+            st.session_state.get('daily_loaded_quarantine') != exclude_invalid):
             st.session_state.daily_loaded = False
             
         if not view_type or not selected_store or not date_type:
@@ -482,20 +1225,41 @@ try:
             st.info("👆 Click 'Load Data' to generate the report")
             st.stop()
 
+        if date_type == "Live (Today)":
+            # Each tick folds in only the actions completed since the last one, then redraws the page if any arrived
+            selected_file = next(f for f in files if f['name'].replace('.parquet', '') == selected_store)
+            monitor = get_live_monitor(selected_file['download_url'], selected_dates[0])
+            with st.spinner("Loading today's data..."):
+                st.session_state.daily_live_version = monitor.refresh()
+
+            @st.fragment(run_every=live_interval)
+            def watch_live_monitor():
+                """Poll the store file and rerun the page when new actions arrived"""
+                if monitor.refresh() != st.session_state.daily_live_version:
+                    st.rerun()
+                st.caption(f"🔴 Live · {len(monitor.seen_actions):,} completed actions today · "
+                           f"checked {pd.Timestamp.now():%H:%M:%S}")
+
+            watch_live_monitor()
+            daily_cube, daily_totals = monitor.report()
+            if daily_cube.empty:
+                st.info("🔴 No completed actions yet today; the report appears as soon as the first one arrives")
+                st.stop()
+            st.session_state.daily_data = hold_session_frames('daily', {'cube': daily_cube, 'totals': daily_totals, 'dates': selected_dates})
         # Only load data once, then cache it
-        if 'daily_day_df' not in st.session_state or load_data_clicked:
+        elif 'daily_data' not in st.session_state or load_data_clicked:
             selected_file = next(f for f in files if f['name'].replace('.parquet', '') == selected_store)
             
             with st.spinner("Loading data for selected date(s)..."):
-                day_df = get_filtered_data(selected_file['download_url'], selected_dates)
+                rollups = get_store_rollups(selected_file['download_url'], daily_engine, exclude_invalid)
 
-            day_df['Kg'] = day_df.apply(calc_kg, axis=1)
-            day_df['Liters'] = day_df.apply(calc_l, axis=1)
-            st.session_state.daily_day_df = day_df
-            st.session_state.daily_selected_dates = selected_dates
+            # Any start/end pair: additive totals from two prefix rows, orders and real time from the range's slice
+            daily_cube, daily_totals = query_rollups(rollups, selected_dates[0], selected_dates[-1])
+            st.session_state.daily_data = hold_session_frames('daily', {'cube': daily_cube, 'totals': daily_totals, 'dates': selected_dates})
         else:
-            day_df = st.session_state.daily_day_df
-            selected_dates = st.session_state.daily_selected_dates
+            daily_cube = st.session_state.daily_data['cube']
+            daily_totals = st.session_state.daily_data['totals']
+            selected_dates = st.session_state.daily_data['dates']
 
     # ============== DAILY MONITOR MODE ==============
     if mode == "Daily Monitor":
@@ -512,27 +1276,15 @@ try:
                 st.session_state.dept_sort_col = 'Total Weight'
                 st.session_state.dept_sort_asc = False
 
-            unique_actions_dept = day_df.groupby(['Cost Center', 'Action Code']).agg({
-                'Action start': 'first',
-                'Action completion': 'first'
-            }).reset_index()
-            unique_actions_dept['picking_time'] = unique_actions_dept['Action completion'] - unique_actions_dept['Action start']
-
-            dept_times = unique_actions_dept.groupby('Cost Center')['picking_time'].sum().reset_index()
-
-            dept_stats = day_df.groupby('Cost Center').agg({
-                'Document': 'nunique',
-                'Code': 'count',
-                'Kg': 'sum',
-                'Liters': 'sum'
-            }).reset_index()
-            dept_stats.columns = ['Cost Center', '# of Orders', 'Item Requests', 'Kilograms', 'Liters']
-            dept_stats['Total Weight'] = dept_stats['Kilograms'] + dept_stats['Liters']
-
-            dept_report = dept_stats.merge(dept_times, on='Cost Center')
+            dept_report = slice_cube(daily_cube, 'Cost Center').rename(columns={
+                'orders': '# of Orders',
+                'requests': 'Item Requests',
+                'Kg': 'Kilograms'
+            })
+            dept_report['Total Weight'] = dept_report['Kilograms'] + dept_report['Liters']
 
             # Calculate "Real" picking time using non-overlap method (matches Worker View)
-            total_picking_time_no_overlap = calculate_total_time_no_overlap(unique_actions_dept)
+            total_picking_time_no_overlap = daily_totals['real_picking_time']
 
             # Apply average mode if selected
             if is_average_mode:
@@ -552,13 +1304,6 @@ try:
 
             dept_report['Total Picking Time'] = dept_report['display_picking_time'].apply(format_timedelta)
 
-            max_orders = dept_report['display_orders'].max()
-            max_requests = dept_report['display_requests'].max()
-            max_kg = dept_report['display_kg'].max()
-            max_l = dept_report['display_liters'].max()
-            max_weight = dept_report['display_weight'].max()
-            max_time = dept_report['display_picking_time'].max().total_seconds()
-
             # Dynamic headers based on mode
             if is_average_mode:
                 orders_header = 'Avg Orders'
@@ -575,244 +1320,94 @@ try:
                 weight_header = 'Total Weight'
                 time_header = 'Total Picking Time'
 
-            # Sort controls in one row
-            sort_options = [orders_header, requests_header, kg_header, liters_header, weight_header, time_header]
-
-            # Reset sort column if it's not in current options (mode changed)
-            if st.session_state.dept_sort_col not in sort_options:
-                st.session_state.dept_sort_col = weight_header
-            col_sort1, col_sort2, col_sort3 = st.columns([2, 2, 6])
-            with col_sort1:
-                sort_col_display = st.selectbox(
-                    "Sort by",
-                    sort_options,
-                    index=sort_options.index(st.session_state.dept_sort_col),
-                    key="sort_select"
-                )
-            with col_sort2:
-                sort_order = st.selectbox(
-                    "Order",
-                    ["Largest ↓", "Smallest ↑"],
-                    index=0 if not st.session_state.dept_sort_asc else 1,
-                    key="sort_order"
-                )
+            # Sorting and drawing run in a fragment: changing a sort control reruns only this part
+            @st.fragment
+            def show_department_report(dept_report):
+                """Sort controls, department table, totals and drill-down"""
+                # Sort controls in one row
+                sort_options = [orders_header, requests_header, kg_header, liters_header, weight_header, time_header]
+
+                # Reset sort column if it's not in current options (mode changed)
+                if st.session_state.dept_sort_col not in sort_options:
+                    st.session_state.dept_sort_col = weight_header
+                col_sort1, col_sort2, col_sort3 = st.columns([2, 2, 6])
+                with col_sort1:
+                    sort_col_display = st.selectbox(
+                        "Sort by",
+                        sort_options,
+                        index=sort_options.index(st.session_state.dept_sort_col),
+                        key="sort_select"
+                    )
+                with col_sort2:
+                    sort_order = st.selectbox(
+                        "Order",
+                        ["Largest ↓", "Smallest ↑"],
+                        index=0 if not st.session_state.dept_sort_asc else 1,
+                        key="sort_order"
+                    )
             
-            if sort_col_display != st.session_state.dept_sort_col or (sort_order == "Smallest ↑") != st.session_state.dept_sort_asc:
-                st.session_state.dept_sort_col = sort_col_display
-                st.session_state.dept_sort_asc = (sort_order == "Smallest ↑")
-                st.rerun()
-
-            # Sort by selected column
-            sort_col = st.session_state.dept_sort_col
-            sort_asc = st.session_state.dept_sort_asc
-
-            sort_col_map = {
-                orders_header: 'display_orders',
-                requests_header: 'display_requests',
-                kg_header: 'display_kg',
-                liters_header: 'display_liters',
-                weight_header: 'display_weight',
-                time_header: 'display_picking_time'
-            }
-            sort_by_col = sort_col_map.get(sort_col, 'display_weight')
-            if sort_by_col == 'display_picking_time':
-                dept_report = dept_report.sort_values(sort_by_col, ascending=sort_asc, key=lambda x: x.apply(lambda td: td.total_seconds())).reset_index(drop=True)
-            else:
-                dept_report = dept_report.sort_values(sort_by_col, ascending=sort_asc).reset_index(drop=True)
-
-            html = '''
-            <style>
-                .wms-table {
-                    border-collapse: collapse;
-                    width: auto;
-                    font-family: Arial, sans-serif;
-                    font-size: 14px;
-                }
-                .wms-table th {
-                    background-color: #4472C4;
-                    color: white;
-                    padding: 10px;
-                    text-align: center;
-                    border: 1px solid #2F5496;
-                }
-                .wms-table td {
-                    padding: 8px;
-                    border: 1px solid #B4C6E7;
-                    text-align: center;
-                    color: black;
-                }
-                .wms-table tr:nth-child(odd) {
-                    background-color: #D6DCE4;
-                }
-                .wms-table tr:nth-child(even) {
-                    background-color: #EDEDED;
-                }
-                .dept-name {
-                    font-weight: bold;
-                    text-align: left !important;
-                    color: black;
-                }
-                .progress-cell {
-                    position: relative;
-                    padding: 0 !important;
-                }
-                .progress-bar {
-                    height: 100%;
-                    position: absolute;
-                    left: 0;
-                    top: 0;
-                }
-                .progress-text {
-                    position: relative;
-                    z-index: 1;
-                    padding: 8px;
-                    color: black;
+                if sort_col_display != st.session_state.dept_sort_col or (sort_order == "Smallest ↑") != st.session_state.dept_sort_asc:
+                    st.session_state.dept_sort_col = sort_col_display
+                    st.session_state.dept_sort_asc = (sort_order == "Smallest ↑")
+
+                # Sort by selected column
+                sort_col = st.session_state.dept_sort_col
+                sort_asc = st.session_state.dept_sort_asc
+
+                sort_col_map = {
+                    orders_header: 'display_orders',
+                    requests_header: 'display_requests',
+                    kg_header: 'display_kg',
+                    liters_header: 'display_liters',
+                    weight_header: 'display_weight',
+                    time_header: 'display_picking_time'
                 }
-                .stats-table {
-                    border-collapse: collapse;
-                    margin-top: 30px;
-                    font-family: Arial, sans-serif;
-                }
-                .stats-table th {
-                    background-color: #4472C4;
-                    color: white;
-                    padding: 10px;
-                    border: 1px solid #2F5496;
-                }
-                .stats-table td {
-                    padding: 10px;
-                    border: 1px solid #B4C6E7;
-                    background-color: #D6DCE4;
-                    text-align: center;
-                    color: black;
-                }
-            </style>
-            '''
-            
-            headers = [
-                ('Cost Center', '280px'),
-                (orders_header, '110px'),
-                (requests_header, '180px'),
-                (kg_header, '120px'),
-                (liters_header, '120px'),
-                (weight_header, '120px'),
-                (time_header, '150px')
-            ]
-
-            html += '<table class="wms-table">'
-            html += '<tr>'
-            for h, w in headers:
-                html += f'<th style="width: {w};">{h}</th>'
-            html += '</tr>'
-
-            for _, row in dept_report.iterrows():
-                html += '<tr>'
-
-                html += f'<td class="dept-name">{row["Cost Center"]}</td>'
-
-                # Format values based on mode
-                orders_str = f"{row['display_orders']:.1f}" if is_average_mode else f"{int(row['display_orders'])}"
-                requests_str = f"{row['display_requests']:.1f}" if is_average_mode else f"{int(row['display_requests'])}"
-
-                pct = (row['display_orders'] / max_orders * 100) if max_orders > 0 else 0
-                html += f'''<td class="progress-cell">
-                    <div class="progress-bar" style="width: {pct}%; background-color: #5B9BD5;"></div>
-                    <div class="progress-text">{orders_str}</div>
-                </td>'''
-
-                pct = (row['display_requests'] / max_requests * 100) if max_requests > 0 else 0
-                html += f'''<td class="progress-cell">
-                    <div class="progress-bar" style="width: {pct}%; background-color: #5B9BD5;"></div>
-                    <div class="progress-text">{requests_str}</div>
-                </td>'''
-
-                pct = (row['display_kg'] / max_kg * 100) if max_kg > 0 else 0
-                kg_formatted = f"{row['display_kg']:,.2f}"
-                html += f'''<td class="progress-cell">
-                    <div class="progress-bar" style="width: {pct}%; background-color: #FFC000;"></div>
-                    <div class="progress-text">{kg_formatted}</div>
-                </td>'''
-                
-                pct = (row['display_liters'] / max_l * 100) if max_l > 0 else 0
-                liters_formatted = f"{row['display_liters']:,.2f}"
-                html += f'''<td class="progress-cell">
-                    <div class="progress-bar" style="width: {pct}%; background-color: #70AD47;"></div>
-                    <div class="progress-text">{liters_formatted}</div>
-                </td>'''
-                
-                pct = (row['display_weight'] / max_weight * 100) if max_weight > 0 else 0
-                weight_formatted = f"{row['display_weight']:,.2f}"
-                html += f'''<td class="progress-cell">
-                    <div class="progress-bar" style="width: {pct}%; background-color: #9B59B6;"></div>
-                    <div class="progress-text">{weight_formatted}</div>
-                </td>'''
-
-                pct = (row['display_picking_time'].total_seconds() / max_time * 100) if max_time > 0 else 0
-                html += f'''<td class="progress-cell">
-                    <div class="progress-bar" style="width: {pct}%; background-color: #C65B5B;"></div>
-                    <div class="progress-text">{row["Total Picking Time"]}</div>
-                </td>'''
-
-                html += '</tr>'
-
-            html += '</table>'
-
-            # Calculate summary totals
-            total_orders_sum = dept_report['# of Orders'].sum()
-            total_requests_sum = dept_report['Item Requests'].sum()
-            total_weight_sum = dept_report['Total Weight'].sum()
-            total_picking_time = dept_report['picking_time'].sum()
-
-            # Apply average mode if selected
-            if is_average_mode:
-                display_orders_total = total_orders_sum / num_days
-                display_requests_total = total_requests_sum / num_days
-                display_weight_total = total_weight_sum / num_days
-                display_picking_time_total = total_picking_time / num_days
-                display_real_picking_time_total = total_picking_time_no_overlap / num_days
-                total_picking_time_str = format_timedelta(display_picking_time_total)
-                real_picking_time_str = format_timedelta(display_real_picking_time_total)
-                orders_header_summary = 'Avg Orders'
-                requests_header_summary = 'Avg Requests'
-                weight_header_summary = 'Avg Weight'
-                time_header_summary = 'Avg Picking Time'
-                real_time_header_summary = 'Real Avg Picking Time'
-            else:
-                display_orders_total = total_orders_sum
-                display_requests_total = total_requests_sum
-                display_weight_total = total_weight_sum
-                total_picking_time_str = format_timedelta(total_picking_time)
-                real_picking_time_str = format_timedelta(total_picking_time_no_overlap)
-                orders_header_summary = 'Total Orders'
-                requests_header_summary = 'Total Requests'
-                weight_header_summary = 'Total Weight'
-                time_header_summary = 'Total Picking Time'
-                real_time_header_summary = 'Real Total Picking Time'
-
-            # Format display values
-            orders_total_str = f"{display_orders_total:,.1f}" if is_average_mode else f"{int(display_orders_total):,}"
-            requests_total_str = f"{display_requests_total:,.1f}" if is_average_mode else f"{int(display_requests_total):,}"
-
-            html += f'''
-            <table class="stats-table" style="margin-top: 15px;">
-                <tr>
-                    <th>{orders_header_summary}</th>
-                    <th>{requests_header_summary}</th>
-                    <th>{weight_header_summary}</th>
-                    <th>{time_header_summary}</th>
-                    <th>{real_time_header_summary}</th>
-                </tr>
-                <tr>
-                    <td>{orders_total_str}</td>
-                    <td>{requests_total_str}</td>
-                    <td>{display_weight_total:,.2f}</td>
-                    <td>{total_picking_time_str}</td>
-                    <td>{real_picking_time_str}</td>
-                </tr>
-            </table>
-            '''
-
-            st.markdown(html, unsafe_allow_html=True)
+                sort_by_col = sort_col_map.get(sort_col, 'display_weight')
+                if sort_by_col == 'display_picking_time':
+                    dept_report = dept_report.sort_values(sort_by_col, ascending=sort_asc, key=lambda x: x.apply(lambda td: td.total_seconds())).reset_index(drop=True)
+                else:
+                    dept_report = dept_report.sort_values(sort_by_col, ascending=sort_asc).reset_index(drop=True)
+
+                html = render_department_report(dept_report, (orders_header, requests_header, kg_header, liters_header, weight_header, time_header),
+                                                is_average_mode, num_days, total_picking_time_no_overlap)
+                st.markdown(html, unsafe_allow_html=True)
+
+                # Drill-down: pickers who served one cost center (a slice of the cube)
+                col_drill, col_drill_empty = st.columns([4, 6])
+                with col_drill:
+                    drill_cost_center = st.selectbox(
+                        "🔎 Drill down",
+                        [""] + dept_report['Cost Center'].tolist(),
+                        index=0,
+                        key="dept_drill_cc"
+                    )
+
+                if drill_cost_center:
+                    drill_report = slice_cube(daily_cube, 'Name', cost_center=drill_cost_center)
+                    drill_report = drill_report.sort_values('picking_time', ascending=False).reset_index(drop=True)
+                    divisor = num_days if is_average_mode else 1
+                    max_drill_time = drill_report['picking_time'].max().total_seconds()
+
+                    drill_html = '<table class="wms-table" style="margin-top: 10px;"><tr>'
+                    for h, w in [('Picker', '180px'), (time_header, '150px'), (requests_header, '120px'),
+                                 (kg_header, '100px'), (liters_header, '100px'), (weight_header, '110px')]:
+                        drill_html += f'<th style="width: {w};">{h}</th>'
+                    drill_html += '</tr>'
+                    for _, row in drill_report.iterrows():
+                        pct = (row['picking_time'].total_seconds() / max_drill_time * 100) if max_drill_time > 0 else 0
+                        requests_str = f"{row['requests'] / divisor:.1f}" if is_average_mode else f"{int(row['requests'])}"
+                        drill_html += f'''<tr>
+                            <td class="dept-name">{row["Name"]}</td>
+                            <td class="progress-cell"><div class="progress-bar" style="width: {pct}%; background-color: #C65B5B;"></div><div class="progress-text">{format_timedelta(row['picking_time'] / divisor)}</div></td>
+                            <td>{requests_str}</td>
+                            <td>{row['Kg'] / divisor:,.2f}</td>
+                            <td>{row['Liters'] / divisor:,.2f}</td>
+                            <td>{(row['Kg'] + row['Liters']) / divisor:,.2f}</td>
+                        </tr>'''
+                    drill_html += '</table>'
+                    st.markdown(drill_html, unsafe_allow_html=True)
+
+            show_department_report(dept_report)
 
             if st.button("🔄 Refresh Data"):
                 st.cache_data.clear()
@@ -831,25 +1426,12 @@ try:
                 st.session_state.worker_sort_col = 'Total Weight'
                 st.session_state.worker_sort_asc = False
 
-            unique_actions = day_df.groupby(['Name', 'Action Code']).agg({
-                'Action start': 'first',
-                'Action completion': 'first'
-            }).reset_index()
-            unique_actions['picking_time'] = unique_actions['Action completion'] - unique_actions['Action start']
-
-            picker_times = unique_actions.groupby('Name')['picking_time'].sum().reset_index()
-            total_picking_time_no_overlap = calculate_total_time_no_overlap(unique_actions)
+            total_picking_time_no_overlap = daily_totals['real_picking_time']
 
-            picker_stats = day_df.groupby('Name').agg({
-                'Code': 'count',
-                'Kg': 'sum',
-                'Liters': 'sum'
-            }).reset_index()
-            picker_stats.columns = ['Name', 'Requests fulfilled', 'Kilograms', 'Liters']
-            picker_stats['Name'] = picker_stats['Name'].str.title()
-            picker_times['Name'] = picker_times['Name'].str.title()
-
-            report = picker_stats.merge(picker_times, on='Name')
+            report = slice_cube(daily_cube, 'Name').rename(columns={
+                'requests': 'Requests fulfilled',
+                'Kg': 'Kilograms'
+            })
 
             report['picking_minutes'] = report['picking_time'].dt.total_seconds() / 60
             report['Requests per minute'] = report['Requests fulfilled'] / report['picking_minutes']
@@ -886,733 +1468,350 @@ try:
                 liters_header = 'Liters'
                 weight_header = 'Total Weight'
 
-            max_time = report['display_picking_time'].max().total_seconds()
-            max_requests = report['display_requests'].max()
-            max_kg = report['display_kg'].max()
-            max_l = report['display_liters'].max()
-            max_weight = report['display_weight'].max()
-
-            # Sort controls in one row
-            sort_options = [picking_time_header, requests_header, 'Requests per minute', kg_header, liters_header, weight_header, 'Weight per min']
-
-            # Reset sort column if it's not in current options (mode changed)
-            if st.session_state.worker_sort_col not in sort_options:
-                st.session_state.worker_sort_col = weight_header
-            col_sort1, col_sort2, col_sort3 = st.columns([2, 2, 6])
-            with col_sort1:
-                sort_col_display = st.selectbox(
-                    "Sort by",
-                    sort_options,
-                    index=sort_options.index(st.session_state.worker_sort_col),
-                    key="worker_sort_select"
-                )
-            with col_sort2:
-                sort_order = st.selectbox(
-                    "Order",
-                    ["Largest ↓", "Smallest ↑"],
-                    index=0 if not st.session_state.worker_sort_asc else 1,
-                    key="worker_sort_order"
-                )
-
-            if sort_col_display != st.session_state.worker_sort_col or (sort_order == "Smallest ↑") != st.session_state.worker_sort_asc:
-                st.session_state.worker_sort_col = sort_col_display
-                st.session_state.worker_sort_asc = (sort_order == "Smallest ↑")
-                st.rerun()
-
-            # Sort by selected column
-            sort_col = st.session_state.worker_sort_col
-            sort_asc = st.session_state.worker_sort_asc
-
-            sort_col_map = {
-                picking_time_header: 'display_picking_time',
-                requests_header: 'display_requests',
-                'Requests per minute': 'Requests per minute',
-                kg_header: 'display_kg',
-                liters_header: 'display_liters',
-                weight_header: 'display_weight',
-                'Weight per min': 'Weight per min'
-            }
-            sort_by_col = sort_col_map.get(sort_col, 'Weight per min')
-            if sort_by_col == 'display_picking_time':
-                report = report.sort_values(sort_by_col, ascending=sort_asc, key=lambda x: x.apply(lambda td: td.total_seconds())).reset_index(drop=True)
-            else:
-                report = report.sort_values(sort_by_col, ascending=sort_asc).reset_index(drop=True)
-            
-            html = '''
-            <style>
-                .wms-table {
-                    border-collapse: collapse;
-                    width: auto;
-                    font-family: Arial, sans-serif;
-                    font-size: 14px;
-                }
-                .wms-table th {
-                    background-color: #4472C4;
-                    color: white;
-                    padding: 10px;
-                    text-align: center;
-                    border: 1px solid #2F5496;
-                }
-                .wms-table td {
-                    padding: 8px;
-                    border: 1px solid #B4C6E7;
-                    text-align: center;
-                    color: black;
-                }
-                .wms-table tr:nth-child(odd) {
-                    background-color: #D6DCE4;
-                }
-                .wms-table tr:nth-child(even) {
-                    background-color: #EDEDED;
-                }
-                .picker-name {
-                    font-weight: bold;
-                    text-align: left !important;
-                    color: black;
-                }
-                .progress-cell {
-                    position: relative;
-                    padding: 0 !important;
-                }
-                .progress-bar {
-                    height: 100%;
-                    position: absolute;
-                    left: 0;
-                    top: 0;
+            # Sorting and drawing run in a fragment: changing a sort control reruns only this part
+            @st.fragment
+            def show_worker_report(report):
+                """Sort controls, picker table and totals"""
+                # Sort controls in one row
+                sort_options = [picking_time_header, requests_header, 'Requests per minute', kg_header, liters_header, weight_header, 'Weight per min']
+
+                # Reset sort column if it's not in current options (mode changed)
+                if st.session_state.worker_sort_col not in sort_options:
+                    st.session_state.worker_sort_col = weight_header
+                col_sort1, col_sort2, col_sort3 = st.columns([2, 2, 6])
+                with col_sort1:
+                    sort_col_display = st.selectbox(
+                        "Sort by",
+                        sort_options,
+                        index=sort_options.index(st.session_state.worker_sort_col),
+                        key="worker_sort_select"
+                    )
+                with col_sort2:
+                    sort_order = st.selectbox(
+                        "Order",
+                        ["Largest ↓", "Smallest ↑"],
+                        index=0 if not st.session_state.worker_sort_asc else 1,
+                        key="worker_sort_order"
+                    )
+
+                if sort_col_display != st.session_state.worker_sort_col or (sort_order == "Smallest ↑") != st.session_state.worker_sort_asc:
+                    st.session_state.worker_sort_col = sort_col_display
+                    st.session_state.worker_sort_asc = (sort_order == "Smallest ↑")
+
+                # Sort by selected column
+                sort_col = st.session_state.worker_sort_col
+                sort_asc = st.session_state.worker_sort_asc
+
+                sort_col_map = {
+                    picking_time_header: 'display_picking_time',
+                    requests_header: 'display_requests',
+                    'Requests per minute': 'Requests per minute',
+                    kg_header: 'display_kg',
+                    liters_header: 'display_liters',
+                    weight_header: 'display_weight',
+                    'Weight per min': 'Weight per min'
                 }
-                .progress-text {
-                    position: relative;
-                    z-index: 1;
-                    padding: 8px;
-                    color: black;
-                }
-                .stats-table {
-                    border-collapse: collapse;
-                    margin-top: 30px;
-                    font-family: Arial, sans-serif;
-                }
-                .stats-table th {
-                    background-color: #4472C4;
-                    color: white;
-                    padding: 10px;
-                    border: 1px solid #2F5496;
-                }
-                .stats-table td {
-                    padding: 10px;
-                    border: 1px solid #B4C6E7;
-                    background-color: #D6DCE4;
-                    text-align: center;
-                    color: black;
-                }
-                .stats-title {
-                    font-size: 18px;
-                    text-decoration: underline;
-                    margin-bottom: 10px;
-                    color: black;
-                }
-            </style>
-            '''
-            
-            headers = [
-                ('Picker', '180px'),
-                (picking_time_header, '130px'),
-                (requests_header, '120px'),
-                ('Requests per minute', '150px'),
-                (kg_header, '100px'),
-                (liters_header, '100px'),
-                (weight_header, '110px'),
-                ('Weight per min', '110px')
-            ]
-
-            html += '<table class="wms-table">'
-            html += '<tr>'
-            for h, w in headers:
-                html += f'<th style="width: {w};">{h}</th>'
-            html += '</tr>'
-
-            for _, row in report.iterrows():
-                html += '<tr>'
-                html += f'<td class="picker-name">{row["Name"]}</td>'
-
-                # Format values based on mode
-                requests_str = f"{row['display_requests']:.1f}" if is_average_mode else f"{int(row['display_requests'])}"
-
-                pct = (row['display_picking_time'].total_seconds() / max_time * 100) if max_time > 0 else 0
-                html += f'''<td class="progress-cell">
-                    <div class="progress-bar" style="width: {pct}%; background-color: #C65B5B;"></div>
-                    <div class="progress-text">{row["Picking Time Display"]}</div>
-                </td>'''
-
-                pct = (row['display_requests'] / max_requests * 100) if max_requests > 0 else 0
-                html += f'''<td class="progress-cell">
-                    <div class="progress-bar" style="width: {pct}%; background-color: #5B9BD5;"></div>
-                    <div class="progress-text">{requests_str}</div>
-                </td>'''
-
-                html += f'<td>{row["Requests per minute"]:.2f}</td>'
-
-                pct = (row['display_kg'] / max_kg * 100) if max_kg > 0 else 0
-                kg_formatted = f"{row['display_kg']:,.2f}"
-                html += f'''<td class="progress-cell">
-                    <div class="progress-bar" style="width: {pct}%; background-color: #FFC000;"></div>
-                    <div class="progress-text">{kg_formatted}</div>
-                </td>'''
-                
-                pct = (row['display_liters'] / max_l * 100) if max_l > 0 else 0
-                liters_formatted = f"{row['display_liters']:,.2f}"
-                html += f'''<td class="progress-cell">
-                    <div class="progress-bar" style="width: {pct}%; background-color: #70AD47;"></div>
-                    <div class="progress-text">{liters_formatted}</div>
-                </td>'''
-                
-                pct = (row['display_weight'] / max_weight * 100) if max_weight > 0 else 0
-                weight_formatted = f"{row['display_weight']:,.2f}"
-                html += f'''<td class="progress-cell">
-                    <div class="progress-bar" style="width: {pct}%; background-color: #9B59B6;"></div>
-                    <div class="progress-text">{weight_formatted}</div>
-                </td>'''
-
-                color = get_avg_color(row['Weight per min'])
-                html += f'<td style="background-color: {color}; font-weight: bold;">{row["Weight per min"]:,.2f}</td>'
-
-                html += '</tr>'
-
-            html += '</table>'
-
-            # Statistics section
-            total_picking_time = total_picking_time_no_overlap
-            total_requests_sum = report['Requests fulfilled'].sum()
-            total_minutes = total_picking_time.total_seconds() / 60
-            avg_requests_min = total_requests_sum / total_minutes if total_minutes > 0 else 0
-            total_kg = report['Kilograms'].sum()
-            total_l = report['Liters'].sum()
-            total_weight_sum = total_kg + total_l
-            weight_per_min = total_weight_sum / total_minutes if total_minutes > 0 else 0
-
-            # For date ranges with average mode, show average values
-            if is_average_mode:
-                display_picking_time_total = total_picking_time / num_days
-                total_picking_time_str = format_timedelta(display_picking_time_total)
-                display_requests_total = total_requests_sum / num_days
-                display_kg_total = total_kg / num_days
-                display_l_total = total_l / num_days
-                display_weight_total = total_weight_sum / num_days
-            else:
-                total_picking_time_str = format_timedelta(total_picking_time)
-                display_requests_total = total_requests_sum
-                display_kg_total = total_kg
-                display_l_total = total_l
-                display_weight_total = total_weight_sum
-
-            # Calculate picking finish time (always average for date ranges)
-            if num_days > 1:
-                daily_finish = day_df.groupby('Date')['Action completion'].max()
-                finish_times = daily_finish.apply(lambda x: x.hour * 3600 + x.minute * 60 + x.second)
-                avg_seconds = finish_times.mean()
-                avg_hours = int(avg_seconds // 3600)
-                avg_minutes_finish = int((avg_seconds % 3600) // 60)
-                avg_secs = int(avg_seconds % 60)
-                if avg_hours < 12:
-                    picking_finish_str = f"{avg_hours:02d}:{avg_minutes_finish:02d}:{avg_secs:02d} AM"
+                sort_by_col = sort_col_map.get(sort_col, 'Weight per min')
+                if sort_by_col == 'display_picking_time':
+                    report = report.sort_values(sort_by_col, ascending=sort_asc, key=lambda x: x.apply(lambda td: td.total_seconds())).reset_index(drop=True)
                 else:
-                    h = avg_hours if avg_hours <= 12 else avg_hours - 12
-                    picking_finish_str = f"{h:02d}:{avg_minutes_finish:02d}:{avg_secs:02d} PM"
-                picking_finish_summary_header = 'Avg Picking Finish'
-            else:
-                picking_finish = day_df['Action completion'].max()
-                picking_finish_str = picking_finish.strftime("%I:%M:%S %p") if pd.notna(picking_finish) else ""
-                picking_finish_summary_header = 'Picking Finish'
-
-            # Dynamic summary headers
-            if is_average_mode:
-                picking_time_summary_header = 'Avg Picking Time'
-                requests_summary_header = 'Avg Requests'
-                kg_summary_header = 'Avg Kg'
-                l_summary_header = 'Avg L'
-                weight_summary_header = 'Avg Weight'
-            else:
-                picking_time_summary_header = 'Total Picking Time'
-                requests_summary_header = 'Total Requests'
-                kg_summary_header = 'Total Kg'
-                l_summary_header = 'Total L'
-                weight_summary_header = 'Total Weight'
-
-            # Format request display
-            requests_total_str = f"{display_requests_total:.1f}" if is_average_mode else f"{int(display_requests_total)}"
-
-            html += f'''
-            <table class="stats-table" style="margin-top: 15px;">
-                <tr>
-                    <th>{picking_time_summary_header}</th>
-                    <th>{picking_finish_summary_header}</th>
-                    <th>{requests_summary_header}</th>
-                    <th>Avg Requests/min</th>
-                    <th>{kg_summary_header}</th>
-                    <th>{l_summary_header}</th>
-                    <th>{weight_summary_header}</th>
-                    <th>Weight/min</th>
-                </tr>
-                <tr>
-                    <td>{total_picking_time_str}</td>
-                    <td>{picking_finish_str}</td>
-                    <td>{requests_total_str}</td>
-                    <td>{avg_requests_min:.2f}</td>
-                    <td>{display_kg_total:,.2f}</td>
-                    <td>{display_l_total:,.2f}</td>
-                    <td>{display_weight_total:,.2f}</td>
-                    <td>{weight_per_min:.2f}</td>
-                </tr>
-            </table>
-            '''
-
+                    report = report.sort_values(sort_by_col, ascending=sort_asc).reset_index(drop=True)
             
-            st.markdown(html, unsafe_allow_html=True)
+                html = render_worker_report(report, (picking_time_header, requests_header, kg_header, liters_header, weight_header),
+                                            is_average_mode, num_days, total_picking_time_no_overlap, daily_totals['finish_seconds'])
             
+                st.markdown(html, unsafe_allow_html=True)
+            
+
+            show_worker_report(report)
+
             if st.button("🔄 Refresh Data"):
                 st.cache_data.clear()
                 st.rerun()
+
+        if date_type != "Live (Today)":
+            selected_file = next(f for f in files if f['name'].replace('.parquet', '') == selected_store)
+            validation = get_validation_summary(selected_file['download_url'])
+            validation = validation[validation.index.isin(selected_dates)]
+            validation.index = validation.index.strftime("%d/%m")
+            show_validation_panel(validation, "Date", exclude_invalid)
+        show_memory_panel()
     
     # ============== COMPARISON MODE ==============
     elif mode == "Comparison Mode":
 
-        if comparison_type == "Property vs Property":
-            # Data is already filtered to selected dates
-            # Calculate Kg and Liters
-            df1['Kg'] = df1.apply(calc_kg, axis=1)
-            df1['Liters'] = df1.apply(calc_l, axis=1)
-            df2['Kg'] = df2.apply(calc_kg, axis=1)
-            df2['Liters'] = df2.apply(calc_l, axis=1)
-
-            num_days = len(comparison_dates)
-            is_average_mode = aggregation_mode == "Average" and num_days > 1
-
-            # Calculate metrics for Property 1
-            unique_actions_1 = df1.groupby(['Name', 'Action Code']).agg({
-                'Action start': 'first',
-                'Action completion': 'first'
-            }).reset_index()
-            total_picking_time_1 = calculate_total_time_no_overlap(unique_actions_1)
-
-            # For date ranges, calculate average picking finish time per day
-            if len(comparison_dates) > 1:
-                daily_finish_1 = df1.groupby('Date')['Action completion'].max()
-                # Extract time of day and average it
-                finish_times_1 = daily_finish_1.apply(lambda x: x.hour * 3600 + x.minute * 60 + x.second)
-                avg_seconds_1 = finish_times_1.mean()
-                avg_hours_1 = int(avg_seconds_1 // 3600)
-                avg_minutes_1 = int((avg_seconds_1 % 3600) // 60)
-                avg_secs_1 = int(avg_seconds_1 % 60)
-                picking_finish_1 = pd.Timestamp(f"2000-01-01 {avg_hours_1:02d}:{avg_minutes_1:02d}:{avg_secs_1:02d}")
-            else:
-                picking_finish_1 = df1['Action completion'].max()
-
-            # Unique documents (orders) for the property on selected date
-            total_orders_1 = df1['Document'].nunique()
-            total_requests_1 = len(df1)
-            total_kg_1 = df1['Kg'].sum()
-            total_liters_1 = df1['Liters'].sum()
-            total_weight_1 = total_kg_1 + total_liters_1
-
-            # Calculate metrics for Property 2
-            unique_actions_2 = df2.groupby(['Name', 'Action Code']).agg({
-                'Action start': 'first',
-                'Action completion': 'first'
-            }).reset_index()
-            total_picking_time_2 = calculate_total_time_no_overlap(unique_actions_2)
-
-            # For date ranges, calculate average picking finish time per day
-            if len(comparison_dates) > 1:
-                daily_finish_2 = df2.groupby('Date')['Action completion'].max()
-                finish_times_2 = daily_finish_2.apply(lambda x: x.hour * 3600 + x.minute * 60 + x.second)
-                avg_seconds_2 = finish_times_2.mean()
-                avg_hours_2 = int(avg_seconds_2 // 3600)
-                avg_minutes_2 = int((avg_seconds_2 % 3600) // 60)
-                avg_secs_2 = int(avg_seconds_2 % 60)
-                picking_finish_2 = pd.Timestamp(f"2000-01-01 {avg_hours_2:02d}:{avg_minutes_2:02d}:{avg_secs_2:02d}")
-            else:
-                picking_finish_2 = df2['Action completion'].max()
-
-            # Unique documents (orders) for the property on selected date
-            total_orders_2 = df2['Document'].nunique()
-            total_requests_2 = len(df2)
-            total_kg_2 = df2['Kg'].sum()
-            total_liters_2 = df2['Liters'].sum()
-            total_weight_2 = total_kg_2 + total_liters_2
-
-            # Apply average mode if selected
-            if is_average_mode:
-                display_picking_time_1 = total_picking_time_1 / num_days
-                display_picking_time_2 = total_picking_time_2 / num_days
-                display_orders_1 = total_orders_1 / num_days
-                display_orders_2 = total_orders_2 / num_days
-                display_requests_1 = total_requests_1 / num_days
-                display_requests_2 = total_requests_2 / num_days
-                display_weight_1 = total_weight_1 / num_days
-                display_weight_2 = total_weight_2 / num_days
-            else:
-                display_picking_time_1 = total_picking_time_1
-                display_picking_time_2 = total_picking_time_2
-                display_orders_1 = total_orders_1
-                display_orders_2 = total_orders_2
-                display_requests_1 = total_requests_1
-                display_requests_2 = total_requests_2
-                display_weight_1 = total_weight_1
-                display_weight_2 = total_weight_2
-
-            # Format values
-            picking_time_str_1 = format_timedelta(display_picking_time_1)
-            picking_time_str_2 = format_timedelta(display_picking_time_2)
-            picking_finish_str_1 = picking_finish_1.strftime("%I:%M:%S %p") if pd.notna(picking_finish_1) else "N/A"
-            picking_finish_str_2 = picking_finish_2.strftime("%I:%M:%S %p") if pd.notna(picking_finish_2) else "N/A"
-
-            # Format orders and requests based on mode
+        num_days = len(comparison_dates)
+        is_average_mode = aggregation_mode == "Average" and num_days > 1
+
+        # Date range display and column headers
+        if len(comparison_dates) == 1:
+            date_display = comparison_dates[0].strftime("%d/%m/%Y")
+            picking_finish_header = "Picking Finish"
+            picking_time_header = "Total Picking Time"
+            orders_header = "# of Orders"
+            requests_header = "Item Requests"
+            weight_header = "Total Weight"
+        else:
+            date_display = f"{comparison_dates[0].strftime('%d/%m/%Y')} - {comparison_dates[-1].strftime('%d/%m/%Y')}"
+            picking_finish_header = "Avg Picking Finish"
             if is_average_mode:
-                orders_str_1 = f"{display_orders_1:,.1f}"
-                orders_str_2 = f"{display_orders_2:,.1f}"
-                requests_str_1 = f"{display_requests_1:,.1f}"
-                requests_str_2 = f"{display_requests_2:,.1f}"
+                picking_time_header = "Avg Picking Time"
+                orders_header = "Avg Orders"
+                requests_header = "Avg Requests"
+                weight_header = "Avg Weight"
             else:
-                orders_str_1 = f"{int(display_orders_1):,}"
-                orders_str_2 = f"{int(display_orders_2):,}"
-                requests_str_1 = f"{int(display_requests_1):,}"
-                requests_str_2 = f"{int(display_requests_2):,}"
-
-            # Date range display and column headers
-            if len(comparison_dates) == 1:
-                date_display = comparison_dates[0].strftime("%d/%m/%Y")
-                picking_finish_header = "Picking Finish"
                 picking_time_header = "Total Picking Time"
                 orders_header = "# of Orders"
                 requests_header = "Item Requests"
                 weight_header = "Total Weight"
+
+        comparison_headers = (picking_time_header, picking_finish_header, orders_header, requests_header, weight_header)
+
+        # Store summaries are computed once per load and reused on sort reruns
+        if 'summaries' not in st.session_state.comp_data_cache:
+            if execution_mode == "Progressive":
+                # Partial tables redraw in a fragment until every background load is done
+                show_progressive_comparison(comparison_type, date_display, comparison_headers,
+                                            compared_properties, num_days, is_average_mode)
+                st.stop()
+            elif execution_mode == "Process pool":
+                # Each store is decoded and summarized in a worker process from its
+                # memory-mapped file; only the small summary dicts come back
+                pool = get_process_pool()
+                futures = {
+                    pool.submit(summarize_store_file, path, comparison_dates, get_day_cutoffs().get(prop_name)): prop_name
+                    for prop_name, path in all_property_data.items()
+                }
+                progress = st.progress(0.0, text="Computing store summaries...")
+                finished = {}
+                for i, future in enumerate(as_completed(futures), start=1):
+                    finished[futures[future]] = future.result()
+                    progress.progress(i / len(futures), text=f"Computed {i} of {len(futures)} stores")
+                progress.empty()
+                summaries = {prop_name: finished[prop_name] for prop_name in all_property_data}
+            elif execution_mode == "Streaming":
+                # Record batches of every store folded into one mergeable aggregate
+                summaries = stream_property_summaries(all_property_data, comparison_dates, get_day_cutoffs())
+            elif execution_mode == "DuckDB":
+                # One SQL pass over all staged files; only the aggregates reach pandas
+                summaries = wms_duckdb.query_property_summaries(all_property_data, comparison_dates, get_day_cutoffs())
             else:
-                date_display = f"{comparison_dates[0].strftime('%d/%m/%Y')} - {comparison_dates[-1].strftime('%d/%m/%Y')}"
-                picking_finish_header = "Avg Picking Finish"
-                if is_average_mode:
-                    picking_time_header = "Avg Picking Time"
-                    orders_header = "Avg Orders"
-                    requests_header = "Avg Requests"
-                    weight_header = "Avg Weight"
-                else:
-                    picking_time_header = "Total Picking Time"
-                    orders_header = "# of Orders"
-                    requests_header = "Item Requests"
-                    weight_header = "Total Weight"
-
-            # Calculate percentages for bar charts (relative to max of the two)
-            max_picking_time = max(display_picking_time_1.total_seconds(), display_picking_time_2.total_seconds(), 1)
-            max_orders = max(display_orders_1, display_orders_2, 1)
-            max_requests = max(display_requests_1, display_requests_2, 1)
-            max_weight = max(display_weight_1, display_weight_2, 1)
-
-            pct_time_1 = (display_picking_time_1.total_seconds() / max_picking_time) * 100
-            pct_time_2 = (display_picking_time_2.total_seconds() / max_picking_time) * 100
-            pct_orders_1 = (display_orders_1 / max_orders) * 100
-            pct_orders_2 = (display_orders_2 / max_orders) * 100
-            pct_requests_1 = (display_requests_1 / max_requests) * 100
-            pct_requests_2 = (display_requests_2 / max_requests) * 100
-            pct_weight_1 = (display_weight_1 / max_weight) * 100
-            pct_weight_2 = (display_weight_2 / max_weight) * 100
-
-            # Build comparison HTML table
-            html = f'''
-            <style>
-                .comparison-title {{
-                    font-size: 18px;
-                    font-weight: bold;
-                    margin-bottom: 15px;
-                    color: #2F5496;
-                }}
-                .comparison-table {{
-                    border-collapse: collapse;
-                    width: auto;
-                    font-family: Arial, sans-serif;
-                    font-size: 14px;
-                }}
-                .comparison-table th {{
-                    background-color: #4472C4;
-                    color: white;
-                    padding: 12px 20px;
-                    text-align: center;
-                    border: 1px solid #2F5496;
-                }}
-                .comparison-table td {{
-                    padding: 0;
-                    border: 1px solid #B4C6E7;
-                    text-align: center;
-                    color: black;
-                    height: 40px;
-                }}
-                .comparison-table tr:nth-child(odd) td {{
-                    background-color: #EDEDED;
-                }}
-                .comparison-table tr:nth-child(even) td {{
-                    background-color: #D6DCE4;
-                }}
-                .property-name {{
-                    font-weight: bold;
-                    text-align: left !important;
-                    padding: 10px 15px !important;
-                }}
-                .progress-cell {{
-                    position: relative;
-                    padding: 0 !important;
-                    width: 140px;
-                }}
-                .progress-bar {{
-                    height: 100%;
-                    position: absolute;
-                    left: 0;
-                    top: 0;
-                }}
-                .progress-text {{
-                    position: relative;
-                    z-index: 1;
-                    padding: 10px;
-                    color: black;
-                }}
-            </style>
-
-            <div class="comparison-title">Property vs Property Comparison - {date_display}</div>
-
-            <table class="comparison-table">
-                <tr>
-                    <th style="width: 140px;">Property</th>
-                    <th style="width: 170px;">{picking_time_header}</th>
-                    <th style="width: 140px;">{picking_finish_header}</th>
-                    <th style="width: 140px;">{orders_header}</th>
-                    <th style="width: 140px;">{requests_header}</th>
-                    <th style="width: 140px;">{weight_header}</th>
-                </tr>
-                <tr>
-                    <td class="property-name">{property_1}</td>
-                    <td class="progress-cell">
-                        <div class="progress-bar" style="width: {pct_time_1}%; background-color: #6B9AC4;"></div>
-                        <div class="progress-text">{picking_time_str_1}</div>
-                    </td>
-                    <td style="padding: 10px;">{picking_finish_str_1}</td>
-                    <td class="progress-cell">
-                        <div class="progress-bar" style="width: {pct_orders_1}%; background-color: #6B9AC4;"></div>
-                        <div class="progress-text">{orders_str_1}</div>
-                    </td>
-                    <td class="progress-cell">
-                        <div class="progress-bar" style="width: {pct_requests_1}%; background-color: #6B9AC4;"></div>
-                        <div class="progress-text">{requests_str_1}</div>
-                    </td>
-                    <td class="progress-cell">
-                        <div class="progress-bar" style="width: {pct_weight_1}%; background-color: #6B9AC4;"></div>
-                        <div class="progress-text">{display_weight_1:,.2f}</div>
-                    </td>
-                </tr>
-                <tr>
-                    <td class="property-name">{property_2}</td>
-                    <td class="progress-cell">
-                        <div class="progress-bar" style="width: {pct_time_2}%; background-color: #97B8D6;"></div>
-                        <div class="progress-text">{picking_time_str_2}</div>
-                    </td>
-                    <td style="padding: 10px;">{picking_finish_str_2}</td>
-                    <td class="progress-cell">
-                        <div class="progress-bar" style="width: {pct_orders_2}%; background-color: #97B8D6;"></div>
-                        <div class="progress-text">{orders_str_2}</div>
-                    </td>
-                    <td class="progress-cell">
-                        <div class="progress-bar" style="width: {pct_requests_2}%; background-color: #97B8D6;"></div>
-                        <div class="progress-text">{requests_str_2}</div>
-                    </td>
-                    <td class="progress-cell">
-                        <div class="progress-bar" style="width: {pct_weight_2}%; background-color: #97B8D6;"></div>
-                        <div class="progress-text">{display_weight_2:,.2f}</div>
-                    </td>
-                </tr>
-            </table>
-            '''
+                # One grouped pass over the concatenated stores, whatever their number
+                comp_data = st.session_state.comp_data_cache
+                summaries = summarize_properties(comp_data['data'], num_days, comp_data['actions'], get_day_cutoffs())
+                summaries = {prop_name: summaries[prop_name] for prop_name in compared_properties}
+            st.session_state.comp_data_cache['summaries'] = summaries
+        summaries = st.session_state.comp_data_cache['summaries']
+
+        property_metrics = build_property_metrics(summaries, num_days, is_average_mode)
+
+        # Sorting and drawing run in a fragment: changing a sort control reruns only this part
+        @st.fragment
+        def show_comparison_report(property_metrics):
+            """Sort controls and the comparison table"""
+            # Property vs Property keeps the selection order; other comparisons are sortable
+            if comparison_type != "Property vs Property":
+                # Initialize sort state for multi-property comparisons
+                if 'allprop_sort_col' not in st.session_state:
+                    st.session_state.allprop_sort_col = weight_header
+                    st.session_state.allprop_sort_asc = False
+
+                # Sort controls
+                sort_options = [picking_time_header, picking_finish_header, orders_header, requests_header, weight_header]
+
+                # Reset sort column if it's not in current options (mode changed)
+                if st.session_state.allprop_sort_col not in sort_options:
+                    st.session_state.allprop_sort_col = weight_header
+
+                col_sort1, col_sort2, col_sort3 = st.columns([2, 2, 6])
+                with col_sort1:
+                    sort_col_display = st.selectbox(
+                        "Sort by",
+                        sort_options,
+                        index=sort_options.index(st.session_state.allprop_sort_col),
+                        key="allprop_sort_select"
+                    )
+                with col_sort2:
+                    sort_order = st.selectbox(
+                        "Order",
+                        ["Largest ↓", "Smallest ↑"],
+                        index=0 if not st.session_state.allprop_sort_asc else 1,
+                        key="allprop_sort_order"
+                    )
+
+                if sort_col_display != st.session_state.allprop_sort_col or (sort_order == "Smallest ↑") != st.session_state.allprop_sort_asc:
+                    st.session_state.allprop_sort_col = sort_col_display
+                    st.session_state.allprop_sort_asc = (sort_order == "Smallest ↑")
+
+                # Sort property_metrics
+                sort_key_map = {
+                    picking_time_header: lambda m: m['picking_time'].total_seconds(),
+                    # Elapsed seconds, not the clock: night-shift averages past 24 h sort after earlier finishes
+                    picking_finish_header: lambda m: (m['picking_finish'] - pd.Timestamp("2000-01-01")).total_seconds() if pd.notna(m['picking_finish']) else 0,
+                    orders_header: lambda m: m['orders'],
+                    requests_header: lambda m: m['requests'],
+                    weight_header: lambda m: m['weight']
+                }
+                sort_key = sort_key_map.get(st.session_state.allprop_sort_col, lambda m: m['weight'])
+                property_metrics = sorted(property_metrics, key=sort_key, reverse=not st.session_state.allprop_sort_asc)
 
+            html = render_comparison_table(comparison_type, date_display, comparison_headers, property_metrics, is_average_mode)
             st.markdown(html, unsafe_allow_html=True)
 
-            if st.button("🔄 Refresh Data"):
-                st.cache_data.clear()
-                st.rerun()
+        show_comparison_report(property_metrics)
 
-        elif comparison_type == "All Properties":
-            num_days = len(comparison_dates)
-            is_average_mode = aggregation_mode == "Average" and num_days > 1
+        validation = pd.DataFrame({
+            file_name: get_validation_summary(next(f for f in files if f['name'].replace('.parquet', '') == file_name)['download_url'])
+                .loc[lambda summary: summary.index.isin(comparison_dates)].sum()
+            for file_name in compared_properties
+        }).T
+        show_validation_panel(validation, "Property", exclude_invalid)
+        show_memory_panel()
 
-            # Date range display and column headers
-            if len(comparison_dates) == 1:
-                date_display = comparison_dates[0].strftime("%d/%m/%Y")
-                picking_finish_header = "Picking Finish"
-                picking_time_header = "Total Picking Time"
-                orders_header = "# of Orders"
-                requests_header = "Item Requests"
-                weight_header = "Total Weight"
-            else:
-                date_display = f"{comparison_dates[0].strftime('%d/%m/%Y')} - {comparison_dates[-1].strftime('%d/%m/%Y')}"
-                picking_finish_header = "Avg Picking Finish"
-                if is_average_mode:
-                    picking_time_header = "Avg Picking Time"
-                    orders_header = "Avg Orders"
-                    requests_header = "Avg Requests"
-                    weight_header = "Avg Weight"
-                else:
-                    picking_time_header = "Total Picking Time"
-                    orders_header = "# of Orders"
-                    requests_header = "Item Requests"
-                    weight_header = "Total Weight"
-
-            # Calculate metrics for all properties (data is already filtered)
-            property_metrics = []
-            for prop_name, df in all_property_data.items():
-                df['Kg'] = df.apply(calc_kg, axis=1)
-                df['Liters'] = df.apply(calc_l, axis=1)
-
-                unique_actions = df.groupby(['Name', 'Action Code']).agg({
-                    'Action start': 'first',
-                    'Action completion': 'first'
-                }).reset_index()
-
-                # For date ranges, calculate average picking finish time per day
-                if len(comparison_dates) > 1:
-                    daily_finish = df.groupby('Date')['Action completion'].max()
-                    finish_times = daily_finish.apply(lambda x: x.hour * 3600 + x.minute * 60 + x.second)
-                    avg_seconds = finish_times.mean()
-                    avg_hours = int(avg_seconds // 3600)
-                    avg_minutes = int((avg_seconds % 3600) // 60)
-                    avg_secs = int(avg_seconds % 60)
-                    picking_finish = pd.Timestamp(f"2000-01-01 {avg_hours:02d}:{avg_minutes:02d}:{avg_secs:02d}")
-                else:
-                    picking_finish = df['Action completion'].max()
+        if st.button("🔄 Refresh Data"):
+            st.cache_data.clear()
+            st.rerun()
 
-                total_picking_time = calculate_total_time_no_overlap(unique_actions)
-                total_orders = df['Document'].nunique()
-                total_requests = len(df)
-                total_weight = df['Kg'].sum() + df['Liters'].sum()
+    # ============== ANALYTICS MODE ==============
+    elif mode == "Analytics Mode":
 
-                # Apply average mode if selected
+        num_days = len(analytics_dates)
+        is_average_mode = analytics_aggregation_mode == "Average" and num_days > 1
+        if num_days == 1:
+            date_display = analytics_dates[0].strftime("%d/%m/%Y")
+        else:
+            date_display = f"{analytics_dates[0].strftime('%d/%m/%Y')} - {analytics_dates[-1].strftime('%d/%m/%Y')}"
+        store_display = "All Stores" if selected_store == "All Stores" else selected_store
+
+        # ============== HOURLY HEATMAP ==============
+        if analysis_type == "Hourly Heatmap":
+
+            # Heatmap controls run in a fragment: changing them reruns only this part
+            @st.fragment
+            def show_activity_heatmap():
+                """Rows / metric / bucket controls and the heatmap"""
+                col_rows, col_metric, col_bucket, col_heat_empty = st.columns([165, 165, 165, 785])
+                with col_rows:
+                    heatmap_rows = st.selectbox("👥 Rows", ["Worker", "Cost Center", "Store"], index=0, key="heatmap_rows")
+                with col_metric:
+                    heatmap_metric = st.selectbox("📏 Metric", list(ACTIVITY_METRICS), index=0, key="heatmap_metric")
+                with col_bucket:
+                    bucket_minutes = st.selectbox("⏱️ Bucket", [60, 15], index=0, key="heatmap_bucket",
+                                                  format_func=lambda m: "1 hour" if m == 60 else f"{m} min")
+
+                # Per-store cubes are cached per file version; a range or store set is a filter and a pivot
+                with st.spinner("Binning actions..."):
+                    cubes = {name: get_store_activity(store_ids[name], bucket_minutes, exclude_invalid) for name in analytics_stores}
+                by = {'Worker': 'Name', 'Cost Center': 'Cost Center', 'Store': 'Store'}[heatmap_rows]
+                heat = query_activity(cubes, analytics_dates, by, ACTIVITY_METRICS[heatmap_metric])
+                if heat.empty:
+                    st.info("No completed actions in the selected dates")
+                    return
                 if is_average_mode:
-                    display_picking_time = total_picking_time / num_days
-                    display_orders = total_orders / num_days
-                    display_requests = total_requests / num_days
-                    display_weight = total_weight / num_days
-                else:
-                    display_picking_time = total_picking_time
-                    display_orders = total_orders
-                    display_requests = total_requests
-                    display_weight = total_weight
-
-                property_metrics.append({
-                    'name': prop_name,
-                    'picking_time': display_picking_time,
-                    'picking_finish': picking_finish,
-                    'orders': display_orders,
-                    'requests': display_requests,
-                    'weight': display_weight
-                })
-
-            # Calculate max values for bar percentages
-            max_time = max((m['picking_time'].total_seconds() for m in property_metrics), default=1) or 1
-            max_orders = max((m['orders'] for m in property_metrics), default=1) or 1
-            max_requests = max((m['requests'] for m in property_metrics), default=1) or 1
-            max_weight = max((m['weight'] for m in property_metrics), default=1) or 1
-
-            # Initialize sort state for all properties comparison
-            if 'allprop_sort_col' not in st.session_state:
-                st.session_state.allprop_sort_col = weight_header
-                st.session_state.allprop_sort_asc = False
-
-            # Sort controls
-            sort_options = [picking_time_header, picking_finish_header, orders_header, requests_header, weight_header]
-
-            # Reset sort column if it's not in current options (mode changed)
-            if st.session_state.allprop_sort_col not in sort_options:
-                st.session_state.allprop_sort_col = weight_header
-
-            col_sort1, col_sort2, col_sort3 = st.columns([2, 2, 6])
-            with col_sort1:
-                sort_col_display = st.selectbox(
-                    "Sort by",
-                    sort_options,
-                    index=sort_options.index(st.session_state.allprop_sort_col),
-                    key="allprop_sort_select"
-                )
-            with col_sort2:
-                sort_order = st.selectbox(
-                    "Order",
-                    ["Largest ↓", "Smallest ↑"],
-                    index=0 if not st.session_state.allprop_sort_asc else 1,
-                    key="allprop_sort_order"
-                )
-
-            if sort_col_display != st.session_state.allprop_sort_col or (sort_order == "Smallest ↑") != st.session_state.allprop_sort_asc:
-                st.session_state.allprop_sort_col = sort_col_display
-                st.session_state.allprop_sort_asc = (sort_order == "Smallest ↑")
-                st.rerun()
-
-            # Sort property_metrics
-            sort_key_map = {
-                picking_time_header: lambda m: m['picking_time'].total_seconds(),
-                picking_finish_header: lambda m: m['picking_finish'].hour * 3600 + m['picking_finish'].minute * 60 + m['picking_finish'].second if pd.notna(m['picking_finish']) else 0,
-                orders_header: lambda m: m['orders'],
-                requests_header: lambda m: m['requests'],
-                weight_header: lambda m: m['weight']
-            }
-            sort_key = sort_key_map.get(st.session_state.allprop_sort_col, lambda m: m['weight'])
-            property_metrics = sorted(property_metrics, key=sort_key, reverse=not st.session_state.allprop_sort_asc)
-
-            # Build rows
-            rows = []
-            for m in property_metrics:
-                pct_time = (m['picking_time'].total_seconds() / max_time) * 100
-                pct_orders = (m['orders'] / max_orders) * 100
-                pct_requests = (m['requests'] / max_requests) * 100
-                pct_weight = (m['weight'] / max_weight) * 100
-                time_str = format_timedelta(m['picking_time'])
-                finish_str = m['picking_finish'].strftime("%I:%M:%S %p") if pd.notna(m['picking_finish']) else "N/A"
-
-                # Format numbers based on mode
-                orders_str = f"{m['orders']:,.1f}" if is_average_mode else f"{int(m['orders']):,}"
-                requests_str = f"{m['requests']:,.1f}" if is_average_mode else f"{int(m['requests']):,}"
-
-                rows.append(f'''<tr>
-                    <td class="property-name">{m['name']}</td>
-                    <td class="progress-cell"><div class="progress-bar" style="width: {pct_time}%; background-color: #6B9AC4;"></div><div class="progress-text">{time_str}</div></td>
-                    <td style="padding: 10px;">{finish_str}</td>
-                    <td class="progress-cell"><div class="progress-bar" style="width: {pct_orders}%; background-color: #6B9AC4;"></div><div class="progress-text">{orders_str}</div></td>
-                    <td class="progress-cell"><div class="progress-bar" style="width: {pct_requests}%; background-color: #6B9AC4;"></div><div class="progress-text">{requests_str}</div></td>
-                    <td class="progress-cell"><div class="progress-bar" style="width: {pct_weight}%; background-color: #6B9AC4;"></div><div class="progress-text">{m['weight']:,.2f}</div></td>
-                </tr>''')
-
-            html = '''
-            <style>
-                .comparison-title { font-size: 18px; font-weight: bold; margin-bottom: 15px; color: #2F5496; }
-                .comparison-table { border-collapse: collapse; width: auto; font-family: Arial, sans-serif; font-size: 14px; }
-                .comparison-table th { background-color: #4472C4; color: white; padding: 12px 20px; text-align: center; border: 1px solid #2F5496; }
-                .comparison-table td { padding: 0; border: 1px solid #B4C6E7; text-align: center; color: black; height: 40px; }
-                .comparison-table tr:nth-child(odd) td { background-color: #EDEDED; }
-                .comparison-table tr:nth-child(even) td { background-color: #D6DCE4; }
-                .property-name { font-weight: bold; text-align: left !important; padding: 10px 15px !important; }
-                .progress-cell { position: relative; padding: 0 !important; width: 140px; }
-                .progress-bar { height: 100%; position: absolute; left: 0; top: 0; }
-                .progress-text { position: relative; z-index: 1; padding: 10px; color: black; }
-            </style>
-            <div class="comparison-title">All Properties Comparison - ''' + date_display + '''</div>
-            <table class="comparison-table">
-                <tr>
-                    <th style="width: 140px;">Property</th>
-                    <th style="width: 170px;">''' + picking_time_header + '''</th>
-                    <th style="width: 140px;">''' + picking_finish_header + '''</th>
-                    <th style="width: 140px;">''' + orders_header + '''</th>
-                    <th style="width: 140px;">''' + requests_header + '''</th>
-                    <th style="width: 140px;">''' + weight_header + '''</th>
-                </tr>''' + ''.join(rows) + '''
-            </table>
-            '''
+                    heat = heat / num_days
+
+                title = f"{'Avg ' if is_average_mode else ''}{heatmap_metric} per {'hour' if bucket_minutes == 60 else f'{bucket_minutes} min'} - {store_display} - {date_display}"
+                st.markdown(render_activity_heatmap(title, heat, bucket_minutes, heatmap_metric, heatmap_rows), unsafe_allow_html=True)
+
+            show_activity_heatmap()
+
+        # ============== ORDER CYCLE TIMES ==============
+        elif analysis_type == "Order Cycle Times":
+
+            @st.fragment
+            def show_cycle_times():
+                """Rows control and the percentile table"""
+                col_rows, col_cycle_empty = st.columns([165, 1115])
+                with col_rows:
+                    cycle_rows = st.selectbox("👥 Rows", ["Cost Center", "Store"], index=0, key="cycle_rows")
+
+                # Percentiles come from merging per-day sketches, never from re-sorting the orders
+                with st.spinner("Loading order sketches..."):
+                    sketches = {name: get_store_cycle_sketches(store_ids[name], exclude_invalid) for name in analytics_stores}
+                quantiles = query_cycle_quantiles(sketches, analytics_dates, cycle_rows)
+                if quantiles.empty:
+                    st.info("No completed orders in the selected dates")
+                    return
+
+                title = f"Order Cycle Times - {store_display} - {date_display}"
+                st.markdown(render_cycle_time_table(title, quantiles, cycle_rows), unsafe_allow_html=True)
+                st.caption("Cycle time runs from an order's first action start to its last completion; "
+                           "orders are dated by their first line, and percentiles are within 1%.")
+
+            show_cycle_times()
+
+        # ============== ITEM VELOCITY ==============
+        elif analysis_type == "Item Velocity":
+
+            @st.fragment
+            def show_item_velocity():
+                """Ranking controls and the top-items table"""
+                col_rank, col_top, col_items_empty = st.columns([165, 165, 950])
+                with col_rank:
+                    rank_by = st.selectbox("🏆 Rank by", list(ITEM_METRICS), index=0, key="items_rank_by")
+                with col_top:
+                    top_n = st.selectbox("🔢 Top", [10, 25, 50, 100], index=1, key="items_top_n")
+
+                # Rankings merge per-day item aggregates; no line items are re-read
+                with st.spinner("Loading item aggregates..."):
+                    aggregates = {name: get_store_items(store_ids[name], exclude_invalid) for name in analytics_stores}
+                top_items = query_top_items(aggregates, analytics_dates, ITEM_METRICS[rank_by], top_n)
+                if top_items.empty:
+                    st.info("No item requests in the selected dates")
+                    return
+
+                title = f"Top {top_n} Items by {rank_by} - {store_display} - {date_display}"
+                st.markdown(render_item_table(title, top_items, rank_by, num_days if is_average_mode else 1), unsafe_allow_html=True)
+
+            show_item_velocity()
+
+        # ============== WORKER LEADERBOARD ==============
+        elif analysis_type == "Worker Leaderboard":
+
+            @st.fragment
+            def show_worker_leaderboard():
+                """Ranking and paging controls and one page of the cross-store leaderboard"""
+                col_rank, col_order, col_min, col_size, col_page, col_board_empty = st.columns([165, 130, 165, 130, 130, 560])
+                with col_rank:
+                    rank_by = st.selectbox("🏆 Rank by", list(LEADERBOARD_METRICS), index=0, key="leaderboard_rank_by")
+                with col_order:
+                    order = st.selectbox("↕️ Order", ["Top", "Bottom"], index=0, key="leaderboard_order")
+                with col_min:
+                    # Rates over a few minutes of work are noise; keep them off the board
+                    min_minutes = st.selectbox("⏳ Min Picking Time", [0, 30, 60, 240], index=1, key="leaderboard_min_minutes",
+                                               format_func=lambda m: "None" if m == 0 else f"{m} min" if m < 60 else f"{m // 60} h")
+                with col_size:
+                    page_size = st.selectbox("🔢 Per Page", [10, 25, 50], index=1, key="leaderboard_page_size")
+
+                # Each store's worker totals come from its cached rollups; merging them is a groupby on the name key
+                with st.spinner("Merging worker totals..."):
+                    reports = {
+                        name: slice_cube(query_rollups(get_store_rollups(store_ids[name], "pandas", exclude_invalid),
+                                                       analytics_dates[0], analytics_dates[-1])[0], 'Name')
+                        for name in analytics_stores
+                    }
+                board = merge_worker_reports(reports)
+                board = board[board['picking_minutes'] >= min_minutes].reset_index(drop=True)
+                if board.empty:
+                    st.info("No workers with enough picking time in the selected dates")
+                    return
+
+                num_pages = -(-len(board) // page_size)
+                with col_page:
+                    page_number = st.selectbox("📄 Page", range(1, num_pages + 1), index=0, key="leaderboard_page")
+                first = (page_number - 1) * page_size
+                # Only the requested page is sorted; the rest of the network stays unordered
+                values = board[LEADERBOARD_METRICS[rank_by]].to_numpy()
+                page = board.iloc[rank_slice(values, first, first + page_size, ascending=order == "Bottom")]
+
+                divisor = num_days if is_average_mode else 1
+                title = f"{order} Workers by {rank_by} - {store_display} - {date_display}"
+                st.markdown(render_worker_leaderboard(title, page, first + 1, rank_by, values.max(), divisor), unsafe_allow_html=True)
+                st.caption(f"Ranks {first + 1}-{first + len(page)} of {len(board):,} workers. Workers are matched across stores by name, "
+                           "ignoring case, accents and spacing; rates use their summed picking time.")
+
+            show_worker_leaderboard()
 
-            st.markdown(html, unsafe_allow_html=True)
-
-            if st.button("🔄 Refresh Data"):
-                st.cache_data.clear()
-                st.rerun()
-        
 except Exception as e:
     st.error(f"Error loading data: {e}")
     st.info("Make sure the Google Sheet is shared as 'Anyone with the link can view'")
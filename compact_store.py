@@ -0,0 +1,155 @@
+"""Rewrite store files with another parquet layout, comparing size and read times before and after.
+
+Usage: python compact_store.py parquet_uploads/IAN.parquet [...] [--codec zstd] [--level N] [--dictionary auto|all|none]
+       [--sort-by "Date,Cost Center,Name"] [--row-group-size ROWS] [--out-dir compacted | --in-place] [--repeat 5]
+
+Each file is rewritten with the given codec, dictionary encoding, sort keys
+(only those present in the file; rows keep their order within equal keys)
+and row group size. Each rewrite is timed against the original:
+- full decode, as the report's first load of a store does
+- a single-date filtered read (the middle date), which skips row groups
+  whose Date statistics rule it out
+
+Every rewrite is checked by building the report's daily rollups from both
+files (normalized pairs are joined with their original partner table), in
+case a layout change alters the report. A file whose numbers change is not
+written unless --allow-changes is given.
+"""
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from wms_engine import (
+    CATEGORY_MAX_SHARE, add_weight_columns, arrow_to_frame, build_daily_rollups, read_normalized_frame, read_store_dates,
+    read_store_frame
+)
+
+CODECS = ["zstd", "snappy", "lz4", "gzip", "none"]
+
+def dictionary_columns(table, mode):
+    """use_dictionary argument: every column, none, or ('auto') all but mostly-distinct text columns"""
+    if mode != "auto":
+        return mode == "all"
+    return [
+        field.name for field in table.schema
+        if not pa.types.is_string(field.type) or pc.count_distinct(table[field.name]).as_py() <= CATEGORY_MAX_SHARE * len(table)
+    ]
+
+def rewrite_table(path, out_path, codec="zstd", level=None, dictionary="auto", sort_by=(), row_group_size=None):
+    """Write `path` with the given layout to `out_path`"""
+    table = pq.read_table(path)
+    keys = [key for key in sort_by if key in table.column_names]
+    if keys:
+        # Arrow's sort is stable, so lines of equal keys keep their file order
+        table = table.take(pc.sort_indices(table, sort_keys=[(key, "ascending") for key in keys]))
+    pq.write_table(table, out_path, compression=codec, compression_level=level,
+                   use_dictionary=dictionary_columns(table, dictionary), row_group_size=row_group_size)
+
+def partner_path(path):
+    """The other table of a normalized pair, None for single-file stores"""
+    for suffix, other in ((".lines.parquet", ".actions.parquet"), (".actions.parquet", ".lines.parquet")):
+        if path.endswith(suffix):
+            return path[:-len(suffix)] + other
+    return None
+
+def report_rollups(path, actions_path=None):
+    """Daily rollups the report builds from a store file, or from a lines table and its actions table"""
+    if actions_path is None:
+        df, actions = read_store_frame(path), None
+    else:
+        df, actions = read_normalized_frame(path, actions_path)
+    add_weight_columns(df)
+    return build_daily_rollups(df, actions)
+
+def same_report(before, after):
+    """Whether two rollups give the same numbers for every date range, cost center and worker"""
+    # Orders are reported per cost center, so which worker's line came first does not matter
+    def by_cost_center(rollups):
+        cells = rollups["cells"]
+        return pd.concat([cells.drop(columns="orders", level=0),
+                          cells["orders"].T.groupby(level="Cost Center").sum().T.add_prefix("orders ")], axis=1)
+    for a, b in ((by_cost_center(before), by_cost_center(after)), (before["store"], after["store"])):
+        if not (a.index.equals(b.index) and a.columns.equals(b.columns)):
+            return False
+        if not np.allclose(a.to_numpy(dtype=float), b.to_numpy(dtype=float), rtol=1e-9, atol=1e-6):
+            return False
+    for part, columns in (("documents", ['Date', 'Cost Center', 'Document']),
+                          ("intervals", ['Date', 'Action start', 'Action completion'])):
+        a, b = (rollups[part][columns].astype(str).sort_values(columns, ignore_index=True) for rollups in (before, after))
+        if not a.equals(b):
+            return False
+    return True
+
+def benchmark(path, repeat=5):
+    """Size, best full-decode and single-date read times (seconds), and row group count of a file"""
+    def best(read):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            read()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    metadata = pq.ParquetFile(path).metadata
+    result = {'size': os.path.getsize(path), 'decode': best(lambda: read_store_frame(path)), 'one_date': None,
+              'row_groups': metadata.num_row_groups}
+    date_field = metadata.schema.to_arrow_schema().field('Date') if 'Date' in metadata.schema.names else None
+    if date_field is not None:
+        dates = read_store_dates(path)
+        day = dates[len(dates) // 2]
+        value = day.date() if pa.types.is_date(date_field.type) else day
+        result['one_date'] = best(lambda: arrow_to_frame(pq.read_table(path, filters=[('Date', '==', value)])))
+    return result
+
+def format_benchmark(label, result):
+    one_date = f"{result['one_date'] * 1000:>9.1f} ms" if result['one_date'] is not None else f"{'-':>12}"
+    return f"  {label:<7}{result['size']:>12,} B{result['decode'] * 1000:>9.1f} ms{one_date}{result['row_groups']:>8}"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="store parquet files (single files or .actions/.lines tables)")
+    parser.add_argument("--codec", choices=CODECS, default="zstd", help="compression codec (default: zstd)")
+    parser.add_argument("--level", type=int, help="codec compression level (default: the codec's own)")
+    parser.add_argument("--dictionary", choices=["auto", "all", "none"], default="auto",
+                        help="dictionary-encode all but mostly-distinct text columns (auto), every column, or none")
+    parser.add_argument("--sort-by", default="", help="comma-separated sort keys (default: keep file order)")
+    parser.add_argument("--row-group-size", type=int, help="rows per row group (default: pyarrow's)")
+    parser.add_argument("--out-dir", default="compacted", help="output folder (default: compacted)")
+    parser.add_argument("--in-place", action="store_true", help="replace the input files")
+    parser.add_argument("--allow-changes", action="store_true", help="write files even when the report numbers change")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs per read; the best is shown (default: 5)")
+    args = parser.parse_args()
+
+    sort_by = [key.strip() for key in args.sort_by.split(",") if key.strip()]
+    codec = None if args.codec == "none" else args.codec
+    if not args.in_place:
+        os.makedirs(args.out_dir, exist_ok=True)
+    print(f"  {'':<7}{'size':>14}{'decode':>12}{'one date':>12}{'groups':>8}")
+    for path in args.paths:
+        out_path = path if args.in_place else os.path.join(args.out_dir, os.path.basename(path))
+        tmp_path = out_path + ".tmp"
+        rewrite_table(path, tmp_path, codec, args.level, args.dictionary, sort_by, args.row_group_size)
+
+        partner = partner_path(path)
+        if partner is None:
+            preserved = same_report(report_rollups(path), report_rollups(tmp_path))
+        elif path.endswith(".lines.parquet"):
+            preserved = same_report(report_rollups(path, partner), report_rollups(tmp_path, partner))
+        else:
+            preserved = same_report(report_rollups(partner, path), report_rollups(partner, tmp_path))
+        print(os.path.basename(path))
+        print(format_benchmark("before", benchmark(path, args.repeat)))
+        print(format_benchmark("after", benchmark(tmp_path, args.repeat)))
+        if preserved or args.allow_changes:
+            os.replace(tmp_path, out_path)
+            print(f"  -> {out_path}" + ("" if preserved else " (report numbers changed)"))
+        else:
+            os.remove(tmp_path)
+            print("  not written: the new layout changes report numbers (see --allow-changes)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""Write synthetic store files with distributions learned from real ones, for scale and load tests.
+
+Usage: python generate_store.py parquet_uploads/*.parquet --scale 10 [--stores 6] [--days 90] [--seed 1] [--out-dir synthetic]
+
+Each synthetic store follows the profile of one template file (round robin
+over the inputs): documents per calendar day, cost centers, actions per
+document and how often one worker does all of them, worker shares, action
+durations, the worker's first start of the day and the gaps between their
+consecutive actions (negative gaps are overlaps). Busy days start earlier
+and have shorter gaps, so both are drawn from template days with a similar
+number of actions.
+Each action's line items are copied whole from a template action (item,
+quantity, unit, reporting unit and Relationship together), so the unit mix,
+weight conversions and lines per action stay consistent. --scale multiplies
+both documents and workers, keeping the per-worker load and overlaps of the
+template. Output is a typed single-file store written day chunk by day
+chunk, so memory stays flat at any size; run normalize_store.py on it for
+the actions / lines layout. The same seed always writes the same files.
+"""
+import argparse
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from wms_engine import STORE_COLUMNS, TEMPORAL_COLUMNS, arrow_to_frame, conform_store_table
+
+NS_PER_SECOND = 10**9
+NS_PER_DAY = 86400 * NS_PER_SECOND
+
+# Line item columns drawn together from the template
+ITEM_COLUMNS = ['Code', 'Description', 'Quantity', 'Unit', 'Reporting Unit', 'Relationship']
+
+# Days generated per row group
+CHUNK_DAYS = 14
+
+def _number_prefix(values, default):
+    """Most common text before the trailing number of codes such as 'SMOV-28724'"""
+    prefixes = values.str.extract(r'^(.*?)\d+$')[0].dropna()
+    return prefixes.mode()[0] if len(prefixes) else default
+
+def learn_profile(path):
+    """Empirical distributions of one store file, sampled from when generating"""
+    table = conform_store_table(pq.read_table(path))
+    df = arrow_to_frame(table)
+    actions = df.drop_duplicates('Action Code')
+    documents = actions.groupby(['Cost Center', 'Document'], sort=False)
+    completed = actions.dropna(subset=['Action completion'])
+
+    # A worker's day is a chain of actions; the gap runs from one completion to the next start
+    chains = completed.sort_values(['Name', 'Action start'])
+    chain_groups = chains.groupby(['Name', 'Date'])
+    gaps = (chains['Action start'] - chain_groups['Action completion'].shift()).to_numpy('int64')
+    has_gap = ~chain_groups.cumcount().eq(0).to_numpy()
+    gap_bins = _chain_bins(chain_groups['Action start'].transform('size').to_numpy())
+    first_starts = (chain_groups['Action start'].min() - chain_groups['Date'].first()).to_numpy('int64')
+    first_start_bins = _chain_bins(chain_groups.size().to_numpy())
+
+    # Line items grouped into blocks, one per action
+    codes = table['Action Code'].to_numpy(zero_copy_only=False)
+    line_order = np.argsort(codes, kind='stable')
+    _, block_sizes = np.unique(codes[line_order], return_counts=True)
+
+    days = pd.date_range(df['Date'].min(), df['Date'].max())
+    first_lines = actions.drop_duplicates(['Cost Center', 'Document'])
+    workers_per_doc = documents['Name'].nunique()[documents.size() > 1]
+    statuses = actions.groupby(actions['Action completion'].isna())['Status'].agg(lambda s: s.mode()[0])
+    return {
+        'start_date': days[0],
+        'docs_per_day': first_lines['Date'].value_counts().reindex(days, fill_value=0).to_numpy(),
+        'cost_centers': first_lines['Cost Center'].value_counts(),
+        'actions_per_doc': documents.size().to_numpy(),
+        'same_worker_share': float((workers_per_doc == 1).mean()) if len(workers_per_doc) else 1.0,
+        'workers': actions['Name'].value_counts(),
+        'durations': (completed['Action completion'] - completed['Action start']).to_numpy('int64'),
+        'gaps': {b: gaps[has_gap & (gap_bins == b)] for b in np.unique(gap_bins[has_gap])},
+        'first_starts': {b: first_starts[first_start_bins == b] for b in np.unique(first_start_bins)},
+        'open_share': float(actions['Action completion'].isna().mean()),
+        'status': statuses.get(False, statuses.iloc[0]),
+        'open_status': statuses.get(True, statuses.iloc[0]),
+        'action_description': actions['Action Description'].mode()[0],
+        'action_prefix': _number_prefix(actions['Action Code'], 'SMOV-'),
+        'document_prefix': _number_prefix(actions['Document'], 'DOC-'),
+        'items': table.select(ITEM_COLUMNS).take(line_order),
+        'item_blocks': np.cumsum(block_sizes) - block_sizes,
+        'item_block_sizes': block_sizes,
+        'schema': table.schema
+    }
+
+def _chain_bins(lengths):
+    """Size class of a worker's day by its number of actions: 1, 2-3, 4-7, ..."""
+    return np.floor(np.log2(lengths)).astype('int64')
+
+def _draw_by_chain_size(rng, samples, chain_lengths):
+    """One value per action, from template days of the nearest size class at or below its chain's"""
+    available = np.array(sorted(samples))
+    wanted = _chain_bins(chain_lengths)
+    bins = available[np.maximum(np.searchsorted(available, wanted, side='right') - 1, 0)]
+    result = np.zeros(len(chain_lengths), dtype='int64')
+    for b in np.unique(bins):
+        result[bins == b] = _draw(rng, samples[b], int((bins == b).sum()))
+    return result
+
+def _draw(rng, values, size, weights=None):
+    return rng.choice(values, size, p=None if weights is None else weights / weights.sum())
+
+def _numbered(prefix, first, count):
+    return pc.binary_join_element_wise(prefix, pa.array(np.arange(first, first + count)).cast(pa.string()), '')
+
+def _generate_chunk(profile, rng, day_offsets, scale, worker_names, counters):
+    """Line items of the given days (offsets from the start date) as a store-schema table"""
+    base = _draw(rng, profile['docs_per_day'], len(day_offsets))
+    # Stochastic rounding keeps fractional scales unbiased
+    docs_per_day = np.floor(base * scale + rng.random(len(day_offsets))).astype('int64')
+    doc_day = np.repeat(day_offsets, docs_per_day)
+    num_docs = len(doc_day)
+    if num_docs == 0:
+        return None
+    cost_centers = profile['cost_centers']
+    doc_cost_center = _draw(rng, np.arange(len(cost_centers)), num_docs, cost_centers.to_numpy())
+
+    # Actions: each document's actions, with one worker for all of them or one per action
+    actions_per_doc = _draw(rng, profile['actions_per_doc'], num_docs)
+    action_doc = np.repeat(np.arange(num_docs), actions_per_doc)
+    num_actions = len(action_doc)
+    workers = profile['workers']
+    clones = len(worker_names) // len(workers)
+    draw_worker = lambda size: _draw(rng, np.arange(len(workers)), size, workers.to_numpy()) * clones + rng.integers(clones, size=size)
+    doc_worker = draw_worker(num_docs)
+    action_worker = np.where(rng.random(num_actions) < profile['same_worker_share'], doc_worker[action_doc], draw_worker(num_actions))
+
+    # Timing: every worker's day is a chain of actions in document order
+    order = np.lexsort((action_doc, action_worker, doc_day[action_doc]))
+    action_doc, action_worker = action_doc[order], action_worker[order]
+    action_day = doc_day[action_doc]
+    duration = _draw(rng, profile['durations'], num_actions)
+    chain_start = np.concatenate([[True], (action_day[1:] != action_day[:-1]) | (action_worker[1:] != action_worker[:-1])])
+    chain_ids = np.cumsum(chain_start) - 1
+    chain_lengths = np.bincount(chain_ids)[chain_ids]
+    step = np.where(chain_start, _draw_by_chain_size(rng, profile['first_starts'], chain_lengths),
+                    np.concatenate([[0], duration[:-1]]) + _draw_by_chain_size(rng, profile['gaps'], chain_lengths))
+    elapsed = np.cumsum(step)
+    offset = np.maximum(elapsed - (elapsed - step)[chain_start][chain_ids], 0)
+    start = profile['start_date'].value + action_day * NS_PER_DAY + offset
+    is_open = rng.random(num_actions) < profile['open_share']
+    completion = np.where(is_open, np.iinfo('int64').min, start + duration)
+
+    # Lines: the line items of a random template action each, repeated action columns
+    block = rng.integers(len(profile['item_blocks']), size=num_actions)
+    lines_per_action = profile['item_block_sizes'][block]
+    line_action = np.repeat(np.arange(num_actions), lines_per_action)
+    position = np.arange(len(line_action)) - np.repeat(np.cumsum(lines_per_action) - lines_per_action, lines_per_action)
+    items = profile['items'].take(profile['item_blocks'][block][line_action] + position)
+    line_doc = action_doc[line_action]
+    action_codes = _numbered(profile['action_prefix'], counters['actions'], num_actions).take(line_action)
+    documents = _numbered(profile['document_prefix'], counters['documents'], num_docs).take(line_doc)
+    counters['actions'] += num_actions
+    counters['documents'] += num_docs
+
+    start_ns = start[line_action]
+    columns = {
+        'Date': pa.array(start_ns - start_ns % NS_PER_DAY, pa.timestamp('ns')),
+        'Status': pa.array(np.where(is_open, profile['open_status'], profile['status'])[line_action]),
+        'Action Code': action_codes,
+        'Action start': pa.array(start_ns, pa.timestamp('ns')),
+        'Action completion': pa.array(completion[line_action], pa.timestamp('ns'), mask=is_open[line_action]),
+        'Action Description': pa.array(np.full(len(line_action), profile['action_description'])),
+        'Name': pa.array(worker_names[action_worker[line_action]]),
+        'Cost Center': pa.array(cost_centers.index.to_numpy()[doc_cost_center[line_doc]]),
+        'Document': documents
+    }
+    columns.update({column: items[column] for column in ITEM_COLUMNS})
+    table = pa.table({column: columns[column] for column in STORE_COLUMNS})
+    return conform_store_table(table).cast(_output_schema(profile))
+
+def _output_schema(profile):
+    schema = profile['schema']
+    for column, column_type in TEMPORAL_COLUMNS.items():
+        schema = schema.set(schema.get_field_index(column), pa.field(column, column_type))
+    return pa.schema([schema.field(column) for column in STORE_COLUMNS])
+
+def generate_store(profile, path, scale=1.0, days=None, seed=0):
+    """Write one synthetic store file; returns (lines, actions) written"""
+    rng = np.random.default_rng(seed)
+    days = days or len(profile['docs_per_day'])
+    clones = max(1, round(scale))
+    worker_names = np.array([name if clone == 0 else f"{name} {clone + 1}"
+                             for name in profile['workers'].index for clone in range(clones)], dtype=object)
+    counters = {'actions': 1, 'documents': 1}
+    tmp_path = path + ".tmp"
+    lines = 0
+    with pq.ParquetWriter(tmp_path, _output_schema(profile)) as writer:
+        for first_day in range(0, days, CHUNK_DAYS):
+            table = _generate_chunk(profile, rng, np.arange(first_day, min(first_day + CHUNK_DAYS, days)), scale, worker_names, counters)
+            if table is not None:
+                writer.write_table(table)
+                lines += table.num_rows
+    os.replace(tmp_path, path)
+    return lines, counters['actions'] - 1
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("templates", nargs="+", help="real store parquet files to learn from")
+    parser.add_argument("--scale", type=float, default=1.0, help="documents and workers relative to the template (default 1)")
+    parser.add_argument("--stores", type=int, help="number of stores to write (default: one per template)")
+    parser.add_argument("--days", type=int, help="calendar days per store (default: the template's span)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out-dir", default="synthetic", help="output folder (default: synthetic)")
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    profiles = [learn_profile(path) for path in args.templates]
+    names = [os.path.basename(path)[:-len('.parquet')] for path in args.templates]
+    for i in range(args.stores or len(profiles)):
+        template = i % len(profiles)
+        store = f"{names[template]}_x{args.scale:g}" + (f"_{i // len(profiles) + 1}" if i >= len(profiles) else "")
+        path = os.path.join(args.out_dir, f"{store}.parquet")
+        # One seed stream per output store, so adding stores leaves the earlier files unchanged
+        lines, actions = generate_store(profiles[template], path, args.scale, args.days, [args.seed, i])
+        print(f"{path}: {lines:,} lines, {actions:,} actions, {os.path.getsize(path):,} bytes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""Headless load test: N simulated supervisors running the report's common flows at once.
+
+Usage: python loadtest.py --data-folder parquet_uploads --users 20 [--concurrency 10] [--flows 3] [--seed 0] [--json results.json]
+
+Every simulated user is a Streamlit AppTest session of WMS_Report.py on its
+own thread of this process, so the users share the page's st.cache_data /
+st.cache_resource caches exactly as sessions of one server do. The
+`data_folder` secret swaps the GitHub source for a local folder
+(generate_store.py writes bigger ones).
+Each user runs --flows random flows (Daily Monitor Department / Worker View,
+Property vs Property, All Properties) on random dates, like a shift change.
+
+Reported: latency percentiles of every interaction (one rerun each) and of
+each flow's Load Data step, cache hit rates per cached function, and resident
+memory as users finish. Exits 1 when any simulated user fails.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from unittest.mock import MagicMock
+import numpy as np
+import streamlit as st
+from streamlit import config
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.runtime.secrets import Secrets
+from streamlit.testing.v1 import AppTest, app_test, local_script_runner
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "WMS_Report.py")
+FLOWS = ["Daily Monitor / Department View", "Daily Monitor / Worker View", "Property vs Property", "All Properties"]
+PERCENTILES = [50, 95, 99]
+
+class CacheCounter:
+    """Hit / miss counts per cached function, from the first lookup of every cached call.
+
+    Hooks Streamlit's internal cache read; a miss that waited for another
+    session's computation still counts as a miss.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.available = False
+
+    def install(self):
+        try:
+            from streamlit.runtime.caching.cache_errors import CacheKeyNotFoundError
+            from streamlit.runtime.caching.cache_utils import Cache
+            read = Cache.read_result_and_freshness
+        except (ImportError, AttributeError):
+            return
+        counter = self
+
+        def counted_read(cache, value_key):
+            name = getattr(cache, "display_name", type(cache).__name__).rsplit(".", 1)[-1]
+            try:
+                result = read(cache, value_key)
+            except CacheKeyNotFoundError:
+                with counter.lock:
+                    counter.misses[name] += 1
+                raise
+            with counter.lock:
+                counter.hits[name] += 1
+            return result
+        Cache.read_result_and_freshness = counted_read
+        self.available = True
+
+    def rates(self):
+        return {
+            name: {'lookups': self.hits[name] + self.misses[name], 'hit_rate': self.hits[name] / (self.hits[name] + self.misses[name])}
+            for name in sorted(set(self.hits) | set(self.misses))
+        }
+
+@contextmanager
+def shared_app_runtime(secrets):
+    """Let AppTest sessions run concurrently in this process.
+
+    AppTest installs a mock Runtime, its secrets and a config patch around
+    every run and undoes them afterwards, which breaks runs still going on
+    other threads. Here they are installed once for the whole test instead,
+    with one script cache, so the page is compiled once as on a server.
+    """
+    class PerRunRuntime(Runtime):
+        """Takes AppTest's per-run runtime swaps, leaving the shared one installed"""
+        _instance = None
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.dataframe_source_mgr = DataframeSourceManager()
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    shared_secrets = Secrets()
+    shared_secrets._secrets = secrets
+    script_cache = ScriptCache()
+    saved = (app_test.Runtime, local_script_runner.ScriptCache, app_test.patch_config_options, Runtime._instance, st.secrets,
+             config.get_option("global.appTest"))
+    app_test.Runtime = PerRunRuntime
+    local_script_runner.ScriptCache = lambda: script_cache
+    app_test.patch_config_options = lambda overrides: nullcontext()
+    Runtime._instance = runtime
+    st.secrets = shared_secrets
+    config.set_option("global.appTest", True)
+    try:
+        yield
+    finally:
+        app_test.Runtime, local_script_runner.ScriptCache, app_test.patch_config_options, Runtime._instance, st.secrets, app_test_option = saved
+        config.set_option("global.appTest", app_test_option)
+
+def rss_bytes():
+    """Resident memory of this process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class SimulatedUser:
+    """One browser session: every widget change is a timed rerun of the page"""
+    def __init__(self, user_id, rng, timeout):
+        self.user_id = user_id
+        self.rng = rng
+        self.records = []
+        # Secrets come from shared_app_runtime; the login is skipped
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.at.session_state["authenticated"] = True
+        self.flow = "Open page"
+
+    def run(self, step):
+        start = time.perf_counter()
+        self.at.run()
+        self.records.append({'user': self.user_id, 'flow': self.flow, 'step': step, 'seconds': time.perf_counter() - start})
+        if self.at.exception:
+            raise RuntimeError(f"{self.flow} / {step}: {self.at.exception[0].value}")
+        if self.at.error:
+            raise RuntimeError(f"{self.flow} / {step}: {self.at.error[0].value}")
+
+    def widget(self, label=None, key=None):
+        for selectbox in self.at.selectbox:
+            if (key is not None and selectbox.key == key) or (key is None and selectbox.label == label):
+                return selectbox
+        raise LookupError(f"{self.flow}: no selectbox {key or label}")
+
+    def select(self, value, label=None, key=None):
+        self.widget(label, key).select(value)
+        self.run(key or label)
+
+    def pick(self, label=None, key=None, count=1):
+        """Random non-empty options of a selectbox, in option order"""
+        options = [option for option in self.widget(label, key).options if option]
+        if len(options) < count:
+            return None
+        return [options[i] for i in sorted(self.rng.choice(len(options), count, replace=False))]
+
+    def choose_dates(self, prefix, single_key, start_key, end_key, agg_key):
+        """Single date or range, at random; False when the selection offers no dates"""
+        if self.rng.random() < 0.5:
+            self.select("Single Date", key=f"{prefix}_date_type")
+            date = self.pick(key=single_key)
+            if date is None:
+                return False
+            self.select(date[0], key=single_key)
+        else:
+            self.select("Date Range", key=f"{prefix}_date_type")
+            dates = self.pick(key=start_key, count=2)
+            if dates is None:
+                return False
+            self.select(dates[0], key=start_key)
+            self.select(dates[1], key=end_key)
+            self.select(["Average", "Total"][self.rng.integers(2)], key=agg_key)
+        return True
+
+    def load(self, key):
+        button = next(b for b in self.at.button if b.key == key)
+        if button.disabled:
+            raise RuntimeError(f"{self.flow}: Load Data is disabled")
+        button.click()
+        self.run("Load Data")
+
+    def open(self):
+        self.run("open")
+
+    def daily_monitor(self, view):
+        self.select("Daily Monitor", label="🎯 Mode")
+        self.select(view, key="daily_view_type")
+        self.select(self.pick(key="daily_store_select")[0], key="daily_store_select")
+        if self.choose_dates("daily", "daily_single_date", "daily_start_date", "daily_end_date", "daily_agg_mode"):
+            self.load("daily_load")
+
+    def comparison(self, comparison_type):
+        self.select("Comparison Mode", label="🎯 Mode")
+        self.select(comparison_type, label="📊 Compare")
+        if comparison_type == "Property vs Property":
+            self.select(self.pick(label="🏪 Property 1")[0], label="🏪 Property 1")
+            self.select(self.pick(label="🏪 Property 2")[0], label="🏪 Property 2")
+        if self.choose_dates("comp", "comp_date", "comp_start", "comp_end", "comp_agg_mode"):
+            self.load("comparison_load")
+
+    def run_flow(self, flow):
+        self.flow = flow
+        if flow.startswith("Daily Monitor"):
+            self.daily_monitor(flow.split(" / ")[1])
+        else:
+            self.comparison(flow)
+
+def percentiles(seconds):
+    values = np.asarray(seconds)
+    return {'count': len(values), **{f'p{p}': float(np.percentile(values, p)) for p in PERCENTILES}, 'max': float(values.max())}
+
+def run_load_test(data_folder, users, concurrency, flows_per_user, seed, timeout):
+    """Run the simulated users; returns the results dictionary printed by main()"""
+    counter = CacheCounter()
+    counter.install()
+    baseline = rss_bytes()
+    memory = []
+    memory_lock = threading.Lock()
+    failures = []
+
+    def simulate(user_id):
+        rng = np.random.default_rng([seed, user_id])
+        user = SimulatedUser(user_id, rng, timeout)
+        try:
+            user.open()
+            for flow in rng.choice(FLOWS, flows_per_user):
+                user.run_flow(str(flow))
+        except Exception as e:
+            failures.append(f"user {user_id}: {e}")
+        with memory_lock:
+            memory.append({'user': user_id, 'finished': len(memory) + 1, 'rss_bytes': rss_bytes()})
+        return user.records
+
+    started = time.perf_counter()
+    with shared_app_runtime({"data_folder": data_folder}), ThreadPoolExecutor(max_workers=concurrency) as pool:
+        records = [record for user_records in pool.map(simulate, range(users)) for record in user_records]
+    wall_seconds = time.perf_counter() - started
+
+    by_flow = defaultdict(list)
+    for record in records:
+        if record['step'] == "Load Data":
+            by_flow[record['flow']].append(record['seconds'])
+    return {
+        'users': users,
+        'concurrency': concurrency,
+        'wall_seconds': wall_seconds,
+        'interactions': percentiles([record['seconds'] for record in records]) if records else None,
+        'load_data': {flow: percentiles(seconds) for flow, seconds in sorted(by_flow.items())},
+        'cache': counter.rates() if counter.available else None,
+        'memory': {
+            'baseline_bytes': baseline,
+            'final_bytes': memory[-1]['rss_bytes'] if memory else baseline,
+            'growth_per_user_bytes': (memory[-1]['rss_bytes'] - baseline) / users if memory else 0,
+            'after_each_user': memory
+        },
+        'failures': failures,
+        'records': records
+    }
+
+def print_report(results):
+    print(f"{results['users']} users, {results['concurrency']} at a time, {results['wall_seconds']:.1f} s wall time")
+    header = f"{'':<46}{'count':>7}" + ''.join(f"{f'p{p}':>9}" for p in PERCENTILES) + f"{'max':>9}"
+    print("\nLatency (s)\n" + header)
+    rows = ([("All interactions", results['interactions'])] if results['interactions'] else []) + [
+        (f"Load Data: {flow}", stats) for flow, stats in results['load_data'].items()
+    ]
+    for name, stats in rows:
+        print(f"{name:<46}{stats['count']:>7}" + ''.join(f"{stats[f'p{p}']:>9.2f}" for p in PERCENTILES) + f"{stats['max']:>9.2f}")
+
+    if results['cache'] is None:
+        print("\nCache hit rates unavailable with this Streamlit version")
+    else:
+        print(f"\n{'Cached function':<46}{'lookups':>9}{'hit rate':>10}")
+        for name, stats in results['cache'].items():
+            print(f"{name:<46}{stats['lookups']:>9}{stats['hit_rate']:>10.1%}")
+
+    memory = results['memory']
+    mb = 1024 * 1024
+    print(f"\nMemory: {memory['baseline_bytes'] / mb:,.0f} MB -> {memory['final_bytes'] / mb:,.0f} MB, "
+          f"{memory['growth_per_user_bytes'] / mb:,.1f} MB per user")
+    print("  after users finished: " + ", ".join(f"{m['finished']}: {m['rss_bytes'] / mb:,.0f} MB" for m in memory['after_each_user']))
+    for failure in results['failures']:
+        print(f"FAILED {failure}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data-folder", default="parquet_uploads", help="local folder standing in for the GitHub store folder")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, help="users running at once (default: all)")
+    parser.add_argument("--flows", type=int, default=3, help="flows per user (default 3)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=300, help="seconds allowed per rerun")
+    parser.add_argument("--json", help="also write the results, with every timed interaction, to this file")
+    args = parser.parse_args()
+
+    results = run_load_test(os.path.abspath(args.data_folder), args.users, args.concurrency or args.users, args.flows, args.seed,
+                            args.timeout)
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=1)
+    if results['failures']:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Prepare store files for upload: native temporal types, then actions / lines tables.
+
+Usage: python normalize_store.py parquet_uploads/IAN.parquet [...] [--out-dir DIR] [--single-file]
+
+Temporal columns are written as parquet date32 / timestamp[ns]; legacy files
+with text dates are parsed here, once, since the report refuses them. By
+default each store is split into STORE.actions.parquet + STORE.lines.parquet;
+upload both in place of the original and the report lists the pair as one
+store, joining it back on 'Action Code' when loading. --single-file keeps
+the one-file layout and only converts the types.
+"""
+import argparse
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+from wms_engine import arrow_to_frame, conform_store_table, split_line_items, join_line_items
+
+def write_store_table(df, path):
+    """Write a frame with the store's native temporal types, replacing `path` atomically"""
+    table = conform_store_table(pa.Table.from_pandas(df, preserve_index=False))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+def normalize_store_file(path, out_dir=None, single_file=False):
+    """Write the converted table(s) of one store file; returns their paths"""
+    df = arrow_to_frame(conform_store_table(pq.read_table(path)))
+    store = os.path.basename(path)[:-len('.parquet')]
+    out_dir = out_dir or os.path.dirname(path)
+    if single_file:
+        store_path = os.path.join(out_dir, f"{store}.parquet")
+        write_store_table(df, store_path)
+        return [store_path]
+
+    actions, lines = split_line_items(df)
+
+    # The join must give back exactly the stored line items
+    joined = join_line_items(actions, lines)
+    if not joined.equals(df[joined.columns]):
+        raise ValueError(f"{path}: normalized tables do not round-trip")
+
+    actions_path = os.path.join(out_dir, f"{store}.actions.parquet")
+    lines_path = os.path.join(out_dir, f"{store}.lines.parquet")
+    write_store_table(actions, actions_path)
+    write_store_table(lines, lines_path)
+    return [actions_path, lines_path]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="single-file store parquet files")
+    parser.add_argument("--out-dir", help="output folder (default: next to each input)")
+    parser.add_argument("--single-file", action="store_true", help="only convert the types, keep one file per store")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        before = os.path.getsize(path)
+        out_paths = normalize_store_file(path, args.out_dir, args.single_file)
+        after = sum(os.path.getsize(p) for p in out_paths)
+        actions_count = pq.ParquetFile(out_paths[0]).metadata.num_rows
+        print(f"{path}: {before:,} -> {after:,} bytes ({after / before:.0%}), {actions_count:,} rows in {os.path.basename(out_paths[0])}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,578 @@
+"""Golden-output parity check: frozen report numbers per store and date, and every engine checked against them.
+
+Usage:
+    python parity_check.py --update                  # write golden/ from the reference implementation
+    python parity_check.py [--engines rollups,api]   # check engines (default: all available)
+
+The reference is the original report logic, kept deliberately slow and
+simple: files read with plain pd.read_parquet (none of the engines' loaders
+or caches), row-wise calc_kg / calc_l, groupbys over the filtered line items
+and the interval-union loop. For every store in --data-folder it snapshots
+the Department and Worker views over a matrix of single dates (first,
+middle, last) and ranges (first week, whole span; Total and Average), plus
+the days where documents or actions cross midnight: each such day, the next
+one, and the two together. It also covers Property vs Property for
+neighbouring store pairs and All Properties on their common dates.
+
+Daily engines: cube (per-date cube + calculate_total_time_no_overlap),
+rollups, streaming, duckdb (prefix rollups of each), api (ReportService,
+with its own Average/Total scaling) and live (LiveMonitor; single dates
+only). Comparison engines: combined
+(summarize_properties), per-store (summarize_store_file, as the process
+pool), streaming, duckdb and api. Average/Total scaling of the page's Daily
+tables is applied here the same way the page does it.
+
+Helper checks run alongside, without goldens: leaderboard pages of tied
+values (rank_slice) must concatenate to a permutation, and a single frame
+over the session limit (MemoryBudget) must be spilled and read back intact.
+
+Tolerances: integer counts must match exactly; other numbers within
+--rtol / --atol; durations in seconds within --duration-atol; times of day
+within --finish-atol seconds (the page shows whole seconds). Exits 1 on any
+mismatch.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from wms_analytics import rank_slice
+from wms_engine import (
+    add_weight_columns, build_daily_rollups, build_property_metrics, build_report_cube, calc_kg, calc_l,
+    calculate_total_time_no_overlap, daily_store_stats, query_rollups, slice_cube, summarize_properties, summarize_store_file
+)
+from wms_live import LiveMonitor
+from wms_memory import MemoryBudget
+from wms_streaming import stream_daily_rollups, stream_property_summaries
+import wms_api
+import wms_duckdb
+import wms_sources
+
+DAILY_ENGINES = ["cube", "rollups", "streaming", "duckdb", "api", "live"]
+COMPARISON_ENGINES = ["combined", "per-store", "streaming", "duckdb", "api"]
+
+DURATION_KEYS = {'picking_seconds', 'real_picking_seconds'}
+# Midnight-crossing days per store and kind (documents, actions) added to the date matrix
+CROSSING_DAYS = 3
+FINISH_KEYS = {'finish_seconds'}
+
+# ---------- reference implementation (frozen) ----------
+
+def reference_total_time(actions_df):
+    """The original row loop over actions sorted by start"""
+    if actions_df.empty:
+        return timedelta(0)
+    sorted_actions = actions_df.sort_values('Action start').reset_index(drop=True)
+    total_time = timedelta(0)
+    cumulative_end = sorted_actions.iloc[0]['Action start']
+    for _, row in sorted_actions.iterrows():
+        start = row['Action start']
+        end = row['Action completion']
+        effective_start = max(start, cumulative_end)
+        if end > effective_start:
+            total_time += end - effective_start
+        cumulative_end = max(cumulative_end, end)
+    return total_time
+
+def reference_finish_seconds(df, num_days):
+    """Last completion's time of day; for ranges, the mean over days"""
+    if num_days > 1:
+        daily_finish = df.groupby('Date')['Action completion'].max().dropna()
+        if daily_finish.empty:
+            return None
+        return float(daily_finish.apply(lambda x: x.hour * 3600 + x.minute * 60 + x.second).mean())
+    finish = df['Action completion'].max()
+    return None if pd.isna(finish) else finish.hour * 3600 + finish.minute * 60 + finish.second
+
+def reference_daily(df, num_days):
+    """Raw (Total) Department and Worker numbers of one store's filtered line items"""
+    df = df.copy()
+    df['Kg'] = df.apply(calc_kg, axis=1)
+    df['Liters'] = df.apply(calc_l, axis=1)
+    raw = {}
+
+    # Department View
+    actions = df.groupby(['Cost Center', 'Action Code']).agg({'Action start': 'first', 'Action completion': 'first'}).reset_index()
+    actions['picking_time'] = actions['Action completion'] - actions['Action start']
+    times = actions.groupby('Cost Center')['picking_time'].sum().reset_index()
+    stats = df.groupby('Cost Center').agg({'Document': 'nunique', 'Code': 'count', 'Kg': 'sum', 'Liters': 'sum'}).reset_index()
+    report = stats.merge(times, on='Cost Center')
+    raw['department'] = {
+        row['Cost Center']: {
+            'orders': int(row['Document']), 'requests': int(row['Code']), 'kg': float(row['Kg']),
+            'liters': float(row['Liters']), 'picking_seconds': row['picking_time'].total_seconds()
+        }
+        for _, row in report.iterrows()
+    }
+    raw['department_real_seconds'] = reference_total_time(actions).total_seconds()
+
+    # Worker View: grouped on the names as stored, title-cased afterwards
+    actions = df.groupby(['Name', 'Action Code']).agg({'Action start': 'first', 'Action completion': 'first'}).reset_index()
+    actions['picking_time'] = actions['Action completion'] - actions['Action start']
+    times = actions.groupby('Name')['picking_time'].sum().reset_index()
+    stats = df.groupby('Name').agg({'Code': 'count', 'Kg': 'sum', 'Liters': 'sum'}).reset_index()
+    stats['Name'] = stats['Name'].str.title()
+    times['Name'] = times['Name'].str.title()
+    report = stats.merge(times, on='Name')
+    raw['worker'] = {
+        row['Name']: {
+            'requests': int(row['Code']), 'kg': float(row['Kg']), 'liters': float(row['Liters']),
+            'picking_seconds': row['picking_time'].total_seconds()
+        }
+        for _, row in report.iterrows()
+    }
+    raw['worker_real_seconds'] = reference_total_time(actions).total_seconds()
+    raw['finish_seconds'] = reference_finish_seconds(df, num_days)
+    return raw
+
+def reference_summary(df, num_days):
+    """One store's comparison totals, as the original Property vs Property code"""
+    df = df.copy()
+    df['Kg'] = df.apply(calc_kg, axis=1)
+    df['Liters'] = df.apply(calc_l, axis=1)
+    actions = df.groupby(['Name', 'Action Code']).agg({'Action start': 'first', 'Action completion': 'first'}).reset_index()
+    if num_days > 1:
+        finish = reference_finish_seconds(df, num_days)
+        picking_finish = pd.Timestamp("2000-01-01") + pd.to_timedelta(int(finish), unit='s') if finish is not None else pd.NaT
+    else:
+        picking_finish = df['Action completion'].max()
+    return {
+        'picking_time': reference_total_time(actions),
+        'picking_finish': picking_finish,
+        'orders': df['Document'].nunique(),
+        'requests': len(df),
+        'weight': df['Kg'].sum() + df['Liters'].sum()
+    }
+
+# ---------- canonical report shapes ----------
+
+def _number(value):
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+def daily_report(raw, num_days, average):
+    """Department / Worker tables as the page shows them, from raw totals"""
+    divisor = num_days if average and num_days > 1 else 1
+
+    def scale(value):
+        return value / divisor if divisor > 1 else value
+
+    department = {
+        name: {
+            'orders': scale(row['orders']), 'requests': scale(row['requests']), 'kg': scale(row['kg']),
+            'liters': scale(row['liters']), 'weight': scale(row['kg'] + row['liters']), 'picking_seconds': scale(row['picking_seconds'])
+        }
+        for name, row in raw['department'].items()
+    }
+    worker = {}
+    for name, row in raw['worker'].items():
+        minutes = row['picking_seconds'] / 60
+        weight = row['kg'] + row['liters']
+        worker[name] = {
+            'requests': scale(row['requests']), 'kg': scale(row['kg']), 'liters': scale(row['liters']), 'weight': scale(weight),
+            'picking_seconds': scale(row['picking_seconds']),
+            'requests_per_minute': _number(row['requests'] / minutes) if minutes else None,
+            'weight_per_minute': _number(weight / minutes) if minutes else None
+        }
+    return {
+        'department': {'rows': department, 'real_picking_seconds': scale(raw['department_real_seconds'])},
+        'worker': {
+            'rows': worker, 'real_picking_seconds': scale(raw['worker_real_seconds']), 'finish_seconds': raw['finish_seconds']
+        }
+    }
+
+def comparison_report(summaries, num_days, average):
+    """Comparison rows through build_property_metrics, the page's Average/Total logic"""
+    rows = {}
+    for metric in build_property_metrics(summaries, num_days, average and num_days > 1):
+        finish = metric['picking_finish']
+        rows[metric['name']] = {
+            'orders': metric['orders'], 'requests': metric['requests'], 'weight': float(metric['weight']),
+            'picking_seconds': metric['picking_time'].total_seconds(),
+            'finish_seconds': None if pd.isna(finish) else finish.hour * 3600 + finish.minute * 60 + finish.second
+        }
+    return rows
+
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_jsonable(v) for v in value]
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, int) or (hasattr(value, 'dtype') and value.dtype.kind in 'iu'):
+        return int(value)
+    return _number(value)
+
+# ---------- stores and date matrix ----------
+
+class StoreSet:
+    """The stores of a local folder, with staged file paths for the file-based engines"""
+    def __init__(self, folder):
+        self.source = wms_sources.LocalSource(folder)
+        self.entries = {f['name'][:-len('.parquet')]: f for f in self.source.list_files()}
+        self.staging = tempfile.mkdtemp(prefix="wms_parity_")
+        self.cache = {}
+
+    def tables(self, store, dates=None):
+        """(df, actions) through the engines' loader"""
+        return wms_sources.load_store_tables(self.source.fetch, self.entries[store], dates)
+
+    def reference(self, store, dates=None):
+        """Line items as the original page read them, optionally filtered to the selected dates"""
+        def read():
+            entry = self.entries[store]
+            df = pd.read_parquet(entry['download_url'])
+            if entry.get('actions_url') is not None:
+                df = df.merge(pd.read_parquet(entry['actions_url']), on='Action Code', how='inner')
+            df['Date'] = pd.to_datetime(df['Date']).dt.date
+            df['Action start'] = pd.to_datetime(df['Action start'])
+            df['Action completion'] = pd.to_datetime(df['Action completion'])
+            return df
+        df = self.memo(('reference', store), read)
+        if dates is None:
+            return df
+        return df[df['Date'].isin([pd.Timestamp(day).date() for day in dates])]
+
+    def dates(self, store):
+        return [pd.Timestamp(day) for day in sorted(self.reference(store)['Date'].unique())]
+
+    def crossings(self, store):
+        """Days where a document's lines or an action run past midnight, at most CROSSING_DAYS of each kind"""
+        df = self.reference(store)
+        spans = df.groupby(['Cost Center', 'Document'])['Date'].nunique()
+        spanning = df.set_index(['Cost Center', 'Document']).index.isin(spans[spans > 1].index)
+        document_days = sorted(df.loc[spanning, 'Date'].unique())
+        late = df['Action completion'].dt.normalize() > pd.to_datetime(df['Date'])
+        action_days = sorted(df.loc[late, 'Date'].unique())
+        return sorted({pd.Timestamp(day) for day in document_days[:CROSSING_DAYS] + action_days[:CROSSING_DAYS]})
+
+    def path(self, store):
+        entry = self.entries[store]
+        if entry.get('actions_url') is None:
+            return entry['download_url']
+        path = os.path.join(self.staging, f"{store}.parquet")
+        if not os.path.exists(path):
+            wms_sources.decode_store_tables(self.source.fetch, entry)[0].to_parquet(path, index=False)
+        return path
+
+    def memo(self, key, compute):
+        if key not in self.cache:
+            self.cache[key] = compute()
+        return self.cache[key]
+
+def date_matrix(dates, crossings=()):
+    """(selected dates, modes) cases: three single dates, then the first week and the whole span.
+
+    Each crossing day adds itself, the next store date, and the two together.
+    """
+    singles = {0, len(dates) // 2, len(dates) - 1}
+    pairs = set()
+    for day in crossings:
+        i = dates.index(day)
+        singles.add(i)
+        if i + 1 < len(dates):
+            singles.add(i + 1)
+            pairs.add(i)
+    cases = [([dates[i]], ['total']) for i in sorted(singles)]
+    for end in sorted({min(6, len(dates) - 1), len(dates) - 1}):
+        if end > 0:
+            cases.append((dates[:end + 1], ['total', 'average']))
+    cases += [(dates[i:i + 2], ['total', 'average']) for i in sorted(pairs)]
+    return cases
+
+def case_id(dates, mode, stores=None):
+    span = f"{dates[0]:%Y-%m-%d}" if len(dates) == 1 else f"{dates[0]:%Y-%m-%d}..{dates[-1]:%Y-%m-%d}"
+    return ' '.join(([','.join(stores)] if stores else []) + [span, mode])
+
+def comparison_sets(stores):
+    """Property vs Property for neighbouring pairs, then All Properties"""
+    pairs = [stores[i:i + 2] for i in range(0, len(stores) - 1, 2)]
+    return pairs + ([stores] if len(stores) > 2 else [])
+
+def comparison_matrix(store_set, stores):
+    common = sorted(set.intersection(*[set(store_set.dates(store)) for store in stores]))
+    if not common:
+        return []
+    cases = [([common[0]], ['total']), ([common[-1]], ['total'])]
+    if len(common) > 1:
+        cases.append((common, ['total', 'average']))
+    return cases
+
+# ---------- engines ----------
+
+def _raw_from_cube(cube, real_seconds, finish_seconds):
+    """Raw totals from a cube shaped like query_rollups output"""
+    raw = {}
+    for by, key in (('Cost Center', 'department'), ('Name', 'worker')):
+        report = slice_cube(cube, by)
+        raw[key] = {
+            row[by]: {
+                'orders': int(row['orders']), 'requests': int(row['requests']), 'kg': float(row['Kg']),
+                'liters': float(row['Liters']), 'picking_seconds': row['picking_time'].total_seconds()
+            }
+            for _, row in report.iterrows()
+        }
+        raw[f'{key}_real_seconds'] = real_seconds
+    raw['finish_seconds'] = finish_seconds
+    return raw
+
+def _raw_from_rollups(rollups, dates):
+    cube, totals = query_rollups(rollups, dates[0], dates[-1])
+    return _raw_from_cube(cube, totals['real_picking_time'].total_seconds(), totals['finish_seconds'])
+
+def daily_engine(name, store_set, store, dates, mode):
+    """Daily report of one case by the named engine"""
+    num_days = len(dates)
+    average = mode == 'average'
+    if name == 'cube':
+        df, actions = store_set.tables(store, dates)
+        add_weight_columns(df)
+        cube, actions = build_report_cube(df, actions)
+        stats = daily_store_stats(actions)
+        finish = stats['finish_seconds'].sum() / stats['finish_days'].sum() if stats['finish_days'].sum() else None
+        raw = _raw_from_cube(cube, calculate_total_time_no_overlap(actions).total_seconds(), finish)
+        return daily_report(raw, num_days, average)
+    if name in ('rollups', 'streaming', 'duckdb'):
+        def build():
+            if name == 'streaming':
+                return stream_daily_rollups(store_set.path(store))
+            if name == 'duckdb':
+                return wms_duckdb.query_daily_rollups(store_set.path(store))
+            df, actions = store_set.tables(store)
+            add_weight_columns(df)
+            return build_daily_rollups(df, actions)
+        rollups = store_set.memo((name, store), build)
+        return daily_report(_raw_from_rollups(rollups, dates), num_days, average)
+    if name == 'api':
+        service = store_set.memo('api', lambda: wms_api.ReportService.from_source(store_set.source))
+        department, meta = service.department(store, dates[0], dates[-1], mode)
+        workers, _ = service.workers(store, dates[0], dates[-1], mode)
+        finish = meta['picking_finish']
+        return {
+            'department': {
+                'rows': {row['cost_center']: {k: row[k] for k in ('orders', 'requests', 'kg', 'liters', 'weight', 'picking_seconds')}
+                         for _, row in department.iterrows()},
+                'real_picking_seconds': meta['real_picking_seconds']
+            },
+            'worker': {
+                'rows': {row['picker']: {k: row[k] for k in ('requests', 'kg', 'liters', 'weight', 'picking_seconds',
+                                                          'requests_per_minute', 'weight_per_minute')}
+                         for _, row in workers.iterrows()},
+                'real_picking_seconds': meta['real_picking_seconds'],
+                'finish_seconds': None if finish is None else sum(int(part) * unit for part, unit in zip(finish.split(':'), (3600, 60, 1)))
+            }
+        }
+    if name == 'live':
+        if num_days > 1:
+            return None
+        monitor = LiveMonitor(store_set.source, store_set.entries[store], dates[0], min_interval=0)
+        monitor.refresh()
+        cube, totals = monitor.report()
+        raw = _raw_from_cube(cube, totals['real_picking_time'].total_seconds(), totals['finish_seconds'])
+        return daily_report(raw, num_days, average)
+    raise ValueError(f"Unknown daily engine: {name}")
+
+def comparison_engine(name, store_set, stores, dates, mode):
+    """Comparison rows of one case by the named engine"""
+    num_days = len(dates)
+    if name == 'combined':
+        frames, action_frames = [], []
+        for store in stores:
+            df, actions = store_set.tables(store, dates)
+            frames.append(df.assign(Property=store))
+            action_frames.append(actions.assign(Property=store))
+        summaries = summarize_properties(pd.concat(frames, ignore_index=True), num_days, pd.concat(action_frames, ignore_index=True))
+    elif name == 'per-store':
+        summaries = {store: summarize_store_file(store_set.path(store), dates) for store in stores}
+    elif name == 'streaming':
+        summaries = stream_property_summaries({store: store_set.path(store) for store in stores}, dates)
+    elif name == 'duckdb':
+        summaries = wms_duckdb.query_property_summaries({store: store_set.path(store) for store in stores}, dates)
+    elif name == 'api':
+        service = store_set.memo('api', lambda: wms_api.ReportService.from_source(store_set.source))
+        rows, _ = service.compare(stores, dates[0], dates[-1], mode)
+        return {
+            row['store']: {
+                'orders': row['orders'], 'requests': row['requests'], 'weight': row['weight'], 'picking_seconds': row['picking_seconds'],
+                'finish_seconds': None if row['picking_finish'] is None else
+                sum(int(part) * unit for part, unit in zip(row['picking_finish'].split(':'), (3600, 60, 1)))
+            }
+            for _, row in rows.iterrows()
+        }
+    else:
+        raise ValueError(f"Unknown comparison engine: {name}")
+    return comparison_report({store: summaries[store] for store in stores}, num_days, mode == 'average')
+
+# ---------- golden files ----------
+
+def write_goldens(store_set, golden_dir):
+    os.makedirs(golden_dir, exist_ok=True)
+    stores = sorted(store_set.entries)
+    for store in stores:
+        cases = {}
+        for dates, modes in date_matrix(store_set.dates(store), store_set.crossings(store)):
+            raw = reference_daily(store_set.reference(store, dates), len(dates))
+            for mode in modes:
+                cases[case_id(dates, mode)] = daily_report(raw, len(dates), mode == 'average')
+        _write_json(os.path.join(golden_dir, f"{store}.json"), {'store': store, 'cases': cases})
+        print(f"{store}: {len(cases)} daily cases")
+
+    cases = {}
+    for compared in comparison_sets(stores):
+        for dates, modes in comparison_matrix(store_set, compared):
+            summaries = {store: reference_summary(store_set.reference(store, dates), len(dates)) for store in compared}
+            for mode in modes:
+                cases[case_id(dates, mode, compared)] = {
+                    'stores': compared, 'rows': comparison_report(summaries, len(dates), mode == 'average')
+                }
+    _write_json(os.path.join(golden_dir, "comparison.json"), {'cases': cases})
+    print(f"comparison: {len(cases)} cases")
+
+def _write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(_jsonable(data), f, indent=1, ensure_ascii=False, sort_keys=True)
+        f.write("\n")
+
+def _parse_case(case):
+    """(stores or None, dates span, mode) of a case id"""
+    parts = case.split(' ')
+    stores = parts[0].split(',') if len(parts) == 3 else None
+    span = parts[-2].split('..')
+    return stores, [pd.Timestamp(day) for day in span], parts[-1]
+
+# ---------- comparison with tolerances ----------
+
+def compare_values(expected, actual, path, tolerances, mismatches):
+    if isinstance(expected, dict):
+        if not isinstance(actual, dict):
+            mismatches.append((path, expected, actual))
+            return
+        for key in sorted(set(expected) | set(actual)):
+            if key not in actual:
+                mismatches.append((f"{path}/{key}", "present", "missing"))
+            elif key not in expected:
+                mismatches.append((f"{path}/{key}", "missing", "present"))
+            else:
+                compare_values(expected[key], actual[key], f"{path}/{key}", tolerances, mismatches)
+        return
+    if expected is None or actual is None:
+        if expected is not None or actual is not None:
+            mismatches.append((path, expected, actual))
+        return
+    key = path.rsplit('/', 1)[-1]
+    actual = float(actual)
+    if isinstance(expected, int) and key not in DURATION_KEYS | FINISH_KEYS:
+        ok = actual == expected
+    elif key in DURATION_KEYS:
+        ok = abs(actual - expected) <= tolerances['duration_atol']
+    elif key in FINISH_KEYS:
+        ok = abs(actual - expected) <= tolerances['finish_atol']
+    else:
+        ok = math.isclose(actual, expected, rel_tol=tolerances['rtol'], abs_tol=tolerances['atol'])
+    if not ok:
+        mismatches.append((path, expected, actual))
+
+# ---------- helper checks ----------
+
+def check_rank_paging(mismatches):
+    """Leaderboard pages over heavily tied values cover every row exactly once"""
+    values = np.random.default_rng(0).integers(0, 5, 200)
+    for ascending in (False, True):
+        pages = np.concatenate([rank_slice(values, first, first + 25, ascending) for first in range(0, len(values), 25)])
+        unique = len(np.unique(pages))
+        if len(pages) != len(values) or unique != len(values):
+            mismatches.append((f"rank_slice ascending={ascending}", f"{len(values)} unique positions", unique))
+        elif not np.all(np.diff(values[pages] if ascending else -values[pages]) >= 0):
+            mismatches.append((f"rank_slice ascending={ascending}", "pages in rank order", values[pages].tolist()))
+
+def check_memory_budget(mismatches):
+    """A session's only frame, larger than the session limit by itself, is spilled and reads back unchanged"""
+    frame = pd.DataFrame({'Name': [f"picker {i}" for i in range(1000)], 'requests': range(1000)})
+    with tempfile.TemporaryDirectory() as spill_dir:
+        budget = MemoryBudget(session_limit=1024, process_limit=2 ** 40, spill_dir=spill_dir)
+        handle = budget.hold('session', 'daily', {'cube': frame})
+        if handle.memory_bytes or not handle.spilled_bytes:
+            mismatches.append(("oversized frame", "spilled", f"{handle.memory_bytes} bytes in memory"))
+        if not handle['cube'].equals(frame):
+            mismatches.append(("oversized frame", "read back unchanged", "different frame"))
+
+HELPER_CHECKS = {'rank_slice': check_rank_paging, 'memory': check_memory_budget}
+
+def check_helpers(show):
+    """Run the helper checks; returns the total number of mismatches"""
+    total = 0
+    for name, check in HELPER_CHECKS.items():
+        mismatches = []
+        check(mismatches)
+        print(f"{name:<10} {'OK' if not mismatches else f'{len(mismatches)} mismatches'}")
+        for path, expected, actual in mismatches[:show]:
+            print(f"    {path}: expected {expected}, got {actual}")
+        total += len(mismatches)
+    return total
+
+def check_engines(store_set, golden_dir, engines, tolerances, show):
+    """Check every case of the golden files; returns the total number of mismatches"""
+    total = 0
+    store_dates = {}
+    for engine in engines:
+        mismatches, checked = [], 0
+        if engine in DAILY_ENGINES:
+            for store in sorted(store_set.entries):
+                with open(os.path.join(golden_dir, f"{store}.json"), encoding="utf-8") as f:
+                    golden = json.load(f)
+                dates = store_dates.setdefault(store, store_set.dates(store))
+                for case, expected in golden['cases'].items():
+                    _, span, mode = _parse_case(case)
+                    selected = [d for d in dates if span[0] <= d <= span[-1]]
+                    actual = daily_engine(engine, store_set, store, selected, mode)
+                    if actual is not None:
+                        compare_values(expected, _jsonable(actual), f"{store} {case}", tolerances, mismatches)
+                        checked += 1
+        if engine in COMPARISON_ENGINES:
+            with open(os.path.join(golden_dir, "comparison.json"), encoding="utf-8") as f:
+                golden = json.load(f)
+            for case, expected in golden['cases'].items():
+                stores, span, mode = _parse_case(case)
+                common = sorted(set.intersection(*[set(store_dates.setdefault(s, store_set.dates(s))) for s in stores]))
+                selected = [d for d in common if span[0] <= d <= span[-1]]
+                actual = comparison_engine(engine, store_set, stores, selected, mode)
+                compare_values(expected['rows'], _jsonable(actual), case, tolerances, mismatches)
+                checked += 1
+        print(f"{engine:<10} {checked:>4} cases  {'OK' if not mismatches else f'{len(mismatches)} mismatches'}")
+        for path, expected, actual in mismatches[:show]:
+            print(f"    {path}: golden {expected}, got {actual}")
+        total += len(mismatches)
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data-folder", default="parquet_uploads", help="folder of store files (default: parquet_uploads)")
+    parser.add_argument("--golden", default="golden", help="folder of golden JSON files (default: golden)")
+    parser.add_argument("--update", action="store_true", help="rewrite the golden files from the reference implementation")
+    parser.add_argument("--engines", help="comma-separated engines to check (default: all available)")
+    parser.add_argument("--rtol", type=float, default=1e-9, help="relative tolerance for non-integer numbers")
+    parser.add_argument("--atol", type=float, default=1e-6, help="absolute tolerance for non-integer numbers")
+    parser.add_argument("--duration-atol", type=float, default=1e-3, help="seconds allowed on durations")
+    parser.add_argument("--finish-atol", type=float, default=1.0, help="seconds allowed on times of day")
+    parser.add_argument("--show", type=int, default=10, help="mismatches listed per engine")
+    args = parser.parse_args()
+
+    store_set = StoreSet(args.data_folder)
+    if args.update:
+        write_goldens(store_set, args.golden)
+        return
+
+    available = [e for e in dict.fromkeys(DAILY_ENGINES + COMPARISON_ENGINES) if e != 'duckdb' or wms_duckdb.is_available()]
+    engines = args.engines.split(',') if args.engines else available
+    tolerances = {'rtol': args.rtol, 'atol': args.atol, 'duration_atol': args.duration_atol, 'finish_atol': args.finish_atol}
+    failed = check_helpers(args.show)
+    if check_engines(store_set, args.golden, engines, tolerances, args.show) or failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""Analytics Mode computations, built per store and day so any date range or store set is a merge.
+
+Nothing in here touches Streamlit. Each builder turns one decoded store into
+a small per-day aggregate that the page caches per file version; the query
+functions then filter those aggregates to the selected dates and combine
+them across stores.
+"""
+import unicodedata
+import numpy as np
+import pandas as pd
+
+NS_PER_MINUTE = 60 * 10**9
+
+# Heatmap metric label -> activity cube column
+ACTIVITY_METRICS = {'Busy minutes': 'busy_minutes', 'Requests': 'requests', 'Weight': 'weight'}
+
+def allocate_to_buckets(start_ns, end_ns, bucket_ns):
+    """Split [start, end) intervals at fixed bucket boundaries.
+
+    Returns (owner, bucket, overlap_ns): one entry per (interval, bucket) pair
+    an interval touches. Intervals of zero or negative length fall in their
+    start bucket with no overlap.
+    """
+    first = start_ns // bucket_ns
+    last = np.maximum((end_ns - 1) // bucket_ns, first)
+    counts = last - first + 1
+    owner = np.repeat(np.arange(len(start_ns)), counts)
+    # Position of each entry within its interval's run of buckets
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    bucket = first[owner] + offset
+    overlap = np.minimum(end_ns[owner], (bucket + 1) * bucket_ns) - np.maximum(start_ns[owner], bucket * bucket_ns)
+    return owner, bucket, np.maximum(overlap, 0)
+
+def build_activity_cube(df, actions, bucket_minutes):
+    """Busy time, requests and weight per Date x Cost Center x Name x time-of-day slot.
+
+    `df` has Kg/Liters. Every completed action is split across the slots it
+    spans; its requests and weight are shared out in proportion to the time
+    spent in each. Slots count from midnight (slot 0), and work running past
+    midnight wraps into the early slots of the action's day.
+    """
+    per_action = df.groupby('Action Code').agg(requests=('Code', 'count'), Kg=('Kg', 'sum'), Liters=('Liters', 'sum'))
+    actions = actions.dropna(subset=['Action start', 'Action completion']).join(per_action, on='Action Code')
+    start = actions['Action start'].to_numpy('int64')
+    end = actions['Action completion'].to_numpy('int64')
+    bucket_ns = bucket_minutes * NS_PER_MINUTE
+    owner, bucket, overlap = allocate_to_buckets(start, end, bucket_ns)
+
+    duration = (end - start)[owner]
+    share = np.where(duration > 0, overlap / np.maximum(duration, 1), 1.0)
+    activity = pd.DataFrame({
+        'Date': actions['Date'].to_numpy()[owner],
+        'Cost Center': actions['Cost Center'].to_numpy()[owner],
+        'Name': actions['Name'].to_numpy()[owner],
+        'slot': bucket % (24 * 60 // bucket_minutes),
+        'busy_minutes': overlap / NS_PER_MINUTE,
+        'requests': actions['requests'].fillna(0).to_numpy()[owner] * share,
+        'weight': (actions['Kg'].fillna(0) + actions['Liters'].fillna(0)).to_numpy()[owner] * share
+    })
+    return activity.groupby(['Date', 'Cost Center', 'Name', 'slot'], as_index=False).sum()
+
+def query_activity(cubes, selected_dates, by, metric):
+    """Heatmap frame (rows = `by` values, columns = slots) over the selected dates.
+
+    `cubes` maps store name to its activity cube; `by` is 'Name', 'Cost Center'
+    or 'Store'. Rows are sorted by their total, largest first.
+    """
+    frames = [cube[cube['Date'].isin(selected_dates)].assign(Store=store) for store, cube in cubes.items()]
+    activity = pd.concat(frames, ignore_index=True)
+    if by == 'Name':
+        activity['Name'] = activity['Name'].str.title()
+    heat = activity.pivot_table(index=by, columns='slot', values=metric, aggfunc='sum', fill_value=0)
+    return heat.loc[heat.sum(axis=1).sort_values(ascending=False).index]
+
+# Cycle-time sketches are log-scale histograms (DDSketch): merging is adding
+# counts, and every quantile comes back within 1% of the exact value
+SKETCH_ACCURACY = 0.01
+SKETCH_GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+CYCLE_QUANTILES = {'p50': 0.5, 'p90': 0.9, 'p99': 0.99}
+
+def sketch_bins(seconds):
+    """Sketch bin of each duration: 0 for under a second, then one bin per factor of SKETCH_GAMMA"""
+    seconds = np.asarray(seconds, dtype=float)
+    return np.where(seconds >= 1, np.ceil(np.log(np.maximum(seconds, 1)) / np.log(SKETCH_GAMMA)) + 1, 0).astype('int32')
+
+def bin_values(bins):
+    """Representative duration (seconds) of each sketch bin"""
+    bins = np.asarray(bins)
+    return np.where(bins > 0, 2 * SKETCH_GAMMA ** (bins - 1.0) / (SKETCH_GAMMA + 1), 0.0)
+
+def build_cycle_sketches(df, actions):
+    """Per Date x Cost Center sketch of order cycle times (first action start to last completion).
+
+    Orders are (Cost Center, Document) pairs dated by their first line, as in
+    the order counts; orders with an action still open are left out.
+    """
+    keys = ['Cost Center', 'Document']
+    lines = df.drop_duplicates(keys + ['Action Code'])[['Date'] + keys + ['Action Code']]
+    lines = lines.merge(actions[['Action Code', 'Action start', 'Action completion']], on='Action Code', how='left')
+    grouped = lines.groupby(keys, sort=False)
+    orders = grouped.agg(Date=('Date', 'first'), start=('Action start', 'min'), end=('Action completion', 'max'))
+    orders = orders[~lines['Action completion'].isna().groupby([lines[k] for k in keys], sort=False).any()]
+    seconds = (orders['end'] - orders['start']).dt.total_seconds().clip(lower=0)
+    sketches = pd.DataFrame({
+        'Date': orders['Date'].to_numpy(),
+        'Cost Center': orders.index.get_level_values('Cost Center'),
+        'bin': sketch_bins(seconds)
+    })
+    return sketches.groupby(['Date', 'Cost Center', 'bin']).size().rename('count').reset_index()
+
+def query_cycle_quantiles(sketches, selected_dates, by):
+    """Orders and cycle-time quantiles (seconds) per `by` ('Cost Center' or 'Store') from merged sketches"""
+    frames = [sketch[sketch['Date'].isin(selected_dates)].assign(Store=store) for store, sketch in sketches.items()]
+    merged = pd.concat(frames, ignore_index=True).groupby([by, 'bin'])['count'].sum().reset_index()
+    cumulative = merged.groupby(by)['count'].cumsum()
+    total = merged.groupby(by)['count'].transform('sum')
+    result = pd.DataFrame({'Orders': merged.groupby(by)['count'].sum()})
+    for label, q in CYCLE_QUANTILES.items():
+        # First bin whose cumulative count passes the quantile's rank
+        reached = merged[cumulative > q * (total - 1)].groupby(by)['bin'].first()
+        result[label] = bin_values(reached.reindex(result.index).to_numpy())
+    return result.sort_values('Orders', ascending=False)
+
+# Item ranking label -> item aggregate column
+ITEM_METRICS = {'Requests': 'requests', 'Kg': 'Kg', 'Liters': 'Liters'}
+
+def build_item_aggregates(df):
+    """Per Date x item Code requests, Kg and Liters (`df` has Kg/Liters), plus each Code's description"""
+    items = df.groupby(['Date', 'Code']).agg(requests=('Code', 'count'), Kg=('Kg', 'sum'), Liters=('Liters', 'sum'))
+    descriptions = df.drop_duplicates('Code').set_index('Code')['Description']
+    return items.reset_index(), descriptions
+
+def query_top_items(aggregates, selected_dates, rank_by, n):
+    """Top `n` items by `rank_by` over the selected dates, merged across stores.
+
+    `aggregates` maps store name to build_item_aggregates output. Also counts
+    the stores and store days that requested each item.
+    """
+    frames = [items[items['Date'].isin(selected_dates)].assign(Store=store) for store, (items, _) in aggregates.items()]
+    items = pd.concat(frames, ignore_index=True)
+    totals = items.groupby('Code').agg(
+        requests=('requests', 'sum'),
+        Kg=('Kg', 'sum'),
+        Liters=('Liters', 'sum'),
+        stores=('Store', 'nunique'),
+        store_days=('Date', 'size')
+    )
+    top = totals.nlargest(n, rank_by)
+    descriptions = pd.concat([d for _, d in aggregates.values()])
+    top.insert(0, 'Description', descriptions[~descriptions.index.duplicated()].reindex(top.index).fillna(''))
+    return top
+
+# Leaderboard ranking label -> merged worker column
+LEADERBOARD_METRICS = {
+    'Requests/min': 'requests_per_minute', 'Weight/min': 'weight_per_minute', 'Requests': 'requests', 'Weight': 'weight'
+}
+
+def worker_keys(names):
+    """Matching key of each worker name: accents dropped, case folded, whitespace collapsed.
+
+    Computed once per distinct name, so the same picker matches across stores
+    however each store spells them.
+    """
+    def key(name):
+        decomposed = unicodedata.normalize('NFKD', str(name))
+        return ' '.join(''.join(c for c in decomposed if not unicodedata.combining(c)).casefold().split())
+    names = pd.Series(names)
+    unique = names.unique()
+    return names.map(dict(zip(unique, map(key, unique)))).to_numpy()
+
+def merge_worker_reports(reports):
+    """One row per picker across stores; `reports` maps store name to a slice_cube(cube, 'Name') frame"""
+    workers = pd.concat([report.assign(Store=store) for store, report in reports.items()], ignore_index=True)
+    workers['key'] = worker_keys(workers['Name'])
+    workers['picking_minutes'] = workers['picking_time'].dt.total_seconds() / 60
+    merged = workers.groupby('key').agg(
+        Name=('Name', 'first'),
+        stores=('Store', lambda stores: ', '.join(sorted(set(stores)))),
+        requests=('requests', 'sum'),
+        Kg=('Kg', 'sum'),
+        Liters=('Liters', 'sum'),
+        picking_minutes=('picking_minutes', 'sum')
+    )
+    merged['weight'] = merged['Kg'] + merged['Liters']
+    minutes = merged['picking_minutes'].where(merged['picking_minutes'] > 0)
+    merged['requests_per_minute'] = (merged['requests'] / minutes).fillna(0.0)
+    merged['weight_per_minute'] = (merged['weight'] / minutes).fillna(0.0)
+    return merged.reset_index(drop=True)
+
+def rank_slice(values, start, stop, ascending=False):
+    """Positions of ranks [start, stop) of `values`, in rank order; ties rank by position.
+
+    np.partition finds the values at ranks start and stop - 1, so only the
+    rows between them (ties included) are ever sorted. NaN ranks last.
+    """
+    values = np.asarray(values, dtype=float)
+    stop = min(stop, len(values))
+    if start >= stop:
+        return np.array([], dtype=int)
+    keys = values if ascending else -values
+    keys = np.where(np.isnan(keys), np.inf, keys)
+    low, high = np.partition(keys, sorted({start, stop - 1}))[[start, stop - 1]]
+    # Candidates come in position order, so the stable sort breaks ties by position
+    candidates = np.flatnonzero((keys >= low) & (keys <= high))
+    candidates = candidates[np.argsort(keys[candidates], kind='stable')]
+    skipped = np.count_nonzero(keys < low)
+    return candidates[start - skipped:stop - skipped]
@@ -0,0 +1,327 @@
+"""Local HTTP API serving the report engine to other dashboards as JSON or Arrow IPC.
+
+Endpoints (dates are YYYY-MM-DD; `end` defaults to `start`, `mode` is
+average or total, `format` is json or arrow):
+
+    GET /stores                                 store names and their dates
+    GET /department?store=IAN&start=...&end=...  per cost center
+    GET /workers?store=IAN&start=...&end=...     per picker
+    GET /compare?stores=IAN,IPP&start=...        per store (all stores when `stores` is omitted)
+
+Standalone: python wms_api.py --data-folder parquet_uploads --port 8765
+(or --secrets .streamlit/secrets.toml for the GitHub folder the page uses).
+The page can also start it in its own process via the `api_port` secret, so
+both share the same cached bytes, decoded tables and rollups.
+"""
+import argparse
+import io
+import json
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pandas as pd
+import pyarrow as pa
+from wms_engine import (
+    add_weight_columns, build_daily_rollups, build_property_metrics, query_rollups, slice_cube, summarize_properties
+)
+import wms_sources
+from wms_shifts import calendars_from_settings
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+class TTLCache:
+    """Thread-safe memo with expiry, standing in for st.cache_data outside Streamlit"""
+    def __init__(self, ttl, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.key_locks = {}
+
+    def get(self, key, compute):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        # One computation per key; concurrent callers wait for it instead of repeating it
+        with key_lock:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None and entry[0] > time.monotonic():
+                    return entry[1]
+            try:
+                value = compute()
+                with self.lock:
+                    if len(self.entries) >= self.max_entries:
+                        self.entries.pop(min(self.entries, key=lambda k: self.entries[k][0]))
+                    self.entries[key] = (time.monotonic() + self.ttl, value)
+            finally:
+                # Also when compute() raises, or every failing key would keep its lock
+                with self.lock:
+                    if self.key_locks.get(key) is key_lock:
+                        del self.key_locks[key]
+            return value
+
+class ReportService:
+    """Report queries on top of three loaders, cached by whoever provides them.
+
+    list_files() -> store file entries, load_tables(file_id, dates) -> (df, actions),
+    load_rollups(file_id) -> prefix rollups. The page passes its st.cache_data
+    functions; from_source builds standalone ones. `day_cutoffs` maps store
+    name to the operational day cutoff of stores on a shift calendar.
+    """
+    def __init__(self, list_files, load_tables, load_rollups, day_cutoffs=None):
+        self.list_files = list_files
+        self.load_tables = load_tables
+        self.load_rollups = load_rollups
+        self.day_cutoffs = day_cutoffs or {}
+        self.summaries = TTLCache(ttl=300)
+
+    @classmethod
+    def from_source(cls, source, calendars=None):
+        """Standalone service: in-process caches over a store source and the shared IPC cache.
+
+        `calendars` maps store name to its shift calendar (see wms_shifts).
+        """
+        calendars = calendars or {}
+        files_cache, bytes_cache, rollups_cache = TTLCache(ttl=60), TTLCache(ttl=300), TTLCache(ttl=300)
+
+        def list_files():
+            return files_cache.get('files', source.list_files)
+
+        def fetch(url):
+            return bytes_cache.get(url, lambda: source.fetch(url))
+
+        def entry_and_calendar(file_id):
+            entry = next(f for f in list_files() if f['download_url'] == file_id)
+            return entry, calendars.get(entry['name'].replace('.parquet', ''))
+
+        def load_tables(file_id, selected_dates=None):
+            entry, calendar = entry_and_calendar(file_id)
+            return wms_sources.load_store_tables(fetch, entry, selected_dates, calendar=calendar)
+
+        def load_rollups(file_id):
+            def build():
+                df, actions = load_tables(file_id)
+                add_weight_columns(df)
+                calendar = entry_and_calendar(file_id)[1]
+                return build_daily_rollups(df, actions, calendar.day_cutoff if calendar is not None else None)
+            return rollups_cache.get(file_id, build)
+
+        return cls(list_files, load_tables, load_rollups,
+                   {store: calendar.day_cutoff for store, calendar in calendars.items()})
+
+    def file_id(self, store):
+        for f in self.list_files():
+            if f['name'].replace('.parquet', '') == store:
+                return f['download_url']
+        raise KeyError(f"Unknown store: {store}")
+
+    def store_dates(self, store, start=None, end=None):
+        """Dates with data for a store, optionally within [start, end]"""
+        dates = self.load_rollups(self.file_id(store))['dates']
+        if start is None:
+            return list(dates)
+        return list(dates[bisect_left(dates, start):bisect_right(dates, end)])
+
+    def stores(self):
+        names = [f['name'].replace('.parquet', '') for f in self.list_files()]
+        return pd.DataFrame({
+            'store': names,
+            'dates': [[d.strftime('%Y-%m-%d') for d in self.store_dates(name)] for name in names]
+        }), {}
+
+    def _slice(self, store, start, end, mode, by):
+        num_days = len(self.store_dates(store, start, end))
+        if num_days == 0:
+            raise ValueError(f"No data for {store} between {start:%Y-%m-%d} and {end:%Y-%m-%d}")
+        cube, totals = query_rollups(self.load_rollups(self.file_id(store)), start, end)
+        report = slice_cube(cube, by)
+        divisor = num_days if mode == 'average' and num_days > 1 else 1
+        meta = {
+            'store': store, 'start': f"{start:%Y-%m-%d}", 'end': f"{end:%Y-%m-%d}", 'days': num_days, 'mode': mode,
+            'real_picking_seconds': totals['real_picking_time'].total_seconds() / divisor,
+            'picking_finish': format_seconds_of_day(totals['finish_seconds'])
+        }
+        return report, divisor, meta
+
+    def department(self, store, start, end, mode):
+        report, divisor, meta = self._slice(store, start, end, mode, 'Cost Center')
+        rows = pd.DataFrame({
+            'cost_center': report['Cost Center'],
+            'orders': report['orders'] / divisor,
+            'requests': report['requests'] / divisor,
+            'kg': report['Kg'] / divisor,
+            'liters': report['Liters'] / divisor,
+            'weight': (report['Kg'] + report['Liters']) / divisor,
+            'picking_seconds': report['picking_time'].dt.total_seconds() / divisor
+        }).sort_values('weight', ascending=False, ignore_index=True)
+        return rows, meta
+
+    def workers(self, store, start, end, mode):
+        report, divisor, meta = self._slice(store, start, end, mode, 'Name')
+        picking_minutes = report['picking_time'].dt.total_seconds() / 60
+        weight = report['Kg'] + report['Liters']
+        rows = pd.DataFrame({
+            'picker': report['Name'],
+            'picking_seconds': report['picking_time'].dt.total_seconds() / divisor,
+            'requests': report['requests'] / divisor,
+            'requests_per_minute': report['requests'] / picking_minutes,
+            'kg': report['Kg'] / divisor,
+            'liters': report['Liters'] / divisor,
+            'weight': weight / divisor,
+            'weight_per_minute': weight / picking_minutes
+        }).sort_values('weight', ascending=False, ignore_index=True)
+        return rows, meta
+
+    def compare(self, stores, start, end, mode):
+        """Comparison table over the dates in [start, end] that every store has"""
+        stores = stores or [f['name'].replace('.parquet', '') for f in self.list_files()]
+        file_ids = [self.file_id(store) for store in stores]
+        common_dates = sorted(set.intersection(*[set(self.store_dates(store, start, end)) for store in stores]))
+        if not common_dates:
+            raise ValueError("No common dates for the selected stores")
+
+        def compute():
+            frames, action_frames = [], []
+            for store, file_id in zip(stores, file_ids):
+                df, actions = self.load_tables(file_id, common_dates)
+                frames.append(df.assign(Property=store))
+                action_frames.append(actions.assign(Property=store))
+            return summarize_properties(pd.concat(frames, ignore_index=True), len(common_dates),
+                                        pd.concat(action_frames, ignore_index=True), self.day_cutoffs)
+        summaries = self.summaries.get((tuple(file_ids), tuple(common_dates)), compute)
+
+        num_days = len(common_dates)
+        metrics = build_property_metrics({store: summaries[store] for store in stores}, num_days,
+                                         mode == 'average' and num_days > 1)
+        rows = pd.DataFrame({
+            'store': [m['name'] for m in metrics],
+            'picking_seconds': [m['picking_time'].total_seconds() for m in metrics],
+            'picking_finish': [m['picking_finish'].strftime('%H:%M:%S') if pd.notna(m['picking_finish']) else None for m in metrics],
+            'orders': [float(m['orders']) for m in metrics],
+            'requests': [float(m['requests']) for m in metrics],
+            'weight': [float(m['weight']) for m in metrics]
+        })
+        meta = {
+            'stores': stores, 'start': f"{start:%Y-%m-%d}", 'end': f"{end:%Y-%m-%d}", 'days': num_days, 'mode': mode,
+            'dates': [d.strftime('%Y-%m-%d') for d in common_dates]
+        }
+        return rows, meta
+
+def format_seconds_of_day(seconds):
+    if seconds is None:
+        return None
+    return (pd.Timestamp("2000-01-01") + pd.to_timedelta(int(seconds), unit='s')).strftime('%H:%M:%S')
+
+def parse_query(query):
+    """Query string -> keyword arguments of the ReportService methods"""
+    params = {key: values[-1] for key, values in parse_qs(query).items()}
+    args = {}
+    if 'start' in params:
+        args['start'] = pd.Timestamp(params['start']).normalize()
+        args['end'] = pd.Timestamp(params.get('end', params['start'])).normalize()
+        if args['start'] > args['end']:
+            raise ValueError("start must be before or equal to end")
+    mode = params.get('mode', 'average').lower()
+    if mode not in ('average', 'total'):
+        raise ValueError("mode must be average or total")
+    args['mode'] = mode
+    if 'store' in params:
+        args['store'] = params['store']
+    if 'stores' in params:
+        args['stores'] = [s for s in params['stores'].split(',') if s]
+    return args, params.get('format', 'json').lower()
+
+def encode_json(rows, meta):
+    return json.dumps(dict(meta, rows=json.loads(rows.to_json(orient='records')))).encode()
+
+def encode_arrow(rows, meta):
+    """Rows as an Arrow IPC stream; the JSON metadata rides in the schema metadata"""
+    table = pa.Table.from_pandas(rows, preserve_index=False).replace_schema_metadata({'wms': json.dumps(meta)})
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+def make_handler(service):
+    routes = {
+        '/stores': (service.stores, ()),
+        '/department': (service.department, ('store', 'start', 'end', 'mode')),
+        '/workers': (service.workers, ('store', 'start', 'end', 'mode')),
+        '/compare': (service.compare, ('stores', 'start', 'end', 'mode')),
+    }
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path not in routes:
+                return self.reply(404, {'error': f"Unknown endpoint: {url.path}"})
+            handler, arg_names = routes[url.path]
+            try:
+                args, output_format = parse_query(url.query)
+                missing = [name for name in arg_names if name not in args and name not in ('stores', 'end')]
+                if missing:
+                    raise ValueError(f"Missing parameter(s): {', '.join(missing)}")
+                rows, meta = handler(**{name: args.get(name) for name in arg_names})
+            except KeyError as e:
+                return self.reply(404, {'error': str(e.args[0])})
+            except ValueError as e:
+                return self.reply(400, {'error': str(e)})
+            except Exception as e:
+                return self.reply(500, {'error': str(e)})
+            if output_format == 'arrow':
+                self.send(200, ARROW_STREAM, encode_arrow(rows, meta))
+            else:
+                self.send(200, 'application/json', encode_json(rows, meta))
+
+        def reply(self, status, payload):
+            self.send(status, 'application/json', json.dumps(payload).encode())
+
+        def send(self, status, content_type, body):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def make_server(service, host, port):
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    return server
+
+def serve_in_background(service, host, port):
+    """Start the API on a daemon thread; returns the server (call shutdown() to stop)"""
+    server = make_server(service, host, port)
+    threading.Thread(target=server.serve_forever, name="wms-api", daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data-folder", help="serve store files from this local folder")
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml", help="secrets file with the GitHub settings")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    if args.data_folder:
+        settings = {'data_folder': args.data_folder}
+    else:
+        import tomllib
+        with open(args.secrets, "rb") as f:
+            settings = tomllib.load(f)
+    service = ReportService.from_source(wms_sources.source_from_settings(settings), calendars_from_settings(settings))
+    server = make_server(service, args.host, args.port)
+    print(f"Serving the WMS report API on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
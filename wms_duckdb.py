@@ -0,0 +1,241 @@
+"""DuckDB query backend: report aggregations as SQL straight over parquet files.
+
+DuckDB streams the files column by column, so only the small aggregated
+results are ever materialized in pandas. The pandas functions in
+wms_engine stay the reference implementation; everything here returns the
+same shapes so the page can swap engines freely.
+"""
+import os
+import tempfile
+import pandas as pd
+from datetime import timedelta
+from wms_engine import prefix_rollups
+
+try:
+    import duckdb
+except ImportError:  # optional dependency
+    duckdb = None
+
+# Line items of one store with the calc_kg / calc_l conversions; the
+# property name and parquet path are SQL string literals (see _sql_literal).
+LINES_SQL = '''
+    SELECT
+        {property} AS Property,
+        CAST(Date AS DATE) AS Date,
+        "Action Code" AS action_code,
+        "Action start" AS action_start,
+        "Action completion" AS action_completion,
+        "Cost Center" AS cost_center,
+        Name AS name,
+        Document AS document,
+        Code AS code,
+        file_row_number AS row_number,
+        CASE
+            WHEN upper(Unit) = 'KILOGRAM' THEN Quantity
+            WHEN upper("Reporting Unit") = 'KILOGRAM' THEN Quantity * Relationship
+            ELSE 0
+        END AS kg,
+        CASE
+            WHEN upper(Unit) = 'LITER' THEN Quantity
+            WHEN upper("Reporting Unit") = 'LITER' THEN Quantity * Relationship
+            ELSE 0
+        END AS liters
+    FROM read_parquet({path}, file_row_number = true)
+'''
+
+# One row per action. Every line of an action carries the same timestamps,
+# worker and cost center, so any aggregate picks the action's values.
+ACTIONS_SQL = '''
+    SELECT
+        Property,
+        action_code,
+        min(Date) AS Date,
+        min(cost_center) AS cost_center,
+        min(name) AS name,
+        min(action_start) AS action_start,
+        min(action_completion) AS action_completion
+    FROM lines
+    GROUP BY Property, action_code
+'''
+
+# Length of the union of action intervals per partition, mirroring
+# calculate_total_time_no_overlap: each action only counts past the latest
+# completion seen so far, and actions without a completion count nothing.
+UNION_SQL = '''
+    SELECT
+        {partition},
+        sum(CASE WHEN action_completion IS NULL THEN 0
+                 ELSE greatest(epoch(action_completion) - epoch(greatest(action_start, covered_until)), 0)
+            END) AS real_seconds
+    FROM (
+        SELECT
+            *,
+            greatest(
+                first_value(action_start) OVER w,
+                coalesce(max(action_completion) OVER (w ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING),
+                         first_value(action_start) OVER w)
+            ) AS covered_until
+        FROM actions
+        WINDOW w AS (PARTITION BY {partition} ORDER BY action_start, action_code)
+    )
+    GROUP BY {partition}
+'''
+
+# First line of each document on each date: the worker its order counts on
+DOCUMENTS_SQL = '''
+    SELECT Date, cost_center, document, arg_min(name, row_number) AS name
+    FROM lines
+    GROUP BY Date, cost_center, document
+'''
+
+# Per-date union of action intervals as disjoint runs, as daily_intervals:
+# a run starts wherever an action begins after every earlier one has ended.
+INTERVALS_SQL = '''
+    SELECT Date, min(action_start) AS "Action start", max(action_completion) AS "Action completion"
+    FROM (
+        SELECT *, sum(new_run) OVER (PARTITION BY Date ORDER BY action_start, action_completion ROWS UNBOUNDED PRECEDING) AS run
+        FROM (
+            SELECT
+                Date, action_start, action_completion,
+                CASE WHEN action_start <= max(action_completion) OVER (
+                         PARTITION BY Date ORDER BY action_start, action_completion
+                         ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING)
+                     THEN 0 ELSE 1 END AS new_run
+            FROM actions
+            WHERE action_completion > action_start
+        )
+    )
+    GROUP BY Date, run
+'''
+
+# Whole seconds from a day's midnight to its last completion, as
+# seconds_into_day: past the next day's cutoff ({cutoff} seconds after
+# midnight) a finish wraps to its time of day.
+FINISH_SQL = '''
+    floor(({elapsed} - {cutoff}) - 86400 * floor(({elapsed} - {cutoff}) / 86400) + {cutoff})
+'''
+
+def is_available():
+    return duckdb is not None
+
+def _sql_literal(value):
+    """Quoted SQL string literal; views cannot take prepared parameters"""
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _connect(sources, selected_dates=None):
+    """Open an in-memory connection with `lines` and `actions` views over the stores.
+
+    `sources` maps property name to a local parquet path. Both are views, so
+    every query scans the files lazily: only the columns it reads, with the
+    date filter pushed into the scan, and nothing is materialized up front.
+    """
+    # Aggregations live in DuckDB's buffer manager, which spills here instead of growing past RAM
+    con = duckdb.connect(config={'temp_directory': os.path.join(tempfile.gettempdir(), 'wms_report', 'duckdb')})
+    lines_sql = ' UNION ALL '.join(
+        LINES_SQL.format(property=_sql_literal(prop_name), path=_sql_literal(path)) for prop_name, path in sources.items()
+    )
+    if selected_dates is not None:
+        dates = ', '.join(f"DATE {_sql_literal(pd.Timestamp(d).date())}" for d in selected_dates)
+        lines_sql = f'SELECT * FROM ({lines_sql}) WHERE ' + (f'Date IN ({dates})' if dates else 'false')
+    con.execute(f'CREATE TEMP VIEW lines AS {lines_sql}')
+    con.execute(f'CREATE TEMP VIEW actions AS {ACTIONS_SQL}')
+    return con
+
+def query_daily_rollups(path, day_cutoff=None):
+    """DuckDB counterpart of build_daily_rollups for one store file.
+
+    Everything is aggregated in SQL: per-date cells, finish times, the
+    documents seen on more than one date and the per-date interval runs.
+    """
+    cutoff = day_cutoff.total_seconds() if day_cutoff else 0
+    con = _connect({'': path})
+    try:
+        cube = con.execute(f'''
+            WITH line_stats AS (
+                SELECT Date, cost_center, name,
+                       count(code) AS requests, sum(kg) AS Kg, sum(liters) AS Liters
+                FROM lines
+                GROUP BY ALL
+            ),
+            order_stats AS (
+                SELECT Date, cost_center, name, count(*) AS orders
+                FROM ({DOCUMENTS_SQL})
+                GROUP BY ALL
+            ),
+            time_stats AS (
+                SELECT Date, cost_center, name,
+                       sum(epoch(action_completion) - epoch(action_start)) AS picking_seconds
+                FROM actions
+                GROUP BY ALL
+            )
+            SELECT l.Date, l.cost_center AS "Cost Center", l.name AS Name,
+                   coalesce(o.orders, 0) AS orders, l.requests, l.Kg, l.Liters,
+                   coalesce(t.picking_seconds, 0) AS picking_seconds
+            FROM line_stats l
+            LEFT JOIN order_stats o USING (Date, cost_center, name)
+            LEFT JOIN time_stats t USING (Date, cost_center, name)
+        ''').df()
+        documents = con.execute(f'''
+            SELECT Date, cost_center AS "Cost Center", name AS Name, document AS Document
+            FROM ({DOCUMENTS_SQL})
+            QUALIFY count(*) OVER (PARTITION BY cost_center, document) > 1
+        ''').df()
+        intervals = con.execute(INTERVALS_SQL).df()
+        finish_sql = FINISH_SQL.format(elapsed='(epoch(max(action_completion)) - epoch(Date))', cutoff=float(cutoff))
+        store = con.execute(f'''
+            SELECT Date,
+                   coalesce({finish_sql}, 0) AS finish_seconds,
+                   CASE WHEN max(action_completion) IS NULL THEN 0 ELSE 1 END AS finish_days
+            FROM actions
+            GROUP BY Date
+        ''').df()
+    finally:
+        con.close()
+
+    for frame in (cube, documents, intervals, store):
+        frame['Date'] = pd.to_datetime(frame['Date']).astype('datetime64[ns]')
+    return prefix_rollups(cube, store.set_index('Date').astype(float), documents, intervals)
+
+def query_property_summaries(sources, selected_dates, day_cutoffs=None):
+    """DuckDB counterpart of summarize_properties; `sources` maps property to parquet path"""
+    day_cutoffs = {prop_name: cutoff for prop_name, cutoff in (day_cutoffs or {}).items() if cutoff}
+    cutoff_sql = ('CASE Property ' + ' '.join('WHEN ? THEN ?' for _ in day_cutoffs) + ' ELSE 0 END') if day_cutoffs else '0'
+    cutoff_params = [value for prop_name, cutoff in day_cutoffs.items() for value in (prop_name, cutoff.total_seconds())]
+    con = _connect(sources, selected_dates)
+    try:
+        totals = con.execute('''
+            SELECT Property, count(DISTINCT document) AS orders, count(*) AS requests,
+                   sum(kg) + sum(liters) AS weight
+            FROM lines
+            GROUP BY Property
+        ''').df().set_index('Property')
+        picking = con.execute(UNION_SQL.format(partition='Property')).df().set_index('Property')
+        finish_sql = FINISH_SQL.format(elapsed='(epoch(day_finish) - epoch(Date))', cutoff=f'({cutoff_sql})')
+        finish = con.execute(f'''
+            SELECT Property, max(day_finish) AS last_completion, avg({finish_sql}) AS avg_seconds
+            FROM (
+                SELECT Property, Date, max(action_completion) AS day_finish
+                FROM lines
+                GROUP BY Property, Date
+            )
+            GROUP BY Property
+        ''', cutoff_params * 3).df().set_index('Property')
+    finally:
+        con.close()
+
+    summaries = {}
+    for prop_name in sources:
+        if prop_name not in totals.index:
+            continue
+        if len(selected_dates) > 1:
+            picking_finish = pd.Timestamp("2000-01-01") + pd.to_timedelta(int(finish.loc[prop_name, 'avg_seconds']), unit='s')
+        else:
+            picking_finish = pd.Timestamp(finish.loc[prop_name, 'last_completion'])
+        summaries[prop_name] = {
+            'picking_time': timedelta(seconds=float(picking.loc[prop_name, 'real_seconds'])),
+            'picking_finish': picking_finish,
+            'orders': int(totals.loc[prop_name, 'orders']),
+            'requests': int(totals.loc[prop_name, 'requests']),
+            'weight': float(totals.loc[prop_name, 'weight'])
+        }
+    return summaries
@@ -0,0 +1,508 @@
+"""Report computations shared by the Streamlit page and its worker processes.
+
+Nothing in here touches Streamlit, so the functions can be imported by
+process-pool workers without re-running the page script.
+"""
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+# Column layout of a single-file store, and of its normalized actions / lines tables
+STORE_COLUMNS = [
+    'Date', 'Status', 'Action Code', 'Action start', 'Action completion', 'Action Description', 'Name',
+    'Code', 'Description', 'Quantity', 'Unit', 'Cost Center', 'Document', 'Reporting Unit', 'Relationship'
+]
+ACTION_COLUMNS = [
+    'Action Code', 'Date', 'Status', 'Action Description', 'Name', 'Cost Center', 'Action start', 'Action completion'
+]
+LINE_COLUMNS = ['Action Code', 'Document', 'Code', 'Description', 'Quantity', 'Unit', 'Reporting Unit', 'Relationship']
+
+# Native types of the temporal columns; files get them at ingest (see conform_store_table)
+TEMPORAL_COLUMNS = {'Date': pa.date32(), 'Action start': pa.timestamp('ns'), 'Action completion': pa.timestamp('ns')}
+
+def check_store_schema(schema):
+    """Reject files whose temporal columns are not stored as parquet date / timestamp types"""
+    for column in TEMPORAL_COLUMNS:
+        if column in schema.names:
+            column_type = schema.field(column).type
+            if not (pa.types.is_date(column_type) or pa.types.is_timestamp(column_type)):
+                raise ValueError(f"'{column}' is stored as {column_type}; convert the file with normalize_store.py")
+
+def conform_store_table(table):
+    """Ingest-time conversion of the temporal columns to date32 / timestamp[ns].
+
+    Legacy text columns are parsed here, once, so loading never has to.
+    """
+    for column, column_type in TEMPORAL_COLUMNS.items():
+        if column not in table.column_names:
+            continue
+        values = table[column]
+        if not (pa.types.is_date(values.type) or pa.types.is_timestamp(values.type)):
+            parsed = pd.to_datetime(values.to_pandas())
+            if column == 'Date':
+                parsed = parsed.dt.normalize()
+            values = pa.array(parsed, type=pa.timestamp('ns'))
+        table = table.set_column(table.column_names.index(column), column, values.cast(column_type))
+    # Stale pandas metadata would turn the converted columns back into their old dtypes
+    return table.replace_schema_metadata(None)
+
+def arrow_to_frame(table):
+    """Arrow table or batch to pandas, keeping temporal columns as datetime64[ns]"""
+    return table.to_pandas(date_as_object=False, coerce_temporal_nanoseconds=True)
+
+# Text columns with at most this share of distinct values are held as categories
+CATEGORY_MAX_SHARE = 0.5
+
+def compact_frame(df):
+    """Smallest lossless dtypes, in place: float32 where every value round-trips, categories for repetitive text.
+
+    Store files are mostly a handful of names, units and cost centers repeated
+    on every line; as categories they cost one small integer per row.
+    """
+    for column in df.columns:
+        values = df[column]
+        if values.dtype == 'float64':
+            narrow = values.to_numpy().astype('float32')
+            if np.array_equal(narrow.astype('float64'), values.to_numpy(), equal_nan=True):
+                df[column] = narrow
+        elif pd.api.types.is_string_dtype(values.dtype) and len(values):
+            if values.nunique() <= CATEGORY_MAX_SHARE * len(values):
+                df[column] = values.astype('category')
+    return df
+
+def _read_parquet(source, columns=None):
+    table = pq.read_table(source, columns=columns, memory_map=isinstance(source, str))
+    check_store_schema(table.schema)
+    return arrow_to_frame(table)
+
+def _filter_dates(df, selected_dates):
+    if isinstance(selected_dates, list):
+        return df[df['Date'].isin(selected_dates)]
+    return df[df['Date'] == selected_dates]
+
+def read_store_frame(source):
+    """Decode a whole store file (bytes buffer or local path); dates stay datetime64"""
+    return _read_parquet(source)
+
+def read_store_dates(source, calendar=None):
+    """Sorted unique dates (Timestamps) of a store or actions file, reading only 'Date'.
+
+    With a shift calendar (see wms_shifts) the dates are operational days,
+    which also needs 'Action start'.
+    """
+    if calendar is None or not calendar.key:
+        return sorted(_read_parquet(source, columns=['Date'])['Date'].unique())
+    frame = _read_parquet(source, columns=['Date', 'Action start'])
+    return sorted(calendar.operational_dates(frame['Action start'], frame['Date']).unique())
+
+def read_filtered_frame(source, selected_dates):
+    """Decode a store file (bytes buffer or local path) and keep only the selected dates"""
+    return _filter_dates(read_store_frame(source), selected_dates)
+
+def write_ipc_partitions(df, actions, cache_dir):
+    """Cache decoded line items and actions as uncompressed Arrow IPC files, one pair per date.
+
+    Line partitions keep the original row number in '_row' so reads spanning
+    several dates can restore file order ("first line" semantics depend on it).
+    The folder is built aside and renamed into place, so readers never see a
+    partial cache; if another writer got there first its copy is kept.
+    """
+    parent = os.path.dirname(cache_dir)
+    os.makedirs(parent, exist_ok=True)
+    build_dir = tempfile.mkdtemp(dir=parent)
+    lines = df.assign(_row=range(len(df)))
+    for day, day_lines in lines.groupby('Date', sort=True):
+        day_actions = actions[actions['Date'] == day]
+        for suffix, frame in (('', day_lines), ('.actions', day_actions)):
+            table = pa.Table.from_pandas(frame, preserve_index=False).replace_schema_metadata(None)
+            with pa.OSFile(os.path.join(build_dir, f"{day:%Y-%m-%d}{suffix}.arrow"), 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+    try:
+        os.rename(build_dir, cache_dir)
+    except OSError:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+def read_ipc_partitions(cache_dir, selected_dates=None):
+    """Memory-map the cached partitions of the selected dates (all when None).
+
+    Returns (df, actions) like read_normalized_frame.
+    """
+    if selected_dates is None:
+        days = sorted(name[:-len('.arrow')] for name in os.listdir(cache_dir) if not name.endswith('.actions.arrow'))
+    else:
+        dates = selected_dates if isinstance(selected_dates, list) else [selected_dates]
+        days = [f"{day:%Y-%m-%d}" for day in sorted(dates)]
+
+    def read_tables(suffix):
+        tables = []
+        for day in days:
+            path = os.path.join(cache_dir, f"{day}{suffix}.arrow")
+            if os.path.exists(path):
+                tables.append(pa.ipc.open_file(pa.memory_map(path)).read_all())
+        return tables
+
+    line_tables, action_tables = read_tables(''), read_tables('.actions')
+    if not line_tables:
+        return pd.DataFrame(columns=STORE_COLUMNS), pd.DataFrame(columns=ACTION_COLUMNS)
+    lines = pa.concat_tables(line_tables)
+    if len(line_tables) > 1:
+        lines = lines.take(pc.sort_indices(lines['_row']))
+    df = arrow_to_frame(lines.drop_columns(['_row']))
+    return df, arrow_to_frame(pa.concat_tables(action_tables))
+
+def split_line_items(df):
+    """Split wide line items into (actions, lines) tables joined on 'Action Code'.
+
+    Raises ValueError if an action's lines disagree on an action-level column.
+    """
+    actions = df.drop_duplicates('Action Code')[ACTION_COLUMNS].reset_index(drop=True)
+    if len(df[ACTION_COLUMNS].drop_duplicates()) != len(actions):
+        raise ValueError("Lines of the same Action Code disagree on action-level columns")
+    return actions, df[LINE_COLUMNS].reset_index(drop=True)
+
+def join_line_items(actions, lines):
+    """Rebuild the wide line-item frame (lines keep their stored order)"""
+    return lines.merge(actions, on='Action Code', how='inner')[STORE_COLUMNS]
+
+def read_normalized_frame(lines_source, actions_source, selected_dates=None):
+    """Decode a normalized store, optionally keeping only the selected dates.
+
+    Returns (df, actions): the wide line-item frame and the action table it was
+    joined from, so callers can run the interval math on the smaller table.
+    """
+    actions = _read_parquet(actions_source)
+    if selected_dates is not None:
+        actions = _filter_dates(actions, selected_dates)
+    return join_line_items(actions, _read_parquet(lines_source)), actions
+
+# Helper functions
+def calc_kg(row):
+    if str(row['Unit']).upper() == 'KILOGRAM':
+        return row['Quantity']
+    elif pd.notna(row['Reporting Unit']) and str(row['Reporting Unit']).upper() == 'KILOGRAM':
+        return row['Quantity'] * row['Relationship']
+    return 0
+
+def calc_l(row):
+    if str(row['Unit']).upper() == 'LITER':
+        return row['Quantity']
+    elif pd.notna(row['Reporting Unit']) and str(row['Reporting Unit']).upper() == 'LITER':
+        return row['Quantity'] * row['Relationship']
+    return 0
+
+def format_timedelta(td):
+    total_seconds = int(td.total_seconds())
+    hours = total_seconds // 3600
+    minutes = (total_seconds % 3600) // 60
+    seconds = total_seconds % 60
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+def add_weight_columns(df):
+    """Vectorized calc_kg / calc_l: adds 'Kg' and 'Liters' columns in place"""
+    unit = df['Unit'].str.upper()
+    reporting_unit = df['Reporting Unit'].str.upper()
+    converted = df['Quantity'] * df['Relationship']
+    for column, unit_name in (('Kg', 'KILOGRAM'), ('Liters', 'LITER')):
+        weight = converted.where(reporting_unit == unit_name, 0.0)
+        df[column] = df['Quantity'].where(unit == unit_name, weight)
+    return df
+
+def calculate_total_time_no_overlap(actions_df, by=None):
+    """Length of the union of action intervals, optionally per group.
+
+    Returns a timedelta, or a Series of timedeltas indexed by `by` when given.
+    Actions without a completion are ignored, as in the original row loop.
+    """
+    if by is None:
+        if actions_df.empty:
+            return timedelta(0)
+        totals = calculate_total_time_no_overlap(actions_df.assign(_group=0), by='_group')
+        return totals.iloc[0].to_pytimedelta()
+
+    sorted_actions = actions_df.sort_values([by, 'Action start'], kind='stable')
+    groups = sorted_actions[by]
+    start = sorted_actions['Action start']
+    # A missing completion never extends the covered span, so it can stand in as the group's first start
+    first_start = start.groupby(groups).transform('first')
+    end = sorted_actions['Action completion'].fillna(first_start)
+    covered_until = end.groupby(groups).cummax().groupby(groups).shift().fillna(first_start)
+    effective_start = start.where(start > covered_until, covered_until)
+    contribution = (end - effective_start).clip(lower=pd.Timedelta(0))
+    contribution = contribution.where(sorted_actions['Action completion'].notna(), pd.Timedelta(0))
+    return contribution.groupby(groups).sum()
+
+CUBE_KEYS = ['Date', 'Cost Center', 'Name']
+CUBE_METRICS = ['orders', 'requests', 'Kg', 'Liters', 'picking_time']
+
+def unique_actions(df, by=None):
+    """One row per action (per `by` group when given) with its date, owner and timestamps"""
+    keys = ([by] if by else []) + ['Action Code']
+    return df.groupby(keys, sort=False).agg({
+        'Date': 'first',
+        'Cost Center': 'first',
+        'Name': 'first',
+        'Action start': 'first',
+        'Action completion': 'first'
+    }).reset_index()
+
+def build_report_cube(day_df, actions=None):
+    """Aggregate line items once into a Date x Cost Center x Name cube.
+
+    Returns (cube, actions). Orders are counted on the first line of each
+    (Cost Center, Document) pair, so summing a cost center's cells gives its
+    unique order count. Picking time is the sum of unique action durations.
+    `actions` can be passed in when the store is already normalized.
+    """
+    actions = unique_actions(day_df) if actions is None else actions.copy()
+    actions['picking_time'] = actions['Action completion'] - actions['Action start']
+
+    line_stats = day_df.groupby(CUBE_KEYS).agg(
+        requests=('Code', 'count'),
+        Kg=('Kg', 'sum'),
+        Liters=('Liters', 'sum')
+    )
+    first_docs = day_df.drop_duplicates(['Cost Center', 'Document'])
+    line_stats['orders'] = first_docs.groupby(CUBE_KEYS).size()
+    line_stats['picking_time'] = actions.groupby(CUBE_KEYS)['picking_time'].sum()
+
+    cube = line_stats.reset_index()
+    cube['orders'] = cube['orders'].fillna(0).astype(int)
+    cube['picking_time'] = cube['picking_time'].fillna(timedelta(0))
+    return cube[CUBE_KEYS + CUBE_METRICS], actions
+
+def slice_cube(cube, by, cost_center=None):
+    """Roll the cube up to one dimension, optionally within a single cost center"""
+    if cost_center is not None:
+        cube = cube[cube['Cost Center'] == cost_center]
+    if by == 'Name':
+        cube = cube.assign(Name=cube['Name'].str.title())
+    return cube.groupby(by)[CUBE_METRICS].sum().reset_index()
+
+ROLLUP_METRICS = ['orders', 'requests', 'Kg', 'Liters', 'picking_seconds']
+
+def first_document_lines(df):
+    """Date, Cost Center, Name and Document of the first line of each document on each date"""
+    return df.drop_duplicates(['Date', 'Cost Center', 'Document'])[['Date', 'Cost Center', 'Name', 'Document']]
+
+def repeated_documents(documents):
+    """Rows of first_document_lines whose (Cost Center, Document) shows up on more than one date"""
+    return documents[documents.duplicated(['Cost Center', 'Document'], keep=False)]
+
+def daily_intervals(actions, by=None):
+    """Per-date union of action intervals: Date, Action start and Action completion of each disjoint run.
+
+    Runs are per `by` group too when given. Actions without a completion, or
+    ending before they start, cover nothing, as in
+    calculate_total_time_no_overlap; runs passed back in come out unchanged.
+    """
+    keys = ([by] if by else []) + ['Date']
+    valid = actions[actions['Action completion'] > actions['Action start']]
+    valid = valid[keys + ['Action start', 'Action completion']].sort_values(keys + ['Action start'], kind='stable')
+    groups = [valid[key] for key in keys]
+    covered_until = valid.groupby(groups)['Action completion'].cummax().groupby(groups).shift()
+    run_ids = (covered_until.isna() | (valid['Action start'] > covered_until)).cumsum()
+    runs = valid.groupby(run_ids.to_numpy()).agg({**{key: 'first' for key in keys}, 'Action start': 'min', 'Action completion': 'max'})
+    return runs.reset_index(drop=True)
+
+def build_daily_rollups(df, actions=None, day_cutoff=None):
+    """Prefix sums over days of a whole store file, for fast range queries.
+
+    `df` is every line item of one store with Kg/Liters. Metrics and finish
+    times are summed per day, orders counted per day; documents seen on more
+    than one date and the per-date union of action intervals keep orders and
+    the real (non-overlap) time exact over ranges (see prefix_rollups).
+    """
+    cube, actions = build_report_cube(df, actions)
+    cube['picking_seconds'] = cube['picking_time'].dt.total_seconds()
+    documents = first_document_lines(df)
+    daily_orders = documents.groupby(CUBE_KEYS).size().rename('orders').reset_index()
+    cube = cube.drop(columns='orders').merge(daily_orders, on=CUBE_KEYS, how='left').fillna({'orders': 0})
+    return prefix_rollups(cube, daily_store_stats(actions, day_cutoff), repeated_documents(documents), daily_intervals(actions))
+
+def seconds_into_day(daily_finish, day_cutoff=None):
+    """Whole seconds from each day's midnight to its last completion; `daily_finish` is indexed by (.., 'Date').
+
+    A completion before the next operational day starts (the next midnight
+    plus the store's `day_cutoff`, see wms_shifts) counts past 24 h, so night
+    shifts average correctly; later ones, like actions left open for days,
+    wrap to their time of day. Without a cutoff this is the time of day.
+    `day_cutoff` is a Timedelta, or a dict of them by 'Property'.
+    """
+    days = pd.to_datetime(daily_finish.index.get_level_values('Date'))
+    if isinstance(day_cutoff, dict):
+        properties = daily_finish.index.get_level_values('Property')
+        day_cutoff = pd.to_timedelta([day_cutoff.get(prop, pd.Timedelta(0)) for prop in properties]).to_numpy()
+    elif day_cutoff is None:
+        day_cutoff = pd.Timedelta(0)
+    elapsed = (daily_finish - days - day_cutoff) % pd.Timedelta(days=1) + day_cutoff
+    return elapsed.dt.total_seconds() // 1
+
+def daily_store_stats(actions, day_cutoff=None):
+    """Per-date finish time (seconds into the day, see seconds_into_day) of unique actions"""
+    daily_finish = actions.groupby('Date')['Action completion'].max()
+    finish_seconds = seconds_into_day(daily_finish, day_cutoff)
+    return pd.DataFrame({
+        'finish_seconds': finish_seconds.fillna(0),
+        'finish_days': finish_seconds.notna().astype(int)
+    })
+
+def prefix_rollups(cube, store, documents, intervals):
+    """Turn daily aggregates into the frames read by query_rollups.
+
+    `cube` has Date, Cost Center, Name and ROLLUP_METRICS, orders counted
+    per date; `store` is indexed by Date with finish_seconds and
+    finish_days. Both become cumulative over the sorted store dates: 'cells'
+    (metrics per Cost Center x Name) and 'store'. Orders and the real time
+    do not add up over days, as documents and actions run past midnight, so
+    `documents` (repeated_documents) and `intervals` (daily_intervals) are
+    kept sorted by date to correct them per range.
+    """
+    cells = cube.pivot_table(index='Date', columns=['Cost Center', 'Name'], values=ROLLUP_METRICS,
+                             aggfunc='sum', fill_value=0)
+    dates = sorted(cube['Date'].unique())
+    return {
+        'dates': dates,
+        'cells': cells.reindex(dates, fill_value=0).cumsum(),
+        'store': store.reindex(dates, fill_value=0).cumsum(),
+        'documents': documents.sort_values('Date', kind='stable', ignore_index=True),
+        'intervals': intervals.sort_values('Date', kind='stable', ignore_index=True)
+    }
+
+def _rows_between(table, start_date, end_date):
+    """Rows of a date-sorted table in [start_date, end_date]"""
+    dates = table['Date']
+    return table.iloc[dates.searchsorted(start_date, 'left'):dates.searchsorted(end_date, 'right')]
+
+def query_rollups(rollups, start_date, end_date):
+    """Totals for the store days in [start_date, end_date].
+
+    Metrics come from two prefix rows. A document seen on several dates of
+    the range only counts on the worker of its first line on its earliest
+    date, so its later dates are taken back off; the real time is the union
+    of the range's per-date intervals. Returns (cube, totals): a cube with
+    one row per active (Cost Center, Name) pair, as consumed by slice_cube,
+    and the store-level real picking time and average finish (seconds into
+    the day, None when unknown).
+    """
+    dates = rollups['dates']
+    last = bisect_right(dates, end_date) - 1
+    before = bisect_left(dates, start_date) - 1
+
+    def between(prefix):
+        totals = prefix.iloc[last] if last >= 0 else prefix.iloc[0] * 0
+        if before >= 0:
+            totals = totals - prefix.iloc[before]
+        # Rounding drops float noise left by the subtraction; adding 0.0 turns -0.0 into 0.0
+        return totals.round(6) + 0.0
+
+    cells = between(rollups['cells']).unstack(level=0)
+    documents = _rows_between(rollups['documents'], start_date, end_date)
+    later = documents[documents.duplicated(['Cost Center', 'Document'])]
+    if not later.empty:
+        recounted = later.groupby(['Cost Center', 'Name'], observed=True).size()
+        cells['orders'] = cells['orders'].sub(recounted.reindex(cells.index, fill_value=0).to_numpy())
+    cells = cells[(cells['requests'] > 0) | (cells['picking_seconds'] > 0)].reset_index()
+    cells['orders'] = cells['orders'].astype(int)
+    cells['requests'] = cells['requests'].astype(int)
+    cells['picking_time'] = pd.to_timedelta(cells['picking_seconds'], unit='s')
+    cube = cells[['Cost Center', 'Name'] + CUBE_METRICS]
+
+    store = between(rollups['store'])
+    totals = {
+        'real_picking_time': calculate_total_time_no_overlap(_rows_between(rollups['intervals'], start_date, end_date)),
+        'finish_seconds': store['finish_seconds'] / store['finish_days'] if store['finish_days'] > 0 else None
+    }
+    return cube, totals
+
+def summarize_properties(df, num_dates, actions=None, day_cutoffs=None):
+    """Store-level totals for the comparison tables (before Average/Total scaling).
+
+    `df` holds the filtered line items of any number of stores with a
+    'Property' column; everything is computed in one grouped pass.
+    `actions` (with 'Property') can be passed in for normalized stores, and
+    `day_cutoffs` maps property to its operational day cutoff.
+    Returns {property: summary}.
+    """
+    add_weight_columns(df)
+    by_property = df.groupby('Property', sort=False)
+
+    if actions is None:
+        actions = unique_actions(df, by='Property')
+    picking_times = calculate_total_time_no_overlap(actions, by='Property')
+
+    # For date ranges, calculate average picking finish time per day
+    # (every line of an action shares its completion, so the action table gives the same maxima)
+    if num_dates > 1:
+        daily_finish = actions.groupby(['Property', 'Date'])['Action completion'].max()
+        finish_times = seconds_into_day(daily_finish, day_cutoffs)
+        avg_seconds = finish_times.groupby(level='Property').mean()
+        picking_finish = pd.Timestamp("2000-01-01") + pd.to_timedelta(avg_seconds.astype(int), unit='s')
+    else:
+        picking_finish = actions.groupby('Property')['Action completion'].max()
+
+    totals = pd.DataFrame({
+        'orders': by_property['Document'].nunique(),
+        'requests': by_property.size(),
+        'weight': by_property['Kg'].sum() + by_property['Liters'].sum()
+    })
+    return {
+        prop_name: {
+            'picking_time': picking_times[prop_name].to_pytimedelta(),
+            'picking_finish': picking_finish[prop_name],
+            'orders': int(row['orders']),
+            'requests': int(row['requests']),
+            'weight': row['weight']
+        }
+        for prop_name, row in totals.iterrows()
+    }
+
+def build_property_metrics(summaries, num_days, is_average_mode):
+    """Scale store summaries for display (Average divides range totals by the number of days)"""
+    property_metrics = []
+    for prop_name, summary in summaries.items():
+        total_picking_time = summary['picking_time']
+        picking_finish = summary['picking_finish']
+        total_orders = summary['orders']
+        total_requests = summary['requests']
+        total_weight = summary['weight']
+
+        # Apply average mode if selected
+        if is_average_mode:
+            display_picking_time = total_picking_time / num_days
+            display_orders = total_orders / num_days
+            display_requests = total_requests / num_days
+            display_weight = total_weight / num_days
+        else:
+            display_picking_time = total_picking_time
+            display_orders = total_orders
+            display_requests = total_requests
+            display_weight = total_weight
+
+        property_metrics.append({
+            'name': prop_name,
+            'picking_time': display_picking_time,
+            'picking_finish': picking_finish,
+            'orders': display_orders,
+            'requests': display_requests,
+            'weight': display_weight
+        })
+    return property_metrics
+
+def summarize_property(df, num_dates, actions=None, day_cutoff=None):
+    """Totals for a single store"""
+    if actions is not None:
+        actions = actions.assign(Property='')
+    return summarize_properties(df.assign(Property=''), num_dates, actions, {'': day_cutoff} if day_cutoff else None)['']
+
+def summarize_store_file(path, selected_dates, day_cutoff=None):
+    """Process-pool entry point: memory-map a staged store file and summarize it"""
+    df = read_filtered_frame(path, selected_dates)
+    return summarize_property(df, len(selected_dates), day_cutoff=day_cutoff)
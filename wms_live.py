@@ -0,0 +1,148 @@
+"""Live monitor: today's Daily Monitor kept current from the actions completed since the last refresh.
+
+Store files still arrive as whole-file replacements, so a refresh asks the
+source whether the file changed (ETag / mtime) and, when it did, decodes only
+today's rows completed at or after the high-water mark (an Arrow filter on
+'Date' and 'Action completion'). Those rows are folded into running per
+Cost Center x Name totals and a compacted union of action intervals; nothing
+already ingested is read or aggregated again.
+"""
+import io
+import threading
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from datetime import timedelta
+from wms_engine import ROLLUP_METRICS, CUBE_METRICS, add_weight_columns, arrow_to_frame, check_store_schema, join_line_items
+
+CELL_KEYS = ['Cost Center', 'Name']
+
+def merge_intervals(intervals):
+    """Sorted, disjoint union of [start, end] rows (int64 nanoseconds)"""
+    if len(intervals) == 0:
+        return intervals
+    intervals = intervals[np.argsort(intervals[:, 0], kind='stable')]
+    covered_until = np.maximum.accumulate(intervals[:, 1])
+    # A new run starts wherever an interval begins after everything before it has ended
+    run_starts = np.concatenate([[True], intervals[1:, 0] > covered_until[:-1]])
+    run_ids = np.cumsum(run_starts) - 1
+    ends = np.zeros(run_ids[-1] + 1, dtype='int64')
+    np.maximum.at(ends, run_ids, covered_until)
+    return np.column_stack([intervals[run_starts, 0], ends])
+
+def _read_rows(data, expr, columns=None):
+    table = pq.read_table(io.BytesIO(data), columns=columns, filters=expr)
+    check_store_schema(table.schema)
+    return arrow_to_frame(table)
+
+class LiveMonitor:
+    """Incremental Daily Monitor state for one store and day, shared by every session watching it.
+
+    Only completed actions are shown: an action enters the totals once its
+    completion is in the file, with all of its lines. With a shift calendar
+    (see wms_shifts) the day is an operational day: actions starting between
+    its cutoff and the next day's.
+    """
+    def __init__(self, source, entry, day, min_interval=10, calendar=None):
+        self.source = source
+        self.entry = entry
+        self.day = pd.Timestamp(day).normalize()
+        self.cutoff = calendar.day_cutoff if calendar is not None else pd.Timedelta(0)
+        self.min_interval = min_interval
+        self.lock = threading.Lock()
+        self.tags = {}
+        self.data = {}
+        self.high_water = None
+        self.seen_actions = set()
+        self.seen_documents = set()
+        self.cells = pd.DataFrame(0.0, index=pd.MultiIndex.from_tuples([], names=CELL_KEYS), columns=ROLLUP_METRICS)
+        self.intervals = np.empty((0, 2), dtype='int64')
+        self.finish = None
+        self.version = 0
+        self.refreshed_at = None
+
+    def refresh(self):
+        """Fold in the actions completed since the last refresh; returns the data version"""
+        with self.lock:
+            if self.refreshed_at is not None and time.monotonic() - self.refreshed_at < self.min_interval:
+                return self.version
+            self.refreshed_at = time.monotonic()
+            urls = [self.entry['download_url']] + ([self.entry['actions_url']] if self.entry.get('actions_url') else [])
+            changed = False
+            for url in urls:
+                data, self.tags[url] = self.source.fetch_changed(url, self.tags.get(url))
+                if data is not None:
+                    self.data[url], changed = data, True
+            if changed:
+                df, actions = self._read_delta()
+                if not actions.empty:
+                    self._ingest(df, actions)
+                    self.version += 1
+            return self.version
+
+    def _day_filter(self):
+        if self.cutoff:
+            day_start = self.day + self.cutoff
+            expr = ((pc.field('Action start') >= pa.scalar(day_start, pa.timestamp('ns'))) &
+                    (pc.field('Action start') < pa.scalar(day_start + pd.Timedelta(days=1), pa.timestamp('ns'))))
+        else:
+            expr = pc.field('Date') == pa.scalar(self.day.date(), pa.date32())
+        if self.high_water is None:
+            return expr & pc.field('Action completion').is_valid()
+        # Equal completions can arrive in a later file; the seen set drops the ones already counted
+        return expr & (pc.field('Action completion') >= pa.scalar(self.high_water, pa.timestamp('ns')))
+
+    def _read_delta(self):
+        """Line items and unique actions of today's newly completed actions"""
+        lines_data = self.data[self.entry['download_url']]
+        if self.entry.get('actions_url'):
+            actions = _read_rows(self.data[self.entry['actions_url']], self._day_filter())
+            actions = actions[~actions['Action Code'].isin(self.seen_actions)]
+            lines = _read_rows(lines_data, pc.field('Action Code').isin(pa.array(actions['Action Code'])))
+            df = join_line_items(actions, lines)
+        else:
+            df = _read_rows(lines_data, self._day_filter())
+            df = df[~df['Action Code'].isin(self.seen_actions)]
+            actions = df.drop_duplicates('Action Code')
+        return df, actions[['Action Code', 'Cost Center', 'Name', 'Action start', 'Action completion']]
+
+    def _ingest(self, df, actions):
+        add_weight_columns(df)
+        # Documents count as orders on their first line: file order within a refresh, arrival order across them
+        first_docs = df.drop_duplicates(['Cost Center', 'Document'])
+        first_docs = first_docs[[doc not in self.seen_documents for doc in zip(first_docs['Cost Center'], first_docs['Document'])]]
+        picking_seconds = (actions['Action completion'] - actions['Action start']).dt.total_seconds()
+
+        delta = df.groupby(CELL_KEYS).agg(requests=('Code', 'count'), Kg=('Kg', 'sum'), Liters=('Liters', 'sum'))
+        delta['orders'] = first_docs.groupby(CELL_KEYS).size()
+        delta['picking_seconds'] = picking_seconds.groupby([actions['Cost Center'], actions['Name']]).sum()
+        self.cells = self.cells.add(delta[ROLLUP_METRICS].fillna(0), fill_value=0)
+
+        new_intervals = np.column_stack([actions['Action start'].to_numpy('int64'), actions['Action completion'].to_numpy('int64')])
+        self.intervals = merge_intervals(np.concatenate([self.intervals, new_intervals]))
+        latest = actions['Action completion'].max()
+        self.finish = latest if self.finish is None else max(self.finish, latest)
+        self.high_water = self.finish
+        self.seen_actions.update(actions['Action Code'])
+        self.seen_documents.update(zip(first_docs['Cost Center'], first_docs['Document']))
+
+    def report(self):
+        """(cube, totals) shaped like query_rollups for today"""
+        with self.lock:
+            cells = self.cells.reset_index()
+            intervals = self.intervals
+            finish = self.finish
+        cells['orders'] = cells['orders'].astype(int)
+        cells['requests'] = cells['requests'].astype(int)
+        cells['picking_time'] = pd.to_timedelta(cells['picking_seconds'], unit='s')
+        union_ns = int((np.maximum(intervals[:, 1] - intervals[:, 0], 0)).sum())
+        totals = {
+            'real_picking_time': timedelta(microseconds=union_ns // 1000),
+            # As seconds_into_day: past the next day's cutoff a finish wraps to its time of day
+            'finish_seconds': ((finish - self.day - self.cutoff) % pd.Timedelta(days=1) + self.cutoff).total_seconds() // 1
+                              if finish is not None else None
+        }
+        return cells[CELL_KEYS + CUBE_METRICS], totals
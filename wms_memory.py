@@ -0,0 +1,148 @@
+"""Memory budget for the frames sessions keep between reruns, spilling cold ones to local disk.
+
+Nothing in here touches Streamlit. The page wraps what it keeps in
+session state (comparison frames, the daily cube) in SessionFrames handles
+registered with one process-wide MemoryBudget. When a session holds more than
+its limit, or all sessions together more than the process limit, the least
+recently used frames are written to uncompressed Arrow IPC files and dropped
+from memory; reading them through the handle maps them back in.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+import pandas as pd
+import pyarrow as pa
+from wms_engine import arrow_to_frame
+from wms_sources import CACHE_ROOT
+
+SPILL_ROOT = os.path.join(CACHE_ROOT, "spill")
+
+def frame_nbytes(df):
+    """Bytes a frame holds, counting string and category contents"""
+    return int(df.memory_usage(deep=True).sum())
+
+class SessionFrames:
+    """Dict-like values one session keeps between reruns; DataFrame values may be spilled to disk"""
+    def __init__(self, budget, session, values):
+        self.budget = budget
+        self.session = session
+        self.frames = {key: value for key, value in values.items() if isinstance(value, pd.DataFrame)}
+        self.others = {key: value for key, value in values.items() if key not in self.frames}
+        self.sizes = {key: frame_nbytes(df) for key, df in self.frames.items()}
+        self.spilled = {}
+        self.last_used = time.monotonic()
+        self.spill_dir = os.path.join(budget.spill_dir, uuid.uuid4().hex)
+        # Spill files go when the session state holding this handle is dropped
+        weakref.finalize(self, shutil.rmtree, self.spill_dir, True)
+
+    def __contains__(self, key):
+        return key in self.frames or key in self.spilled or key in self.others
+
+    def __getitem__(self, key):
+        self.last_used = time.monotonic()
+        if key in self.others:
+            return self.others[key]
+        with self.budget.lock:
+            if key in self.spilled:
+                path = self.spilled.pop(key)
+                self.frames[key] = arrow_to_frame(pa.ipc.open_file(pa.memory_map(path)).read_all())
+                os.remove(path)
+            value = self.frames[key]
+        self.budget.enforce(keep=self)
+        return value
+
+    def __setitem__(self, key, value):
+        if isinstance(value, pd.DataFrame):
+            raise TypeError("Frames are set when the handle is created")
+        self.others[key] = value
+
+    @property
+    def memory_bytes(self):
+        return sum(self.sizes[key] for key in self.frames)
+
+    @property
+    def spilled_bytes(self):
+        return sum(self.sizes[key] for key in self.spilled)
+
+    def spill(self):
+        """Write every in-memory frame to disk and drop it; called with the budget lock held"""
+        os.makedirs(self.spill_dir, exist_ok=True)
+        for key, df in list(self.frames.items()):
+            path = os.path.join(self.spill_dir, f"{len(self.spilled)}-{uuid.uuid4().hex[:8]}.arrow")
+            table = pa.Table.from_pandas(df)
+            with pa.OSFile(path, 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            self.spilled[key] = path
+            del self.frames[key]
+
+class MemoryBudget:
+    """Per-session and per-process limits (bytes) on the frames held through SessionFrames handles.
+
+    Only frames registered here are counted; shared caches (st.cache_data,
+    the on-disk IPC partitions) are outside the budget.
+    """
+    def __init__(self, session_limit, process_limit, spill_dir=None):
+        self.session_limit = session_limit
+        self.process_limit = process_limit
+        self.spill_dir = spill_dir or tempfile.mkdtemp(prefix="budget-", dir=_spill_root())
+        self.lock = threading.RLock()
+        self.handles = weakref.WeakValueDictionary()
+
+    def hold(self, session, name, values):
+        """Register `values` as session's `name` (replacing its previous one) and return the handle"""
+        handle = SessionFrames(self, session, values)
+        with self.lock:
+            self.handles[(session, name)] = handle
+        self.enforce(keep=handle)
+        return handle
+
+    def enforce(self, keep=None):
+        """Spill least recently used handles until every session and the process are within limits.
+
+        `keep` (the handle just registered or read) is spilled only if the
+        others are not enough, e.g. a single frame larger than the session limit.
+        """
+        with self.lock:
+            live = sorted((h for h in list(self.handles.values()) if h.frames and h is not keep), key=lambda h: h.last_used)
+            by_session = {}
+            for handle in self.handles.values():
+                by_session[handle.session] = by_session.get(handle.session, 0) + handle.memory_bytes
+            for handle in live:
+                if by_session[handle.session] > self.session_limit:
+                    by_session[handle.session] -= handle.memory_bytes
+                    handle.spill()
+            total = sum(by_session.values())
+            for handle in live:
+                if total <= self.process_limit:
+                    break
+                if handle.frames:
+                    total -= handle.memory_bytes
+                    by_session[handle.session] -= handle.memory_bytes
+                    handle.spill()
+            # The kept handle goes last, and only when it is over a limit by itself
+            if keep is not None and keep.frames and (by_session.get(keep.session, 0) > self.session_limit or
+                                                     total > self.process_limit):
+                keep.spill()
+
+    def footprint(self):
+        """One row per session: bytes in memory and on disk, handles and seconds since last use"""
+        now = time.monotonic()
+        with self.lock:
+            rows = {}
+            for (session, _), handle in list(self.handles.items()):
+                row = rows.setdefault(session, {'memory_bytes': 0, 'spilled_bytes': 0, 'handles': 0, 'idle_seconds': float('inf')})
+                row['memory_bytes'] += handle.memory_bytes
+                row['spilled_bytes'] += handle.spilled_bytes
+                row['handles'] += 1
+                row['idle_seconds'] = min(row['idle_seconds'], now - handle.last_used)
+        footprint = pd.DataFrame.from_dict(rows, orient='index', columns=['memory_bytes', 'spilled_bytes', 'handles', 'idle_seconds'])
+        return footprint.rename_axis('session').sort_values('memory_bytes', ascending=False)
+
+def _spill_root():
+    os.makedirs(SPILL_ROOT, exist_ok=True)
+    return SPILL_ROOT
@@ -0,0 +1,55 @@
+"""Operational days: which day's work each action belongs to, from a per-store shift calendar.
+
+Store files carry calendar dates, so a night shift running past midnight is
+split over two days. A ShiftCalendar moves every action that starts before
+the store's day cutoff to the previous day. The cutoff is given directly,
+or taken from the overnight shifts: the latest end among shifts that wrap
+past midnight. Nothing in here touches Streamlit; the page and the API read
+calendars from a `shifts` settings table:
+
+    [shifts.IAN]
+    shifts = [{name = "Morning", start = "06:00", end = "14:00"}, {name = "Night", start = "22:00", end = "06:00"}]
+
+    [shifts.IPP]
+    day_cutoff = "04:30"
+"""
+import pandas as pd
+
+ONE_DAY = pd.Timedelta(days=1)
+
+def parse_time_of_day(value):
+    """'HH:MM' or 'HH:MM:SS' as a Timedelta since midnight"""
+    offset = pd.to_timedelta(value if str(value).count(':') == 2 else f"{value}:00")
+    if not pd.Timedelta(0) <= offset < ONE_DAY:
+        raise ValueError(f"Time of day out of range: {value}")
+    return offset
+
+class ShiftCalendar:
+    """Shifts of one store and the time of day its operational day starts"""
+    def __init__(self, shifts=(), day_cutoff=None):
+        self.shifts = [
+            {'name': shift.get('name', ''), 'start': parse_time_of_day(shift['start']), 'end': parse_time_of_day(shift['end'])}
+            for shift in shifts
+        ]
+        overnight_ends = [shift['end'] for shift in self.shifts if shift['end'] <= shift['start']]
+        self.day_cutoff = parse_time_of_day(day_cutoff) if day_cutoff is not None else max(overnight_ends, default=pd.Timedelta(0))
+
+    @property
+    def key(self):
+        """Names the caches built with this calendar; empty when days are plain calendar days"""
+        return f"cutoff{int(self.day_cutoff.total_seconds())}" if self.day_cutoff else ""
+
+    def operational_dates(self, starts, dates):
+        """Operational day of each action from its start; actions without a start keep their date"""
+        return (starts - self.day_cutoff).dt.normalize().fillna(dates)
+
+    def current_day(self, now=None):
+        """The operational day running at `now` (default: the current time)"""
+        return ((now or pd.Timestamp.now()) - self.day_cutoff).normalize()
+
+def calendars_from_settings(settings):
+    """Store name -> ShiftCalendar from the `shifts` table of app settings (st.secrets or parsed TOML)"""
+    return {
+        store: ShiftCalendar(config.get('shifts', ()), config.get('day_cutoff'))
+        for store, config in (settings.get('shifts') or {}).items()
+    }
@@ -0,0 +1,219 @@
+"""Where store files come from, and loading them through the shared on-disk caches.
+
+A source lists store files as dicts with 'name' and 'download_url' (the file
+id used everywhere else) and fetches their bytes. Nothing in here touches
+Streamlit: the page wraps these calls in st.cache_data, the HTTP API in its
+own caches, and both share the decoded Arrow IPC copies on local disk.
+"""
+import contextlib
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import pandas as pd
+import requests
+from wms_engine import (
+    compact_frame, read_normalized_frame, read_store_frame, unique_actions, write_ipc_partitions, read_ipc_partitions
+)
+from wms_validation import drop_invalid, summarize_flags, validate_lines
+
+# Local working folder for staged files and decoded caches, shared by every process on the host
+CACHE_ROOT = os.path.join(tempfile.gettempdir(), "wms_report")
+# Bumped whenever the partition layout changes, so stale caches are never read (and get pruned)
+IPC_LAYOUT = "v4"
+# File versions whose decoded copies are kept per store: the latest and the one
+# before, which sessions that loaded it may still be reading
+CACHE_VERSIONS_KEPT = 2
+
+def group_store_files(files):
+    """List each normalized pair once.
+
+    Normalized stores come as STORE.lines.parquet + STORE.actions.parquet; the
+    pair is listed as STORE.parquet, keyed by the lines file and carrying the
+    actions file's URL.
+    """
+    files = [f for f in files if f['name'].endswith('.parquet')]
+    if not files:
+        raise Exception("No Parquet files found in the folder")
+
+    actions_files = {f['name'][:-len('.actions.parquet')]: f for f in files if f['name'].endswith('.actions.parquet')}
+    stores = []
+    for f in files:
+        if f['name'].endswith('.actions.parquet'):
+            continue
+        if f['name'].endswith('.lines.parquet'):
+            store = f['name'][:-len('.lines.parquet')]
+            if store not in actions_files:
+                raise Exception(f"Missing {store}.actions.parquet for {f['name']}")
+            f = dict(f, name=store + '.parquet', actions_url=actions_files[store]['download_url'])
+        stores.append(f)
+    return stores
+
+class GitHubSource:
+    """Store files in a folder of a GitHub repository"""
+    def __init__(self, token, repo, folder):
+        self.headers = {"Authorization": f"token {token}"}
+        self.url = f"https://api.github.com/repos/{repo}/contents/{folder}"
+
+    def list_files(self):
+        response = requests.get(self.url, headers=self.headers)
+        if response.status_code != 200:
+            raise Exception(f"Failed to list files: {response.json().get('message', 'Unknown error')}")
+        return group_store_files(response.json())
+
+    def fetch(self, download_url):
+        response = requests.get(download_url, headers=self.headers)
+        if response.status_code != 200:
+            raise Exception(f"Failed to download file: {response.status_code}")
+        return response.content
+
+    def fetch_changed(self, download_url, tag=None):
+        """(bytes, tag) if the file changed since `tag` (its ETag), else (None, tag)"""
+        headers = dict(self.headers, **({"If-None-Match": tag} if tag else {}))
+        response = requests.get(download_url, headers=headers)
+        if response.status_code == 304:
+            return None, tag
+        if response.status_code != 200:
+            raise Exception(f"Failed to download file: {response.status_code}")
+        return response.content, response.headers.get("ETag")
+
+class LocalSource:
+    """Store files in a local folder; the file path is the download URL"""
+    def __init__(self, folder):
+        self.folder = folder
+
+    def list_files(self):
+        return group_store_files([
+            {'name': name, 'download_url': os.path.join(self.folder, name)}
+            for name in sorted(os.listdir(self.folder))
+        ])
+
+    def fetch(self, download_url):
+        with open(download_url, "rb") as f:
+            return f.read()
+
+    def fetch_changed(self, download_url, tag=None):
+        """(bytes, tag) if the file changed since `tag` (its mtime and size), else (None, tag)"""
+        stat = os.stat(download_url)
+        new_tag = f"{stat.st_mtime_ns}-{stat.st_size}"
+        if new_tag == tag:
+            return None, tag
+        return self.fetch(download_url), new_tag
+
+def source_from_settings(settings):
+    """Build the source named by app settings (st.secrets or a parsed secrets.toml)"""
+    if settings.get("data_folder"):
+        return LocalSource(settings["data_folder"])
+    return GitHubSource(settings["github_token"], settings["github_repo"], settings["github_folder"])
+
+def store_digest(fetch, entry):
+    """Content hash of a store's file(s), naming its on-disk copies"""
+    digest = hashlib.sha1(fetch(entry['download_url']))
+    if entry.get('actions_url') is not None:
+        digest.update(fetch(entry['actions_url']))
+    return digest.hexdigest()
+
+def decode_store_tables(fetch, entry):
+    """Decode a whole store: its line items and their unique actions.
+
+    Normalized stores are joined back from their tables; single-file stores
+    get their actions from one groupby.
+    """
+    if entry.get('actions_url') is not None:
+        return read_normalized_frame(io.BytesIO(fetch(entry['download_url'])), io.BytesIO(fetch(entry['actions_url'])))
+    df = read_store_frame(io.BytesIO(fetch(entry['download_url'])))
+    return df, unique_actions(df)
+
+def apply_calendar(df, actions, calendar):
+    """Move line items and actions to their operational days, in place (see wms_shifts)"""
+    for frame in (df, actions):
+        frame['Date'] = calendar.operational_dates(frame['Action start'], frame['Date'])
+    return df, actions
+
+def store_cache_dir(kind, entry):
+    """Folder of one store's on-disk copies: 'ipc' partitions or 'staged' files, named by content digest"""
+    store = entry['name'].replace('.parquet', '')
+    return os.path.join(CACHE_ROOT, kind, IPC_LAYOUT, store) if kind == "ipc" else os.path.join(CACHE_ROOT, kind, store)
+
+def prune_store_cache(store_dir, keep=CACHE_VERSIONS_KEPT):
+    """Delete the copies of all but the `keep` most recently used file versions in a store's cache folder.
+
+    Copies are named '<digest>[-<calendar key>][.valid][.parquet]' and every
+    copy of a kept version stays; copies still being built are left alone.
+    """
+    last_used = {}
+    for item in os.scandir(store_dir):
+        digest = item.name.split('-')[0].split('.')[0]
+        if len(digest) == 40 and not item.name.endswith('.tmp'):
+            last_used[digest] = max(last_used.get(digest, 0), item.stat().st_mtime)
+    stale = set(sorted(last_used, key=last_used.get, reverse=True)[keep:])
+    for item in os.scandir(store_dir):
+        if item.name.split('-')[0].split('.')[0] in stale:
+            _remove(item)
+
+def prune_stale_layouts():
+    """Delete IPC caches of other layouts and staged files of the old flat layout"""
+    ipc_root = os.path.join(CACHE_ROOT, "ipc")
+    for item in os.scandir(ipc_root) if os.path.isdir(ipc_root) else ():
+        if item.name != IPC_LAYOUT:
+            _remove(item)
+    for item in os.scandir(CACHE_ROOT):
+        if item.is_file() and item.name.endswith('.parquet'):
+            _remove(item)
+
+def _remove(item):
+    # Another process may be pruning the same copy; readers that have it memory-mapped keep their view
+    if item.is_dir():
+        shutil.rmtree(item.path, ignore_errors=True)
+    else:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(item.path)
+
+def _ipc_cache(fetch, entry, digest=None, calendar=None):
+    """Folder of the store's decoded partitions, built (bucketed, validated and compacted) on first use.
+
+    Building a new one prunes the store's older file versions and other layouts.
+    """
+    name = digest or store_digest(fetch, entry)
+    if calendar is not None and calendar.key:
+        name += f"-{calendar.key}"
+    store_dir = store_cache_dir("ipc", entry)
+    cache_dir = os.path.join(store_dir, name)
+    if os.path.isdir(cache_dir):
+        # The folder's time marks its last use, which decides what pruning keeps
+        os.utime(cache_dir)
+    else:
+        df, actions = decode_store_tables(fetch, entry)
+        if calendar is not None and calendar.key:
+            # Partitions are written per operational day, so bucketing never runs again for this file
+            apply_calendar(df, actions, calendar)
+        # Compact dtypes are stored as such, so every later load comes back compact
+        write_ipc_partitions(compact_frame(df.assign(_invalid=validate_lines(df))), compact_frame(actions), cache_dir)
+        prune_store_cache(store_dir)
+        prune_stale_layouts()
+    return cache_dir
+
+def _read_flagged(cache_dir, selected_dates):
+    df, actions = read_ipc_partitions(cache_dir, selected_dates)
+    flags = df.pop('_invalid') if '_invalid' in df else pd.Series(dtype='uint8')
+    return df, actions, flags
+
+def load_store_tables(fetch, entry, selected_dates=None, digest=None, quarantine=False, calendar=None):
+    """Line items (optionally filtered to the selected dates) and their unique actions.
+
+    A store is decoded once per file version into per-date Arrow IPC files on
+    local disk; later loads (other dates, sessions, processes or restarts)
+    memory-map just the dates they need. With `quarantine`, lines failing a
+    data-quality rule are left out. With a shift `calendar`, dates are the
+    store's operational days.
+    """
+    df, actions, flags = _read_flagged(_ipc_cache(fetch, entry, digest, calendar), selected_dates)
+    if quarantine:
+        return drop_invalid(df, actions, flags)
+    return df, actions
+
+def load_validation_summary(fetch, entry, digest=None, calendar=None):
+    """Per-date data-quality counts of a whole store (see wms_validation.summarize_flags)"""
+    df, _, flags = _read_flagged(_ipc_cache(fetch, entry, digest, calendar), None)
+    return summarize_flags(df['Date'], flags)
@@ -0,0 +1,184 @@
+"""Streaming aggregation: report computations over parquet record batches.
+
+Line items are read with ParquetFile.iter_batches (only the needed columns,
+only the row groups whose 'Date' statistics can hold a selected date, and
+filtered in Arrow before decoding) and folded into mergeable per-date
+partial aggregates, so peak memory follows the batch size and the number of
+distinct cells, documents and actions rather than the number of lines in
+the file.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from bisect import bisect_left
+from datetime import timedelta
+from wms_engine import (
+    CUBE_KEYS, add_weight_columns, arrow_to_frame, calculate_total_time_no_overlap, check_store_schema,
+    daily_intervals, daily_store_stats, prefix_rollups, repeated_documents, seconds_into_day
+)
+
+STREAM_COLUMNS = [
+    'Date', 'Action Code', 'Action start', 'Action completion', 'Cost Center', 'Name',
+    'Document', 'Code', 'Unit', 'Reporting Unit', 'Quantity', 'Relationship'
+]
+BATCH_SIZE = 65536
+
+LINE_KEYS = ['Property'] + CUBE_KEYS
+DOCUMENT_KEYS = ['Property', 'Date', 'Cost Center', 'Document']
+ACTION_KEYS = ['Property', 'Action Code']
+
+def _key_tuples(frame, keys):
+    return list(zip(*(frame[key].tolist() for key in keys)))
+
+class PartialAggregate:
+    """Mergeable per-date partial aggregates of line items, keyed by 'Property'.
+
+    lines:     requests / Kg / Liters / picking_seconds per Property x Date x Cost Center x Name
+    finish:    last completion per Property x Date
+    intervals: per-date union of action intervals (daily_intervals by Property)
+    documents: frames of the Name of the first line of each new (Property, Date, Cost Center, Document)
+
+    document_keys and action_keys hold the keys already counted, so a
+    document or action whose lines span batches counts once. Partials must
+    be merged in file order so "first" keeps its meaning.
+    """
+    def __init__(self):
+        self.lines = None
+        self.finish = None
+        self.intervals = None
+        self.documents = []
+        self.document_keys = set()
+        self.action_keys = set()
+
+    def update(self, batch_df):
+        """Fold a batch of line items (with a 'Property' column) into the aggregate"""
+        add_weight_columns(batch_df)
+        documents = batch_df.drop_duplicates(DOCUMENT_KEYS)
+        document_keys = _key_tuples(documents, DOCUMENT_KEYS)
+        documents = documents[np.array([key not in self.document_keys for key in document_keys], dtype=bool)]
+        actions = batch_df.drop_duplicates(ACTION_KEYS)
+        action_keys = _key_tuples(actions, ACTION_KEYS)
+        actions = actions[np.array([key not in self.action_keys for key in action_keys], dtype=bool)]
+
+        part = PartialAggregate()
+        part.lines = batch_df.groupby(LINE_KEYS).agg(
+            requests=('Code', 'count'),
+            Kg=('Kg', 'sum'),
+            Liters=('Liters', 'sum')
+        )
+        picking_seconds = (actions['Action completion'] - actions['Action start']).dt.total_seconds()
+        part.lines['picking_seconds'] = picking_seconds.groupby([actions[key] for key in LINE_KEYS]).sum()
+        part.lines = part.lines.fillna({'picking_seconds': 0.0})
+        part.finish = actions.groupby(['Property', 'Date'])['Action completion'].max()
+        part.intervals = daily_intervals(actions, by='Property')
+        part.documents = [documents[DOCUMENT_KEYS + ['Name']]]
+        part.document_keys = set(document_keys)
+        part.action_keys = set(action_keys)
+        return self.merge(part)
+
+    def merge(self, other):
+        """Combine with a partial over later line items whose documents and actions are not counted here yet"""
+        if other.lines is None:
+            return self
+        if self.lines is None:
+            self.lines, self.finish, self.intervals = other.lines, other.finish, other.intervals
+            self.documents, self.document_keys, self.action_keys = other.documents, other.document_keys, other.action_keys
+            return self
+        self.lines = pd.concat([self.lines, other.lines]).groupby(level=LINE_KEYS).sum()
+        self.finish = pd.concat([self.finish, other.finish]).groupby(level=['Property', 'Date']).max()
+        self.intervals = daily_intervals(pd.concat([self.intervals, other.intervals], ignore_index=True), by='Property')
+        self.documents = self.documents + other.documents
+        self.document_keys |= other.document_keys
+        self.action_keys |= other.action_keys
+        return self
+
+    def daily_rollups(self, day_cutoff=None):
+        """Same result as build_daily_rollups over the aggregated lines"""
+        cube = self.lines.droplevel('Property')
+        documents = pd.concat(self.documents, ignore_index=True)[['Date', 'Cost Center', 'Name', 'Document']]
+        cube['orders'] = documents.groupby(CUBE_KEYS).size()
+        cube = cube.reset_index().fillna({'orders': 0})
+        store = daily_store_stats(self.finish.droplevel('Property').reset_index(), day_cutoff)
+        return prefix_rollups(cube, store, repeated_documents(documents), self.intervals.drop(columns='Property'))
+
+    def property_summaries(self, num_dates, day_cutoffs=None):
+        """Same result as summarize_properties over the aggregated lines"""
+        by_property = self.lines.groupby(level='Property')
+        # The union of every date's runs is the union of the actions themselves
+        picking_times = calculate_total_time_no_overlap(self.intervals, by='Property')
+        if num_dates > 1:
+            finish_times = seconds_into_day(self.finish, day_cutoffs)
+            avg_seconds = finish_times.groupby(level='Property').mean()
+            picking_finish = pd.Timestamp("2000-01-01") + pd.to_timedelta(avg_seconds.astype(int), unit='s')
+        else:
+            picking_finish = self.finish.groupby(level='Property').max()
+
+        documents = pd.concat(self.documents, ignore_index=True)
+        totals = pd.DataFrame({
+            'orders': documents.groupby('Property')['Document'].nunique(),
+            'requests': by_property['requests'].sum(),
+            'weight': by_property['Kg'].sum() + by_property['Liters'].sum()
+        })
+        return {
+            prop_name: {
+                'picking_time': picking_times[prop_name].to_pytimedelta() if prop_name in picking_times else timedelta(0),
+                'picking_finish': picking_finish[prop_name],
+                'orders': int(row['orders']),
+                'requests': int(row['requests']),
+                'weight': row['weight']
+            }
+            for prop_name, row in totals.iterrows()
+        }
+
+def _date_row_groups(parquet_file, days):
+    """Row groups whose 'Date' statistics can hold one of the sorted `days` (every group without statistics)"""
+    metadata = parquet_file.metadata
+    column = metadata.schema.names.index('Date')
+    kept = []
+    for index in range(metadata.num_row_groups):
+        stats = metadata.row_group(index).column(column).statistics
+        if stats is not None and stats.has_min_max:
+            first = bisect_left(days, pd.Timestamp(stats.min))
+            if first == len(days) or days[first] > pd.Timestamp(stats.max):
+                continue
+        kept.append(index)
+    return kept
+
+def iter_store_batches(path, selected_dates=None, prop_name='', batch_size=BATCH_SIZE):
+    """Yield line-item frames of a local parquet file, one record batch at a time"""
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    check_store_schema(parquet_file.schema_arrow)
+    row_groups, date_values = None, None
+    if selected_dates is not None:
+        days = sorted(pd.Timestamp(day) for day in selected_dates)
+        row_groups = _date_row_groups(parquet_file, days)
+        if not row_groups:
+            return
+        date_type = parquet_file.schema_arrow.field('Date').type
+        date_values = pa.array([day.date() for day in days], pa.date32()).cast(date_type)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, row_groups=row_groups, columns=STREAM_COLUMNS):
+        if date_values is not None:
+            batch = batch.filter(pc.is_in(batch['Date'], value_set=date_values))
+        if batch.num_rows:
+            yield arrow_to_frame(batch).assign(Property=prop_name)
+
+def aggregate_store_file(path, selected_dates=None, prop_name='', batch_size=BATCH_SIZE):
+    """Fold one store file into a PartialAggregate batch by batch"""
+    aggregate = PartialAggregate()
+    for df in iter_store_batches(path, selected_dates, prop_name, batch_size):
+        aggregate.update(df)
+    return aggregate
+
+def stream_daily_rollups(path, day_cutoff=None, batch_size=BATCH_SIZE):
+    """Streaming counterpart of build_daily_rollups for one store file"""
+    return aggregate_store_file(path, batch_size=batch_size).daily_rollups(day_cutoff)
+
+def stream_property_summaries(sources, selected_dates, day_cutoffs=None, batch_size=BATCH_SIZE):
+    """Streaming counterpart of summarize_properties; `sources` maps property to parquet path"""
+    aggregate = PartialAggregate()
+    for prop_name, path in sources.items():
+        aggregate.merge(aggregate_store_file(path, selected_dates, prop_name, batch_size))
+    summaries = aggregate.property_summaries(len(selected_dates), day_cutoffs) if aggregate.lines is not None else {}
+    return {prop_name: summaries[prop_name] for prop_name in sources if prop_name in summaries}
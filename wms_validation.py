@@ -0,0 +1,58 @@
+"""Data-quality rules for store line items, evaluated column-wise once per file version.
+
+Each line gets a bitmask of the rules it fails (0 = valid). The mask is
+computed when a store is decoded into the Arrow IPC cache and stored with
+its lines, so every later load can count or drop invalid rows for free.
+"""
+import numpy as np
+import pandas as pd
+from wms_engine import LINE_COLUMNS
+
+# Actions running longer than this are treated as clock or scanning errors
+MAX_ACTION_DURATION = pd.Timedelta(hours=12)
+
+# Rule name -> label shown in the data-quality panel; the order fixes each rule's bit
+RULES = {
+    'completion_before_start': 'Completion before start',
+    'zero_duration': 'Zero duration',
+    'long_duration': f'Longer than {MAX_ACTION_DURATION.total_seconds() / 3600:g} h',
+    'missing_relationship': 'Missing Relationship',
+    'duplicate_line': 'Duplicate line'
+}
+RULE_BITS = {name: np.uint8(1 << i) for i, name in enumerate(RULES)}
+
+# Action-level columns are constant per Action Code and Description follows Code,
+# so these decide whether two lines are identical
+DUPLICATE_KEYS = [column for column in LINE_COLUMNS if column != 'Description']
+
+def validate_lines(df):
+    """Bitmask (uint8 array aligned with `df`) of the rules each line item fails"""
+    duration = df['Action completion'] - df['Action start']
+    unit = df['Unit'].str.upper()
+    reporting_unit = df['Reporting Unit'].str.upper()
+    # Lines weighed through their reporting unit need a positive conversion factor
+    converted = ~unit.isin(['KILOGRAM', 'LITER']) & reporting_unit.isin(['KILOGRAM', 'LITER'])
+    failed = {
+        'completion_before_start': duration < pd.Timedelta(0),
+        'zero_duration': duration == pd.Timedelta(0),
+        'long_duration': duration > MAX_ACTION_DURATION,
+        'missing_relationship': converted & ~(df['Relationship'] > 0),
+        'duplicate_line': df.duplicated(DUPLICATE_KEYS, keep='first')
+    }
+    flags = np.zeros(len(df), dtype='uint8')
+    for name, mask in failed.items():
+        flags[mask.to_numpy(dtype=bool)] |= RULE_BITS[name]
+    return flags
+
+def summarize_flags(dates, flags):
+    """Per-date line counts: total, invalid, and failing each rule (labelled columns)"""
+    flags = np.asarray(flags)
+    counts = pd.DataFrame({label: (flags & RULE_BITS[name]) > 0 for name, label in RULES.items()})
+    counts.insert(0, 'Invalid', flags > 0)
+    counts.insert(0, 'Lines', True)
+    return counts.groupby(pd.Series(np.asarray(dates), name='Date')).sum()
+
+def drop_invalid(df, actions, flags):
+    """Quarantine: keep the valid lines and the actions that still have some"""
+    df = df[np.asarray(flags) == 0]
+    return df, actions[actions['Action Code'].isin(df['Action Code'])]